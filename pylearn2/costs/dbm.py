@@ -400,6 +400,111 @@ class PCD(DefaultDataSpecsMixin, BaseCD):
         return neg_phase_grads, updates
 
 
+class PooledPCD(PCD):
+
+    """
+    PCD whose negative phase uses a `ChainPool`: a large pool of
+    persistent chains, of which only some are advanced at each update,
+    optionally with parallel tempering. The mixing diagnostics of the
+    pool are added to the monitoring channels.
+
+    The pool is stored in the `chain_pool` attribute of the model, so
+    the chains are saved with it.
+
+    Parameters
+    ----------
+    num_chains : int
+        The number of chains in the pool.
+    num_gibbs_steps : int
+        The number of Gibbs steps applied to the active chains at each
+        update.
+    num_active : int, optional
+        The number of chains advanced at each update, and used for the
+        negative phase. Defaults to `num_chains`.
+    inverse_temperatures : list, optional
+        The inverse temperatures used for parallel tempering, starting
+        with 1 and decreasing. By default, there is no tempering.
+    supervised : bool, optional
+        See `BaseCD`.
+    toronto_neg : bool, optional
+        See `BaseCD`.
+    theano_rng : MRG_RandomStreams, optional
+        See `BaseCD`. The pool has its own random number generators.
+    """
+
+    def __init__(self, num_chains, num_gibbs_steps, num_active=None,
+                 inverse_temperatures=None, supervised=False,
+                 toronto_neg=False, theano_rng=None):
+        super(PooledPCD, self).__init__(num_chains, num_gibbs_steps,
+                                        supervised=supervised,
+                                        toronto_neg=toronto_neg,
+                                        theano_rng=theano_rng)
+        self.num_active = num_active
+        self.inverse_temperatures = inverse_temperatures
+
+    def _get_chain_pool(self, model):
+        """
+        Returns the chain pool of the model, making it if the model has
+        none or if its pool does not have the requested configuration.
+
+        Parameters
+        ----------
+        model : DBM
+            The model.
+
+        Returns
+        -------
+        pool : ChainPool
+            The chain pool.
+        """
+        num_active = self.num_active
+        if num_active is None:
+            num_active = self.num_chains
+        inverse_temperatures = self.inverse_temperatures
+        if inverse_temperatures is None:
+            inverse_temperatures = [1.]
+        requested = (self.num_chains, num_active, self.num_gibbs_steps,
+                     [float(beta) for beta in inverse_temperatures])
+
+        pool = getattr(model, 'chain_pool', None)
+        if pool is None or (pool.num_chains, pool.num_active,
+                            pool.num_gibbs_steps,
+                            pool.inverse_temperatures) != requested:
+            pool = dbm.ChainPool(model, self.num_chains,
+                                 num_active=num_active,
+                                 num_gibbs_steps=self.num_gibbs_steps,
+                                 inverse_temperatures=inverse_temperatures)
+            model.chain_pool = pool
+        model.layer_to_chains = pool.layer_to_chains[0]
+        return pool
+
+    @wraps(Cost.get_monitoring_channels)
+    def get_monitoring_channels(self, model, data):
+        rval = super(PooledPCD, self).get_monitoring_channels(model, data)
+        rval.update(self._get_chain_pool(model).get_monitoring_channels())
+        return rval
+
+    def _get_negative_phase(self, model, X, Y=None):
+        """
+        Computes the negative phase from the active chains of the pool.
+
+        Returns
+        -------
+        gradients : OrderedDict
+            A dictionary mapping parameters to negative phase gradients.
+        updates : OrderedDict
+            The updates of the chain pool.
+        """
+        updates, layer_to_chains = self._get_chain_pool(model).get_updates()
+
+        if self.toronto_neg:
+            neg_phase_grads = self._get_toronto_neg(model, layer_to_chains)
+        else:
+            neg_phase_grads = self._get_standard_neg(model, layer_to_chains)
+
+        return neg_phase_grads, updates
+
+
 class VariationalPCD(DefaultDataSpecsMixin, BaseCD):
 
     """
@@ -992,11 +992,25 @@ class PCA(object):
     whiten : bool, optional
         If False, whitening (or sphering) will not be performed (default).
         If True, the preprocessed data will have zero mean and unit covariance.
+    algorithm : str, optional
+        Which implementation from `pylearn2.models.pca` fits the PCA:
+        'cov_eig' (`CovEigPCA`, the default), 'randomized'
+        (`RandomizedPCA`, fast when `num_components` is much smaller than
+        the input dimension) or 'incremental' (`IncrementalPCA`, which
+        reads the design matrix one block of `batch_size` examples at a
+        time, so it can be memory-mapped).
+    batch_size : int, optional
+        Block size used by the 'incremental' algorithm.
     """
 
-    def __init__(self, num_components, whiten=False):
+    def __init__(self, num_components, whiten=False, algorithm='cov_eig',
+                 batch_size=1000):
+        if algorithm not in ['cov_eig', 'randomized', 'incremental']:
+            raise ValueError("Unknown PCA algorithm: " + str(algorithm))
         self._num_components = num_components
         self._whiten = whiten
+        self._algorithm = algorithm
+        self._batch_size = batch_size
         self._pca = None
         # TODO: Is storing these really necessary? This computation
         # can't really be merged since we're basically creating the
@@ -1015,8 +1029,20 @@ class PCA(object):
                 raise ValueError("can_fit is False, but PCA preprocessor "
                                  "object has no fitted model stored")
             from pylearn2.models import pca
-            self._pca = pca.CovEigPCA(num_components=self._num_components,
-                                      whiten=self._whiten)
+            algorithm = getattr(self, '_algorithm', 'cov_eig')
+            if algorithm == 'randomized':
+                self._pca = pca.RandomizedPCA(
+                    num_components=self._num_components,
+                    whiten=self._whiten)
+            elif algorithm == 'incremental':
+                self._pca = pca.IncrementalPCA(
+                    num_components=self._num_components,
+                    batch_size=self._batch_size,
+                    whiten=self._whiten)
+            else:
+                self._pca = pca.CovEigPCA(
+                    num_components=self._num_components,
+                    whiten=self._whiten)
             self._pca.train(dataset.get_design_matrix())
             self._transform_func = function([self._input],
                                             self._pca(self._input))
@@ -27,6 +27,58 @@ from pylearn2.utils.iteration import (
 )
 
 
+def take_csr_rows(X, indexes):
+    """
+    Returns rows of a CSR matrix as a CSR matrix, without densifying them.
+
+    A contiguous slice is returned as a view of `X`, sharing its data
+    and indices. Other rows are gathered in one pass through the row
+    pointers of `X`, which is much faster than the fancy indexing of
+    some scipy versions.
+
+    Parameters
+    ----------
+    X : scipy.sparse.csr_matrix
+        The matrix.
+    indexes : slice or list
+        The rows to take. Negative indexes count from the last row.
+
+    Returns
+    -------
+    rows : scipy.sparse.csr_matrix
+        The rows, in the order of `indexes`.
+    """
+    if isinstance(indexes, slice):
+        start, stop, step = indexes.indices(X.shape[0])
+        if step == 1:
+            stop = max(start, stop)
+            indptr = X.indptr[start:stop + 1]
+            lo, hi = indptr[0], indptr[-1]
+            return scipy.sparse.csr_matrix(
+                (X.data[lo:hi], X.indices[lo:hi], indptr - lo),
+                shape=(stop - start, X.shape[1]), copy=False)
+        indexes = numpy.arange(start, stop, step)
+    indexes = numpy.asarray(indexes, dtype=X.indptr.dtype)
+    n_rows = X.shape[0]
+    out_of_bounds = (indexes < -n_rows) | (indexes >= n_rows)
+    if out_of_bounds.any():
+        raise IndexError("index %d is out of bounds for a matrix of %d rows"
+                         % (indexes[out_of_bounds][0], n_rows))
+    # Negative indexes count from the end, as in numpy
+    indexes = numpy.where(indexes < 0, indexes + n_rows, indexes)
+
+    starts = X.indptr[indexes]
+    lengths = X.indptr[indexes + 1] - starts
+    indptr = numpy.zeros(len(indexes) + 1, dtype=X.indptr.dtype)
+    numpy.cumsum(lengths, out=indptr[1:])
+    # The position in X of each stored element of the rows
+    positions = numpy.arange(indptr[-1], dtype=X.indptr.dtype)
+    positions += numpy.repeat(starts - indptr[:-1], lengths)
+    return scipy.sparse.csr_matrix(
+        (X.data[positions], X.indices[positions], indptr),
+        shape=(len(indexes), X.shape[1]), copy=False)
+
+
 class SparseDataset(Dataset):
 
     """
@@ -158,6 +210,36 @@ class SparseDataset(Dataset):
                                      return_tuple=return_tuple,
                                      convert=convert)
 
+    def get(self, sources, indexes):
+        """
+        Retrieves the requested rows from the dataset, as sparse matrices.
+
+        Rows of a CSR matrix are taken with `take_csr_rows`, so batches
+        are never densified and contiguous batches are not copied.
+
+        Parameters
+        ----------
+        sources : tuple
+            A tuple of source identifiers, which can only be 'features'.
+        indexes : slice or list
+            A slice or a list of indexes
+
+        Returns
+        -------
+        rval : tuple
+            A tuple of batches, one for each source
+        """
+        rval = []
+        for source in sources:
+            if source != 'features':
+                raise ValueError('The requested source %s is not part of '
+                                 'the dataset' % source)
+            if scipy.sparse.isspmatrix_csr(self.X):
+                rval.append(take_csr_rows(self.X, indexes))
+            else:
+                rval.append(self.X[indexes])
+        return tuple(rval)
+
     def __iter__(self):
         """
         .. todo::
@@ -357,6 +357,21 @@ class testPCA:
         # testing whether the eigenvalues are all ones
         np.testing.assert_almost_equal(np.diag(cm), np.ones(cm.shape[0]))
 
+    def test_apply_whiten_randomized_incremental(self):
+        """
+        Confirms that the randomized and incremental backends whiten the
+        input dataset like the default one
+        """
+        for algorithm in ['randomized', 'incremental']:
+            self.setup()
+            num_components = self.dataset.get_design_matrix().shape[1]
+            sut = PCA(num_components, whiten=True, algorithm=algorithm,
+                      batch_size=4)
+            sut.apply(self.dataset, True)
+            cm = np.cov(self.dataset.get_design_matrix().T)
+            np.testing.assert_almost_equal(cm, np.eye(num_components),
+                                           decimal=3)
+
     def test_apply_reduce_num_components(self):
         """
         Checks whether PCA performs dimensionality reduction
@@ -2,13 +2,14 @@
 Unit tests for ../sparse_dataset.py
 """
 
+from nose.tools import assert_raises
 import numpy as np
-from pylearn2.datasets.sparse_dataset import SparseDataset
+from pylearn2.datasets.sparse_dataset import SparseDataset, take_csr_rows
 from pylearn2.train import Train
 from pylearn2.models.model import Model
 from pylearn2.space import VectorSpace
 from pylearn2.termination_criteria import EpochCounter
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, isspmatrix_csr
 from pylearn2.costs.cost import Cost, DefaultDataSpecsMixin
 from pylearn2.training_algorithms.sgd import SGD
 from pylearn2.utils import sharedX
@@ -105,6 +106,47 @@ def test_iterator():
     it.next()
 
 
+def test_take_csr_rows():
+    """
+    Tests that rows taken from a CSR matrix match the dense rows.
+    """
+    rng = np.random.RandomState([2015, 10, 18])
+    X = rng.binomial(1, .3, (20, 7)) * rng.randn(20, 7)
+    X[3] = 0
+    sparse_X = csr_matrix(X)
+    for indexes in [slice(2, 9), slice(0, 20, 3), slice(15, 10), [4, 3, 3],
+                    rng.permutation(20), [], [-1], [0, -20, -3, 5]]:
+        rows = take_csr_rows(sparse_X, indexes)
+        assert isspmatrix_csr(rows)
+        np.testing.assert_array_equal(rows.toarray(),
+                                      X[indexes].reshape((-1, 7)))
+    for indexes in [[20], [-21], [0, 25]]:
+        assert_raises(IndexError, take_csr_rows, sparse_X, indexes)
+
+
+def test_sparse_iteration():
+    """
+    Tests that sequential and shuffled iteration over a SparseDataset
+    yields sparse batches, which together cover the dataset.
+    """
+    rng = np.random.RandomState([2015, 10, 19])
+    X = (rng.binomial(1, .2, (23, 6)) * rng.randn(23, 6)).astype('float32')
+    dataset = SparseDataset(from_scipy_sparse_dataset=csr_matrix(X))
+    space = VectorSpace(dim=6, sparse=True, dtype='float32')
+    for mode in ['sequential', 'shuffled_sequential']:
+        kwargs = {}
+        if mode == 'shuffled_sequential':
+            kwargs['rng'] = rng
+        it = dataset.iterator(mode=mode, batch_size=5,
+                              data_specs=(space, 'features'), **kwargs)
+        batches = list(it)
+        assert all(isspmatrix_csr(batch) for batch in batches)
+        rows = np.vstack([batch.toarray() for batch in batches])
+        assert rows.shape == X.shape
+        np.testing.assert_array_equal(np.sort(rows, axis=0),
+                                      np.sort(X, axis=0))
+
+
 def test_training_a_model():
     """
     tests wether SparseDataset can be trained
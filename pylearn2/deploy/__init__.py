@@ -0,0 +1,3 @@
+"""
+Tools for serving trained models.
+"""
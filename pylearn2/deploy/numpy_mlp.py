@@ -0,0 +1,849 @@
+"""
+Export of trained MLPs to a forward engine that only needs NumPy.
+
+`export_mlp` walks the layers of a `pylearn2.models.mlp.MLP` and saves
+their parameters and hyperparameters to a single .npz file. `NumpyMLP`
+loads such a file and computes the output of the network with NumPy
+(and thus BLAS) only, reusing preallocated activation buffers across
+calls with the same batch size.
+
+Only the exporter needs pylearn2 and Theano. The engine part of this
+module imports nothing but NumPy, so short-lived workers can load a model
+without compiling anything, and this file can be copied next to the
+exported model to be used without pylearn2 installed (see `copy_engine`).
+
+Supported layers are `Linear`, `RectifiedLinear`, `Sigmoid`, `Tanh`,
+`Softmax`, `maxout.Maxout` and `ConvElemwise` layers such as
+`ConvRectifiedLinear`, with max pooling or no pooling.
+"""
+__copyright__ = "Copyright 2010-2015, Universite de Montreal"
+__license__ = "3-clause BSD"
+__maintainer__ = "LISA Lab"
+__email__ = "pylearn-dev@googlegroups"
+
+import json
+import os
+import shutil
+from functools import wraps
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+
+FORMAT_VERSION = 1
+
+# Number of weights dequantized at once by `_dot`, small enough for the
+# float copy to stay in cache
+_DEQUANTIZED_BLOCK_SIZE = 1 << 18
+
+_DEFAULT_AXES = ('b', 0, 1, 'c')
+_CONV_AXES = ('b', 'c', 0, 1)
+
+
+def _parse_axes(axes):
+    """
+    Converts axes read from JSON back to the pylearn2 convention.
+
+    Parameters
+    ----------
+    axes : list or None
+        Axes such as ['b', 'c', 0, 1].
+
+    Returns
+    -------
+    axes : tuple or None
+        The same axes, as a tuple.
+    """
+    if axes is None:
+        return None
+    return tuple(axes)
+
+
+def _flatten(X, axes):
+    """
+    Flattens a topological batch the way `Conv2DSpace` formats it as a
+    `VectorSpace`.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        A batch with 2 or 4 dimensions.
+    axes : tuple or None
+        The axes of `X` if it is topological.
+
+    Returns
+    -------
+    X : numpy.ndarray
+        A design matrix.
+    """
+    if X.ndim == 2:
+        return X
+    if axes != _DEFAULT_AXES:
+        X = X.transpose(*[axes.index(axis) for axis in _DEFAULT_AXES])
+    return X.reshape((X.shape[0], -1))
+
+
+def _apply_nonlinearity(Z, nonlinearity, left_slope=0.):
+    """
+    Applies a nonlinearity to `Z` in place.
+
+    Parameters
+    ----------
+    Z : numpy.ndarray
+        The linear response.
+    nonlinearity : str
+        One of 'linear', 'rectifier', 'sigmoid', 'tanh' or 'softmax'.
+    left_slope : float, optional
+        The slope of the rectifier left of 0.
+    """
+    if nonlinearity == 'linear':
+        pass
+    elif nonlinearity == 'rectifier':
+        if left_slope == 0.:
+            np.maximum(Z, 0., out=Z)
+        else:
+            Z -= (1. - left_slope) * np.minimum(Z, 0.)
+    elif nonlinearity == 'sigmoid':
+        np.negative(Z, out=Z)
+        with np.errstate(over='ignore'):
+            np.exp(Z, out=Z)
+        Z += 1.
+        np.reciprocal(Z, out=Z)
+    elif nonlinearity == 'tanh':
+        np.tanh(Z, out=Z)
+    elif nonlinearity == 'softmax':
+        Z -= Z.max(axis=1)[:, np.newaxis]
+        np.exp(Z, out=Z)
+        Z /= Z.sum(axis=1)[:, np.newaxis]
+    else:
+        raise ValueError("Unknown nonlinearity: " + str(nonlinearity))
+
+
+def _dot(X, W, out, buffers, W_scale=None):
+    """
+    Computes `numpy.dot(X, W)` into `out`.
+
+    If `W` is quantized, its rows are converted back to floats a block at
+    a time, so only the int8 matrix is read from memory.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        A design matrix.
+    W : numpy.ndarray
+        A weight matrix, possibly of int8 values.
+    out : numpy.ndarray
+        The buffer the product is written to.
+    buffers : dict
+        Scratch buffers of the layer.
+    W_scale : numpy.ndarray, optional
+        The scale of each column of `W` if it is quantized.
+    """
+    if W_scale is None:
+        if out.flags.c_contiguous:
+            np.dot(X, W, out=out)
+        else:
+            out[...] = np.dot(X, W)
+        return
+
+    block_size = max(1, _DEQUANTIZED_BLOCK_SIZE // W.shape[1])
+    if 'W_block' not in buffers:
+        buffers['W_block'] = np.empty((min(block_size, W.shape[0]),
+                                       W.shape[1]), dtype=out.dtype)
+        buffers['partial'] = np.empty(out.shape, dtype=out.dtype)
+    partial = buffers['partial']
+    for start in range(0, W.shape[0], block_size):
+        stop = min(start + block_size, W.shape[0])
+        W_block = buffers['W_block'][:stop - start]
+        W_block[...] = W[start:stop]
+        np.dot(X[:, start:stop], W_block, out=partial)
+        if start == 0:
+            out[...] = partial
+        else:
+            out += partial
+    out *= W_scale
+
+
+class NumpyLayer(object):
+    """
+    A layer of a `NumpyMLP`.
+
+    Parameters
+    ----------
+    spec : dict
+        The hyperparameters of the layer, as saved by `export_mlp`.
+    params : dict
+        The parameters of the layer, as numpy arrays.
+    """
+
+    def __init__(self, spec, params):
+        self.spec = spec
+        self.params = params
+
+    def output_shape(self, batch_size):
+        """
+        Returns the shape of the output of the layer.
+
+        Parameters
+        ----------
+        batch_size : int
+            The number of examples.
+
+        Returns
+        -------
+        shape : tuple
+            The shape of the output buffer.
+        """
+        raise NotImplementedError(str(type(self)) + " does not implement "
+                                  "output_shape.")
+
+    def fprop(self, X, out, buffers):
+        """
+        Computes the output of the layer.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            The output of the layer below.
+        out : numpy.ndarray
+            The buffer the output is written to.
+        buffers : dict
+            Scratch buffers for this layer and batch size. The layer may
+            store arrays in it to reuse them on the next call.
+        """
+        raise NotImplementedError(str(type(self)) + " does not implement "
+                                  "fprop.")
+
+
+class NumpyLinear(NumpyLayer):
+    """
+    An affine layer followed by an elementwise nonlinearity, for `Linear`,
+    `RectifiedLinear`, `Sigmoid`, `Tanh` and `Softmax`.
+
+    Parameters
+    ----------
+    spec : dict
+        The hyperparameters of the layer, as saved by `export_mlp`.
+    params : dict
+        The parameters of the layer, as numpy arrays.
+    """
+
+    def __init__(self, spec, params):
+        super(NumpyLinear, self).__init__(spec, params)
+        self.W = params.get('W')
+        self.W_scale = params.get('W_scale')
+        self.b = params.get('b')
+        self.input_axes = _parse_axes(spec['input_axes'])
+        self.non_redundant = spec.get('non_redundant', False)
+
+    @wraps(NumpyLayer.output_shape)
+    def output_shape(self, batch_size):
+        return (batch_size, self.spec['dim'])
+
+    @wraps(NumpyLayer.fprop)
+    def fprop(self, X, out, buffers):
+        X = _flatten(X, self.input_axes)
+        Z = out
+        if self.non_redundant:
+            out[:, 0] = 0.
+            Z = out[:, 1:]
+        if self.W is None:
+            Z[...] = X
+        else:
+            _dot(X, self.W, Z, buffers, self.W_scale)
+        if self.b is not None:
+            Z += self.b
+        _apply_nonlinearity(out, self.spec['nonlinearity'],
+                            self.spec.get('left_slope', 0.))
+
+
+class NumpyMaxout(NumpyLayer):
+    """
+    A `maxout.Maxout` layer.
+
+    Parameters
+    ----------
+    spec : dict
+        The hyperparameters of the layer, as saved by `export_mlp`.
+    params : dict
+        The parameters of the layer, as numpy arrays.
+    """
+
+    def __init__(self, spec, params):
+        super(NumpyMaxout, self).__init__(spec, params)
+        self.W = params['W']
+        self.W_scale = params.get('W_scale')
+        self.b = params['b']
+        self.permutation = params.get('permutation')
+        self.input_axes = _parse_axes(spec['input_axes'])
+
+    @wraps(NumpyLayer.output_shape)
+    def output_shape(self, batch_size):
+        return (batch_size, self.spec['num_units'])
+
+    @wraps(NumpyLayer.fprop)
+    def fprop(self, X, out, buffers):
+        X = _flatten(X, self.input_axes)
+        if 'Z' not in buffers:
+            buffers['Z'] = np.empty((X.shape[0], self.W.shape[1]),
+                                    dtype=out.dtype)
+        Z = buffers['Z']
+        _dot(X, self.W, Z, buffers, self.W_scale)
+        Z += self.b
+        if self.permutation is not None:
+            Z = Z[:, self.permutation]
+
+        pool_size = self.spec['pool_size']
+        pool_stride = self.spec['pool_stride']
+        if pool_stride == pool_size:
+            Z = Z.reshape((Z.shape[0], -1, pool_size))
+            Z.max(axis=2, out=out)
+        else:
+            last_start = Z.shape[1] - pool_size
+            out[...] = Z[:, 0:last_start + 1:pool_stride]
+            for i in range(1, pool_size):
+                np.maximum(out, Z[:, i:last_start + i + 1:pool_stride],
+                           out=out)
+        if self.spec['min_zero']:
+            np.maximum(out, 0., out=out)
+
+
+class NumpyConv(NumpyLayer):
+    """
+    A `ConvElemwise` layer, such as `ConvRectifiedLinear`.
+
+    The convolution is computed as a single matrix product between the
+    unrolled input patches and the (flipped) kernels.
+
+    Parameters
+    ----------
+    spec : dict
+        The hyperparameters of the layer, as saved by `export_mlp`.
+    params : dict
+        The parameters of the layer, as numpy arrays.
+    """
+
+    def __init__(self, spec, params):
+        super(NumpyConv, self).__init__(spec, params)
+        W = params['W']
+        self.num_channels = W.shape[0]
+        self.kernel_shape = W.shape[2:]
+        # Theano's conv2d flips the kernels
+        W = W[:, :, ::-1, ::-1]
+        self.W = np.ascontiguousarray(W.reshape((W.shape[0], -1)).T)
+        self.b = params['b']
+        if self.b.ndim == 1:
+            self.b = self.b[:, np.newaxis, np.newaxis]
+        self.input_axes = _parse_axes(spec['input_axes'])
+        self.input_shape = tuple(spec['input_shape'])
+        self.detector_shape = tuple(spec['detector_shape'])
+        self.output_shape_ = tuple(spec['output_shape'])
+        self.kernel_stride = tuple(spec['kernel_stride'])
+        if spec['border_mode'] == 'full':
+            self.padding = (self.kernel_shape[0] - 1,
+                            self.kernel_shape[1] - 1)
+        else:
+            self.padding = (0, 0)
+
+    @wraps(NumpyLayer.output_shape)
+    def output_shape(self, batch_size):
+        return (batch_size, self.num_channels) + self.output_shape_
+
+    def _convolve(self, X, buffers):
+        """
+        Computes the linear response of the layer.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            A batch in ('b', 'c', 0, 1) format.
+        buffers : dict
+            Scratch buffers.
+
+        Returns
+        -------
+        Z : numpy.ndarray
+            The linear response, in ('b', 'c', 0, 1) format.
+        """
+        batch_size, channels = X.shape[:2]
+        pr, pc = self.padding
+        if pr or pc:
+            if 'padded' not in buffers:
+                buffers['padded'] = np.zeros(
+                    (batch_size, channels, X.shape[2] + 2 * pr,
+                     X.shape[3] + 2 * pc), dtype=X.dtype)
+            padded = buffers['padded']
+            padded[:, :, pr:pr + X.shape[2], pc:pc + X.shape[3]] = X
+            X = padded
+        else:
+            X = np.ascontiguousarray(X)
+
+        kr, kc = self.kernel_shape
+        sr, sc = self.kernel_stride
+        dr, dc = self.detector_shape
+        if (dr - 1) * sr + kr > X.shape[2] or (dc - 1) * sc + kc > X.shape[3]:
+            raise ValueError("Input of shape %s is too small for layer %s." %
+                             (str(X.shape), self.spec['layer_name']))
+        strides = X.strides
+        patches = as_strided(X, shape=(batch_size, dr, dc, channels, kr, kc),
+                             strides=(strides[0], strides[2] * sr,
+                                      strides[3] * sc, strides[1],
+                                      strides[2], strides[3]))
+        if 'columns' not in buffers:
+            buffers['columns'] = np.empty(patches.shape, dtype=X.dtype)
+            buffers['Z'] = np.empty((batch_size * dr * dc,
+                                     self.num_channels), dtype=X.dtype)
+            buffers['detector'] = np.empty(
+                (batch_size, self.num_channels, dr, dc), dtype=X.dtype)
+        columns = buffers['columns']
+        columns[...] = patches
+        np.dot(columns.reshape((batch_size * dr * dc, -1)), self.W,
+               out=buffers['Z'])
+        Z = buffers['detector']
+        Z[...] = buffers['Z'].reshape(
+            (batch_size, dr, dc, self.num_channels)).transpose(0, 3, 1, 2)
+        Z += self.b
+        return Z
+
+    def _max_pool(self, Z, out, buffers):
+        """
+        Max pools `Z` the way `pylearn2.models.mlp.max_pool` does.
+
+        Parameters
+        ----------
+        Z : numpy.ndarray
+            The detector layer, in ('b', 'c', 0, 1) format.
+        out : numpy.ndarray
+            The buffer the output is written to.
+        buffers : dict
+            Scratch buffers.
+        """
+        pr, pc = self.spec['pool_shape']
+        rs, cs = self.spec['pool_stride']
+        out_r, out_c = self.output_shape_
+        required_r = (out_r - 1) * rs + pr
+        required_c = (out_c - 1) * cs + pc
+        if required_r > Z.shape[2] or required_c > Z.shape[3]:
+            # Incomplete pools at the border only see the valid inputs
+            if 'pool_padded' not in buffers:
+                buffers['pool_padded'] = np.empty(
+                    Z.shape[:2] + (max(required_r, Z.shape[2]),
+                                   max(required_c, Z.shape[3])),
+                    dtype=Z.dtype)
+                buffers['pool_padded'].fill(-np.inf)
+            padded = buffers['pool_padded']
+            padded[:, :, :Z.shape[2], :Z.shape[3]] = Z
+            Z = padded
+        out[...] = Z[:, :, 0:rs * out_r:rs, 0:cs * out_c:cs]
+        for i in range(pr):
+            for j in range(pc):
+                if i == 0 and j == 0:
+                    continue
+                np.maximum(out, Z[:, :, i:i + rs * out_r:rs,
+                                  j:j + cs * out_c:cs], out=out)
+
+    @wraps(NumpyLayer.fprop)
+    def fprop(self, X, out, buffers):
+        if self.input_axes != _CONV_AXES:
+            X = X.transpose(*[self.input_axes.index(axis)
+                              for axis in _CONV_AXES])
+        Z = self._convolve(X, buffers)
+        _apply_nonlinearity(Z, self.spec['nonlinearity'],
+                            self.spec.get('left_slope', 0.))
+        if self.spec['pool_type'] is None:
+            out[...] = Z
+        else:
+            self._max_pool(Z, out, buffers)
+
+
+_LAYER_TYPES = {'linear': NumpyLinear,
+                'maxout': NumpyMaxout,
+                'conv': NumpyConv}
+
+
+class NumpyMLP(object):
+    """
+    Forward engine for an MLP exported by `export_mlp`.
+
+    The activations of each layer are written to buffers allocated on
+    the first call with a given batch size and reused afterwards, so an
+    engine should not be shared between threads.
+
+    Parameters
+    ----------
+    specs : list
+        The hyperparameters of each layer, as saved by `export_mlp`.
+    params : list
+        The parameters of each layer, as dictionaries of numpy arrays.
+    dtype : str, optional
+        The dtype of the computations. Defaults to the dtype of the
+        parameters.
+    """
+
+    def __init__(self, specs, params, dtype=None):
+        if dtype is None:
+            values = [value for layer_params in params
+                      for value in layer_params.values()
+                      if value.dtype.kind == 'f']
+            dtype = values[0].dtype if values else 'float32'
+        self.dtype = np.dtype(dtype)
+        self.specs = specs
+        self.layers = []
+        for spec, layer_params in zip(specs, params):
+            layer_params = dict(
+                (key, value.astype(self.dtype)
+                 if value.dtype.kind == 'f' else value)
+                for key, value in layer_params.items())
+            self.layers.append(_LAYER_TYPES[spec['type']](spec,
+                                                          layer_params))
+        input_axes = _parse_axes(specs[0]['input_axes'])
+        self._batch_axis = 0 if input_axes is None else input_axes.index('b')
+        self._buffers = {}
+
+    @classmethod
+    def load(cls, path, dtype=None):
+        """
+        Loads a model saved by `export_mlp`.
+
+        Parameters
+        ----------
+        path : str
+            The path of the .npz file.
+        dtype : str, optional
+            The dtype of the computations. Defaults to the dtype of the
+            saved parameters.
+
+        Returns
+        -------
+        model : NumpyMLP
+            The forward engine.
+        """
+        archive = np.load(path)
+        try:
+            header = json.loads(str(archive['header']))
+            if header['version'] > FORMAT_VERSION:
+                raise ValueError("%s was saved with a newer version (%d) of "
+                                 "the format." % (path, header['version']))
+            params = [{} for spec in header['layers']]
+            for key in archive.files:
+                if key == 'header':
+                    continue
+                index, name = key.split('_', 1)
+                params[int(index)][name] = archive[key]
+        finally:
+            archive.close()
+        return cls(header['layers'], params, dtype=dtype)
+
+    def save(self, path):
+        """
+        Saves the model, to be loaded by `NumpyMLP.load`.
+
+        Parameters
+        ----------
+        path : str
+            The path of the .npz file to write.
+        """
+        arrays = {}
+        for i, layer in enumerate(self.layers):
+            for name, value in layer.params.items():
+                arrays['%d_%s' % (i, name)] = value
+        header = {'version': FORMAT_VERSION, 'layers': self.specs}
+        arrays['header'] = np.array(json.dumps(header))
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+
+    def _get_buffers(self, batch_size):
+        """
+        Returns the activation buffers for a batch size.
+
+        Parameters
+        ----------
+        batch_size : int
+            The number of examples.
+
+        Returns
+        -------
+        buffers : list
+            A pair (output, scratch buffers) for each layer.
+        """
+        if batch_size not in self._buffers:
+            self._buffers[batch_size] = [
+                (np.empty(layer.output_shape(batch_size), dtype=self.dtype),
+                 {}) for layer in self.layers]
+        return self._buffers[batch_size]
+
+    def batch_size(self, X):
+        """
+        Returns the number of examples in a batch.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            A batch in the input space of the exported MLP.
+
+        Returns
+        -------
+        batch_size : int
+            The size of its batch axis.
+        """
+        return X.shape[self._batch_axis]
+
+    def clear_buffers(self):
+        """
+        Frees the activation buffers.
+        """
+        self._buffers = {}
+
+    def fprop(self, X, copy=True, return_all=False):
+        """
+        Computes the output of the network.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            A batch in the input space of the exported MLP.
+        copy : bool, optional
+            If False, returns the output buffers of the layers themselves,
+            which are overwritten by the next call with the same batch
+            size.
+        return_all : bool, optional
+            If True, returns the output of every layer.
+
+        Returns
+        -------
+        Y : numpy.ndarray or list
+            The output of the network, or the list of the outputs of its
+            layers.
+        """
+        X = np.asarray(X, dtype=self.dtype)
+        outputs = []
+        for layer, (out, buffers) in zip(self.layers,
+                                         self._get_buffers(
+                                             self.batch_size(X))):
+            layer.fprop(X, out, buffers)
+            X = out
+            outputs.append(out)
+        if not return_all:
+            outputs = outputs[-1:]
+        if copy:
+            outputs = [out.copy() for out in outputs]
+        if return_all:
+            return outputs
+        return outputs[0]
+
+
+def load_numpy_mlp(path, dtype=None):
+    """
+    Loads a model saved by `export_mlp`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the .npz file.
+    dtype : str, optional
+        The dtype of the computations. Defaults to the dtype of the saved
+        parameters.
+
+    Returns
+    -------
+    model : NumpyMLP
+        The forward engine.
+    """
+    return NumpyMLP.load(path, dtype=dtype)
+
+
+def _ints(values):
+    """
+    Converts a sequence of integers to a JSON serializable list.
+
+    Parameters
+    ----------
+    values : iterable
+        Integers, possibly numpy integers.
+
+    Returns
+    -------
+    values : list
+        The same values, as python ints.
+    """
+    return [int(value) for value in values]
+
+
+def _get_axes(space):
+    """
+    Returns the axes of a topological space, or None for a vector space.
+
+    Parameters
+    ----------
+    space : Space
+        The input space of a layer.
+
+    Returns
+    -------
+    axes : list or None
+        The axes of `space`.
+    """
+    from pylearn2.space import Conv2DSpace, VectorSpace
+
+    if isinstance(space, VectorSpace):
+        return None
+    if isinstance(space, Conv2DSpace):
+        return list(space.axes)
+    raise NotImplementedError("Can't export a layer with input space " +
+                              str(space))
+
+
+def _layer_spec(layer):
+    """
+    Extracts the hyperparameters and parameters of a layer.
+
+    Parameters
+    ----------
+    layer : Layer
+        A layer of an MLP.
+
+    Returns
+    -------
+    spec : dict
+        The hyperparameters of the layer.
+    params : dict
+        The parameters of the layer, as numpy arrays.
+    """
+    from pylearn2.models import mlp
+    from pylearn2.models.maxout import Maxout
+
+    values = dict((id(param), value) for param, value in
+                  zip(layer.get_params(), layer.get_param_values()))
+
+    def value_of(param):
+        return values[id(param)]
+
+    nonlinearities = {mlp.Linear: 'linear',
+                      mlp.RectifiedLinear: 'rectifier',
+                      mlp.Sigmoid: 'sigmoid',
+                      mlp.Tanh: 'tanh'}
+    conv_nonlinearities = ['linear', 'rectifier', 'sigmoid', 'tanh']
+
+    # Subclasses may change fprop, so the types must match exactly
+    layer_type = type(layer)
+    if layer_type in nonlinearities:
+        W, = layer.transformer.get_params()
+        params = {'W': value_of(W)}
+        if layer.use_bias:
+            params['b'] = value_of(layer.b)
+        spec = {'type': 'linear',
+                'dim': int(layer.dim),
+                'nonlinearity': nonlinearities[layer_type],
+                'left_slope': float(getattr(layer, 'left_slope', 0.))}
+    elif layer_type is mlp.Softmax:
+        params = {}
+        if not layer.no_affine:
+            params = {'W': value_of(layer.W), 'b': value_of(layer.b)}
+        spec = {'type': 'linear',
+                'dim': int(layer.n_classes),
+                'nonlinearity': 'softmax',
+                'non_redundant': bool(layer.non_redundant)}
+    elif layer_type is Maxout:
+        W, = layer.transformer.get_params()
+        params = {'W': value_of(W), 'b': value_of(layer.b)}
+        if getattr(layer, 'randomize_pools', False):
+            params['permutation'] = layer.permute.get_value().argmax(axis=0)
+        spec = {'type': 'maxout',
+                'num_units': int(layer.output_space.dim),
+                'pool_size': int(layer.pool_size),
+                'pool_stride': int(getattr(layer, 'pool_stride',
+                                           layer.pool_size)),
+                'min_zero': bool(getattr(layer, 'min_zero', False))}
+    elif isinstance(layer, mlp.ConvElemwise):
+        nonlinearity = layer.nonlin.non_lin_name
+        if (layer_type not in (mlp.ConvElemwise, mlp.ConvRectifiedLinear) or
+                nonlinearity not in conv_nonlinearities):
+            raise NotImplementedError("Can't export " + str(layer_type))
+        if getattr(layer, 'pool_type', None) not in (None, 'max'):
+            raise NotImplementedError("Can't export %s pooling." %
+                                      layer.pool_type)
+        if (getattr(layer, 'detector_normalization', None) or
+                getattr(layer, 'output_normalization', None)):
+            raise NotImplementedError("Can't export a layer with "
+                                      "normalization.")
+        W, = layer.transformer.get_params()
+        params = {'W': value_of(W), 'b': value_of(layer.b)}
+        spec = {'type': 'conv',
+                'nonlinearity': nonlinearity,
+                'left_slope': float(getattr(layer.nonlin, 'left_slope', 0.)),
+                'border_mode': layer.border_mode,
+                'kernel_stride': _ints(layer.kernel_stride),
+                'pool_type': layer.pool_type,
+                'input_shape': _ints(layer.input_space.shape),
+                'detector_shape': _ints(layer.detector_space.shape),
+                'output_shape': _ints(layer.output_space.shape)}
+        if layer.pool_type is not None:
+            spec['pool_shape'] = _ints(layer.pool_shape)
+            spec['pool_stride'] = _ints(layer.pool_stride)
+    else:
+        raise NotImplementedError("Can't export " + str(layer_type))
+
+    spec['layer_name'] = layer.layer_name
+    spec['input_axes'] = _get_axes(layer.get_input_space())
+    return spec, params
+
+
+def mlp_to_numpy(model):
+    """
+    Makes the NumPy forward engine of an MLP.
+
+    Parameters
+    ----------
+    model : MLP or str
+        The model, or the path of a pickle containing it.
+
+    Returns
+    -------
+    model : NumpyMLP
+        The forward engine.
+    """
+    from pylearn2.models.mlp import MLP
+    from pylearn2.utils import serial
+
+    if not isinstance(model, MLP):
+        model = serial.load(model)
+        if not isinstance(model, MLP):
+            raise TypeError("Expected an MLP, got " + str(type(model)))
+
+    specs, params = zip(*[_layer_spec(layer) for layer in model.layers])
+    return NumpyMLP(list(specs), list(params))
+
+
+def export_mlp(model, path):
+    """
+    Saves the parameters of an MLP to be used with `NumpyMLP`.
+
+    Parameters
+    ----------
+    model : MLP or str
+        The model, or the path of a pickle containing it.
+    path : str
+        The path of the .npz file to write.
+    """
+    mlp_to_numpy(model).save(path)
+
+
+def copy_engine(dirname):
+    """
+    Copies this module to a directory, so that exported models can be
+    used without pylearn2 by importing `numpy_mlp` from there.
+
+    Parameters
+    ----------
+    dirname : str
+        The directory to copy the module to.
+
+    Returns
+    -------
+    path : str
+        The path of the copy.
+    """
+    source = os.path.splitext(os.path.abspath(__file__))[0] + '.py'
+    path = os.path.join(dirname, 'numpy_mlp.py')
+    shutil.copy(source, path)
+    return path
@@ -0,0 +1,344 @@
+"""
+Batch prediction of a model over a whole dataset.
+
+`predict` iterates over a `Dataset` in the input space of a model, runs
+its compiled `fprop` on each batch while the next batches are read in a
+background thread, and streams the outputs (or the outputs of chosen
+layers of an MLP) to .npy, HDF5 or CSV files as they are computed, so
+that the predictions never need to fit in memory.
+"""
+__copyright__ = "Copyright 2010-2015, Universite de Montreal"
+__license__ = "3-clause BSD"
+__maintainer__ = "LISA Lab"
+__email__ = "pylearn-dev@googlegroups"
+
+import logging
+import os
+import time
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+import numpy as np
+from theano.compat.six import string_types
+
+from pylearn2.utils import function
+from pylearn2.utils import serial
+from pylearn2.utils.iteration import Prefetcher
+
+
+logger = logging.getLogger(__name__)
+
+
+class _NpyWriter(object):
+    """
+    Writes batches to a .npy file through a memmap.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    shape : tuple
+        The shape of the whole output.
+    dtype : str
+        The dtype of the output.
+    """
+
+    def __init__(self, path, shape, dtype):
+        self.path = path
+        self.array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                               shape=shape)
+
+    def write(self, start, batch):
+        """
+        Writes a batch of outputs.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first example of the batch.
+        batch : numpy.ndarray
+            The outputs, with the batch on the first axis.
+        """
+        self.array[start:start + batch.shape[0]] = batch
+
+    def close(self):
+        """
+        Flushes the file.
+        """
+        self.array.flush()
+        del self.array
+
+
+class _HDF5Writer(object):
+    """
+    Writes batches to a dataset of an HDF5 file.
+
+    Parameters
+    ----------
+    h5file : h5py.File
+        The open file.
+    name : str
+        The name of the dataset.
+    shape : tuple
+        The shape of the whole output.
+    dtype : str
+        The dtype of the output.
+    batch_size : int
+        The number of examples in a chunk.
+    """
+
+    def __init__(self, h5file, name, shape, dtype, batch_size):
+        self.path = h5file.filename + ':' + name
+        chunks = (min(batch_size, shape[0]),) + shape[1:]
+        self.array = h5file.create_dataset(name, shape=shape, dtype=dtype,
+                                           chunks=chunks)
+
+    def write(self, start, batch):
+        """
+        Writes a batch of outputs.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first example of the batch.
+        batch : numpy.ndarray
+            The outputs, with the batch on the first axis.
+        """
+        self.array[start:start + batch.shape[0]] = batch
+
+    def close(self):
+        """
+        Does nothing: the file is closed by `predict`.
+        """
+
+
+class _CSVWriter(object):
+    """
+    Writes batches to a CSV file, one flattened example per row.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    dtype : str
+        The dtype of the output.
+    """
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.fmt = '%d' if np.dtype(dtype).kind in 'iub' else '%.9g'
+        self.file = open(path, 'wb')
+
+    def write(self, start, batch):
+        """
+        Writes a batch of outputs.
+
+        Parameters
+        ----------
+        start : int
+            The index of the first example of the batch.
+        batch : numpy.ndarray
+            The outputs, with the batch on the first axis.
+        """
+        np.savetxt(self.file, batch.reshape((batch.shape[0], -1)),
+                   fmt=self.fmt, delimiter=',')
+
+    def close(self):
+        """
+        Closes the file.
+        """
+        self.file.close()
+
+
+def _output_names(model, layers):
+    """
+    Returns the names of the outputs written by `predict`.
+
+    Parameters
+    ----------
+    model : Model
+        The model.
+    layers : list, str or None
+        See `predict`.
+
+    Returns
+    -------
+    names : list
+        The names of the outputs.
+    indices : list or None
+        The indices of the layers in `model.layers`, or None to write the
+        output of the model.
+    """
+    if layers is None:
+        return ['output'], None
+    if not hasattr(model, 'layers'):
+        raise ValueError("Can only write the outputs of the layers of a "
+                         "model with layers, such as an MLP, not " +
+                         str(type(model)))
+    all_names = [layer.layer_name for layer in model.layers]
+    if layers == 'all':
+        layers = all_names
+    indices = []
+    for name in layers:
+        if name not in all_names:
+            raise ValueError("The model has no layer named %s. Its layers "
+                             "are %s." % (name, all_names))
+        indices.append(all_names.index(name))
+    return list(layers), indices
+
+
+def _make_writers(output, names, num_examples, batches, batch_size):
+    """
+    Opens the files the outputs are written to.
+
+    Parameters
+    ----------
+    output : str
+        The output path, whose extension gives the format.
+    names : list
+        The names of the outputs.
+    num_examples : int
+        The number of examples.
+    batches : list
+        The first batch of each output, used for their shapes and dtypes.
+    batch_size : int
+        The batch size.
+
+    Returns
+    -------
+    writers : list
+        One writer per output.
+    h5file : h5py.File or None
+        The HDF5 file, if the format is HDF5.
+    """
+    root, ext = os.path.splitext(output)
+    ext = ext.lower()
+    shapes = [(num_examples,) + batch.shape[1:] for batch in batches]
+    if ext in ('.h5', '.hdf5'):
+        if h5py is None:
+            raise RuntimeError("Could not import h5py.")
+        h5file = h5py.File(output, 'w')
+        return [_HDF5Writer(h5file, name, shape, batch.dtype, batch_size)
+                for name, shape, batch in zip(names, shapes, batches)], h5file
+
+    if len(names) == 1:
+        paths = [output]
+    else:
+        paths = [root + '_' + name + ext for name in names]
+    if ext == '.npy':
+        return [_NpyWriter(path, shape, batch.dtype)
+                for path, shape, batch in zip(paths, shapes, batches)], None
+    if ext == '.csv':
+        return [_CSVWriter(path, batch.dtype)
+                for path, batch in zip(paths, batches)], None
+    raise ValueError("Unknown output format %s, expected .npy, .h5, .hdf5 "
+                     "or .csv." % ext)
+
+
+def predict(model, dataset, output, batch_size=100, layers=None, prefetch=2,
+            log_period=10.):
+    """
+    Runs a model over a dataset and writes its outputs to files, batch
+    by batch.
+
+    Parameters
+    ----------
+    model : Model or str
+        The model, or the path of a pickle containing it.
+    dataset : Dataset
+        The dataset. Its features are iterated over sequentially, in the
+        input space of the model.
+    output : str
+        The path of the output file. Its extension gives the format:
+        '.npy', '.h5' or '.hdf5', or '.csv'. When several outputs are
+        written, the HDF5 file holds one dataset per layer, and the .npy
+        and .csv files get the name of each layer appended to their name.
+    batch_size : int, optional
+        The number of examples per batch. Ignored if the model has a
+        `force_batch_size`, in which case the last batch is padded.
+    layers : list or str, optional
+        The names of the layers of an MLP whose outputs are written,
+        computed with `fprop(return_all=True)`. 'all' writes all of them.
+        By default, the output of the model is written.
+    prefetch : int, optional
+        The number of batches read ahead in a background thread. 0
+        disables prefetching.
+    log_period : float, optional
+        The time, in seconds, between progress messages.
+
+    Returns
+    -------
+    paths : list
+        The files (or HDF5 datasets) written.
+    """
+    if isinstance(model, string_types):
+        model = serial.load(model)
+    names, indices = _output_names(model, layers)
+
+    space = model.get_input_space()
+    force_batch_size = getattr(model, 'force_batch_size', None)
+    if force_batch_size is not None and force_batch_size > 0:
+        batch_size = force_batch_size
+    X = space.make_theano_batch(name='predict_X', batch_size=batch_size)
+    if indices is None:
+        outputs = [model.fprop(X)]
+        output_spaces = [model.get_output_space()]
+    else:
+        all_outputs = model.fprop(X, return_all=True)
+        outputs = [all_outputs[i] for i in indices]
+        output_spaces = [model.layers[i].get_output_space()
+                         for i in indices]
+    output_axes = [output_space.get_batch_axis()
+                   for output_space in output_spaces]
+    f = function([X], outputs, name='predict')
+
+    batch_axis = space.get_batch_axis()
+    num_examples = dataset.get_num_examples()
+    iterator = dataset.iterator(mode='sequential', batch_size=batch_size,
+                                data_specs=(space, 'features'))
+    if prefetch > 0:
+        iterator = Prefetcher(iterator, prefetch)
+
+    writers = None
+    h5file = None
+    start = 0
+    t0 = time.time()
+    last_log = t0
+    try:
+        for batch in iterator:
+            size = batch.shape[batch_axis]
+            if size < batch_size and force_batch_size:
+                pad_shape = list(batch.shape)
+                pad_shape[batch_axis] = batch_size - size
+                batch = np.concatenate(
+                    [batch, np.zeros(pad_shape, dtype=batch.dtype)],
+                    axis=batch_axis)
+            results = [np.rollaxis(result, axis)[:size]
+                       for result, axis in zip(f(batch), output_axes)]
+            if writers is None:
+                writers, h5file = _make_writers(output, names, num_examples,
+                                                results, batch_size)
+            for writer, result in zip(writers, results):
+                writer.write(start, result)
+            start += size
+
+            now = time.time()
+            if now - last_log >= log_period:
+                last_log = now
+                logger.info("Predicted {0}/{1} examples ({2:.1f} examples/s)"
+                            .format(start, num_examples, start / (now - t0)))
+    finally:
+        if writers is not None:
+            for writer in writers:
+                writer.close()
+        if h5file is not None:
+            h5file.close()
+
+    elapsed = time.time() - t0
+    logger.info("Predicted {0} examples in {1:.1f}s ({2:.1f} examples/s)"
+                .format(start, elapsed, start / max(elapsed, 1e-12)))
+    if writers is None:
+        return []
+    return [writer.path for writer in writers]
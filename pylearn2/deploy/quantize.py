@@ -0,0 +1,213 @@
+"""
+Post-training int8 quantization of the weights of exported MLPs.
+
+The weight matrices of the dense layers (`Linear` and its subclasses,
+`Softmax` and `maxout.Maxout`) of a `NumpyMLP` are replaced by int8
+matrices with one scale per column. The scale of each column is the
+largest absolute weight of the column, times a clipping ratio chosen to
+minimize the error on the output of the column for inputs collected on a
+held-out calibration dataset.
+
+The quantized model is a `NumpyMLP` as well. It keeps only the int8
+weights in memory, and converts them back to floats a few rows at a time
+during the forward pass, so inference reads a quarter of the bytes of the
+float model.
+"""
+__copyright__ = "Copyright 2010-2015, Universite de Montreal"
+__license__ = "3-clause BSD"
+__maintainer__ = "LISA Lab"
+__email__ = "pylearn-dev@googlegroups"
+
+import copy
+import logging
+
+import numpy as np
+from theano.compat.six import string_types
+
+from pylearn2.deploy.numpy_mlp import NumpyMLP, _flatten, mlp_to_numpy
+from pylearn2.utils import serial
+
+
+logger = logging.getLogger(__name__)
+
+
+QUANTIZABLE_TYPES = ('linear', 'maxout')
+
+CLIP_RATIOS = (1., .95, .9, .85, .8, .75, .7, .6, .5)
+
+
+def quantize_weights(W, X=None, clip_ratios=CLIP_RATIOS):
+    """
+    Quantizes a weight matrix to int8 with one scale per column.
+
+    Parameters
+    ----------
+    W : numpy.ndarray
+        A weight matrix, with one column per output unit.
+    X : numpy.ndarray, optional
+        Calibration inputs of the layer. If given, each column uses the
+        ratio of `clip_ratios` that minimizes the squared error of its
+        output on `X`. Otherwise, columns are not clipped.
+    clip_ratios : tuple, optional
+        The fractions of the largest absolute weight of a column that
+        are tried as its largest representable value.
+
+    Returns
+    -------
+    W_q : numpy.ndarray
+        The int8 weights.
+    scale : numpy.ndarray
+        The scale of each column, so that `W` is approximately
+        `W_q * scale`.
+    """
+    W = np.asarray(W, dtype='float64')
+    max_abs = np.abs(W).max(axis=0)
+    max_abs[max_abs == 0.] = 1.
+    if X is None:
+        scale = max_abs / 127.
+        return np.round(W / scale).astype('int8'), scale
+
+    best_error = None
+    for ratio in clip_ratios:
+        scale = ratio * max_abs / 127.
+        W_q = np.clip(np.round(W / scale), -127, 127)
+        error = np.square(np.dot(X, W - W_q * scale)).sum(axis=0)
+        if best_error is None:
+            best_error, best_W_q, best_scale = error, W_q, scale
+        else:
+            better = error < best_error
+            best_error[better] = error[better]
+            best_W_q[:, better] = W_q[:, better]
+            best_scale[better] = scale[better]
+    return best_W_q.astype('int8'), best_scale
+
+
+def _calibration_inputs(model, batches, num_examples):
+    """
+    Collects the inputs of the quantizable layers of a model.
+
+    Parameters
+    ----------
+    model : NumpyMLP
+        The float model.
+    batches : iterable
+        Batches of inputs of the model.
+    num_examples : int
+        The maximum number of examples to collect.
+
+    Returns
+    -------
+    inputs : list
+        For each layer, a design matrix of its inputs, or None if the
+        layer can't be quantized.
+    """
+    inputs = [[] for layer in model.layers]
+    count = 0
+    for X in batches:
+        outputs = model.fprop(X, copy=False, return_all=True)
+        below = [np.asarray(X, dtype=model.dtype)] + outputs[:-1]
+        for i, (layer, state) in enumerate(zip(model.layers, below)):
+            if (layer.spec['type'] in QUANTIZABLE_TYPES and
+                    layer.params.get('W') is not None):
+                inputs[i].append(_flatten(state, layer.input_axes).copy())
+        count += model.batch_size(X)
+        if count >= num_examples:
+            break
+    if count == 0:
+        raise ValueError("The calibration data is empty.")
+    return [np.concatenate(layer_inputs)[:num_examples]
+            if layer_inputs else None for layer_inputs in inputs]
+
+
+def quantize_numpy_mlp(model, batches=None, num_examples=1000,
+                       layers=None, clip_ratios=CLIP_RATIOS):
+    """
+    Quantizes the weights of the dense layers of a `NumpyMLP` to int8.
+
+    Parameters
+    ----------
+    model : NumpyMLP
+        The float model. It is not modified.
+    batches : iterable, optional
+        Batches of calibration inputs, in the input space of the model.
+        Without them, the scales are not calibrated.
+    num_examples : int, optional
+        The maximum number of calibration examples used.
+    layers : list, optional
+        The names of the layers to quantize. Defaults to all the layers
+        that can be quantized.
+    clip_ratios : tuple, optional
+        See `quantize_weights`.
+
+    Returns
+    -------
+    quantized : NumpyMLP
+        The model with int8 weights.
+    """
+    if batches is None:
+        inputs = [None] * len(model.layers)
+    else:
+        inputs = _calibration_inputs(model, batches, num_examples)
+
+    specs = []
+    params = []
+    for layer, X in zip(model.layers, inputs):
+        spec = copy.copy(layer.spec)
+        layer_params = dict(layer.params)
+        W = layer_params.get('W')
+        if (spec['type'] in QUANTIZABLE_TYPES and W is not None and
+                W.dtype.kind == 'f' and
+                (layers is None or spec['layer_name'] in layers)):
+            W_q, scale = quantize_weights(W, X, clip_ratios)
+            layer_params['W'] = W_q
+            layer_params['W_scale'] = scale.astype(model.dtype)
+            if X is not None:
+                error = np.dot(X, W - W_q * scale)
+                logger.info("{0}: relative error of the quantized linear "
+                            "response {1}".format(
+                                spec['layer_name'],
+                                np.sqrt(np.square(error).sum() /
+                                        np.square(np.dot(X, W)).sum())))
+        specs.append(spec)
+        params.append(layer_params)
+    return NumpyMLP(specs, params, dtype=model.dtype)
+
+
+def quantize_mlp(model, dataset=None, num_examples=1000, batch_size=100,
+                 layers=None, clip_ratios=CLIP_RATIOS):
+    """
+    Exports an MLP to the NumPy engine with int8 weights, calibrated on
+    a held-out dataset.
+
+    Parameters
+    ----------
+    model : MLP or str
+        The model, or the path of a pickle containing it.
+    dataset : Dataset, optional
+        The calibration dataset. Its features are iterated over in the
+        input space of the model.
+    num_examples : int, optional
+        The maximum number of calibration examples used.
+    batch_size : int, optional
+        The size of the calibration batches.
+    layers : list, optional
+        The names of the layers to quantize. Defaults to all the layers
+        that can be quantized.
+    clip_ratios : tuple, optional
+        See `quantize_weights`.
+
+    Returns
+    -------
+    quantized : NumpyMLP
+        The model with int8 weights.
+    """
+    if isinstance(model, string_types):
+        model = serial.load(model)
+    numpy_model = mlp_to_numpy(model)
+    batches = None
+    if dataset is not None:
+        batches = dataset.iterator(
+            mode='sequential', batch_size=batch_size,
+            data_specs=(model.get_input_space(), 'features'))
+    return quantize_numpy_mlp(numpy_model, batches, num_examples, layers,
+                              clip_ratios)
@@ -0,0 +1,509 @@
+"""
+Batched inference server for trained models.
+
+A `BatchedPredictor` loads a model once, compiles its `fprop` for a small
+set of bucketed batch sizes and runs the requests it receives from many
+threads in dynamically formed micro-batches. `serve` exposes a predictor
+over a local TCP socket, and `PredictionClient` talks to it.
+
+Each message on the socket is an 8 byte big-endian length followed by an
+array saved in the .npy format, in both directions. If a request cannot
+be decoded or its prediction fails, the server answers it with a 0-d
+string array holding the error message, which `PredictionClient` raises
+as a `RuntimeError`, and keeps serving the connection.
+"""
+__copyright__ = "Copyright 2010-2015, Universite de Montreal"
+__license__ = "3-clause BSD"
+__maintainer__ = "LISA Lab"
+__email__ = "pylearn-dev@googlegroups"
+
+import io
+import logging
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+from theano.compat.six.moves import queue, socketserver, xrange
+from theano.compat.six import string_types
+
+from pylearn2.utils import function
+from pylearn2.utils import serial
+
+
+logger = logging.getLogger(__name__)
+
+# The allow_pickle argument of numpy.load was added in numpy 1.10
+if tuple(int(v) for v in np.__version__.split('.')[:2]) >= (1, 10):
+    _LOAD_KWARGS = {'allow_pickle': False}
+else:
+    _LOAD_KWARGS = {}
+
+
+class _Request(object):
+    """
+    A batch of examples waiting for its predictions.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        The examples, along axis `batch_axis`.
+    batch_axis : int
+        The batch axis of `X`.
+    """
+
+    def __init__(self, X, batch_axis):
+        self.X = X
+        self.size = X.shape[batch_axis]
+        self.arrival = time.time()
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class BatchedPredictor(object):
+    """
+    Runs a model's `fprop` on requests coming from many threads, grouping
+    them into micro-batches.
+
+    A worker thread waits for the first pending request, then keeps
+    collecting requests until either `max_batch_size` examples are pending
+    or `max_latency` seconds have passed since the first one arrived, and
+    runs them all with a single call to the compiled function.
+
+    Batches are padded with zeros up to the smallest of `batch_sizes`
+    that fits them, so only `len(batch_sizes)` distinct input shapes are
+    ever given to the compiled functions; batches larger than the largest
+    bucket are split.
+
+    Parameters
+    ----------
+    model : Model or str
+        The model, or the path of a pickle containing it.
+    batch_sizes : list, optional
+        The bucket sizes. One function is compiled for each of them when
+        the predictor is created. If the model has a `force_batch_size`,
+        it is the only bucket.
+    max_batch_size : int, optional
+        The maximum number of examples run together. Defaults to the
+        largest bucket size.
+    max_latency : float, optional
+        The maximum time, in seconds, a request waits for others to join
+        its micro-batch.
+    """
+
+    def __init__(self, model, batch_sizes=(1, 8, 32, 128),
+                 max_batch_size=None, max_latency=.005):
+        if isinstance(model, string_types):
+            model = serial.load(model)
+        self.model = model
+
+        force_batch_size = getattr(model, 'force_batch_size', None)
+        if force_batch_size is not None and force_batch_size > 0:
+            batch_sizes = [force_batch_size]
+        self.batch_sizes = sorted(set(batch_sizes))
+        if max_batch_size is None:
+            max_batch_size = self.batch_sizes[-1]
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+
+        input_space = model.get_input_space()
+        self.batch_axis = input_space.get_batch_axis()
+        self.output_batch_axis = model.get_output_space().get_batch_axis()
+        self._functions = {}
+        for batch_size in self.batch_sizes:
+            X = input_space.make_theano_batch(
+                name='BatchedPredictor_X', batch_size=batch_size)
+            self._functions[batch_size] = function(
+                [X], model.fprop(X), allow_input_downcast=True,
+                name='BatchedPredictor.fprop_%d' % batch_size)
+
+        self.num_batches = 0
+        self.num_examples = 0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._work,
+                                        name='BatchedPredictor worker')
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _fprop(self, X):
+        """
+        Runs the compiled functions on `X`, padding it to bucket sizes.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            A batch of examples of any size.
+
+        Returns
+        -------
+        Y : numpy.ndarray
+            The output of the model on `X`.
+        """
+        n = X.shape[self.batch_axis]
+        largest = self.batch_sizes[-1]
+        outputs = []
+        for start in xrange(0, n, largest):
+            chunk = X.take(np.arange(start, min(start + largest, n)),
+                           axis=self.batch_axis)
+            size = chunk.shape[self.batch_axis]
+            bucket = [b for b in self.batch_sizes if b >= size][0]
+            if bucket > size:
+                pad_shape = list(chunk.shape)
+                pad_shape[self.batch_axis] = bucket - size
+                chunk = np.concatenate(
+                    [chunk, np.zeros(pad_shape, dtype=chunk.dtype)],
+                    axis=self.batch_axis)
+            Y = self._functions[bucket](chunk)
+            outputs.append(Y.take(np.arange(size),
+                                  axis=self.output_batch_axis))
+        return np.concatenate(outputs, axis=self.output_batch_axis)
+
+    def _collect(self, first):
+        """
+        Gathers the requests that join `first` in its micro-batch.
+
+        Parameters
+        ----------
+        first : _Request
+            The oldest pending request.
+
+        Returns
+        -------
+        requests : list
+            The requests to run together.
+        """
+        requests = [first]
+        size = first.size
+        deadline = first.arrival + self.max_latency
+        while size < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Stop after this batch
+                self._queue.put(None)
+                break
+            requests.append(request)
+            size += request.size
+        return requests
+
+    def _work(self):
+        """
+        Main loop of the worker thread.
+        """
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            requests = self._collect(first)
+            try:
+                self._run(requests)
+            except Exception as e:
+                if len(requests) == 1:
+                    logger.exception("BatchedPredictor failed to run a "
+                                     "request")
+                    first.error = e
+                    first.done.set()
+                    continue
+                # Run the requests one by one, so that a malformed request
+                # only fails itself
+                for request in requests:
+                    try:
+                        self._run([request])
+                    except Exception as e:
+                        logger.exception("BatchedPredictor failed to run a "
+                                         "request")
+                        request.error = e
+                        request.done.set()
+
+    def _run(self, requests):
+        """
+        Runs requests together and hands each its predictions.
+
+        Parameters
+        ----------
+        requests : list
+            The requests to run in one micro-batch.
+        """
+        X = np.concatenate([request.X for request in requests],
+                           axis=self.batch_axis)
+        Y = self._fprop(X)
+        self.num_batches += 1
+        self.num_examples += X.shape[self.batch_axis]
+        start = 0
+        for request in requests:
+            request.result = Y.take(np.arange(start, start + request.size),
+                                    axis=self.output_batch_axis)
+            start += request.size
+            request.done.set()
+
+    def predict(self, X):
+        """
+        Computes the output of the model on `X`, blocking until it is
+        available. Can be called from many threads at once.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            A batch of examples in the model's input space.
+
+        Returns
+        -------
+        Y : numpy.ndarray
+            The output of the model on `X`.
+        """
+        if self._stopped.is_set():
+            raise RuntimeError("BatchedPredictor has been stopped.")
+        request = _Request(np.asarray(X), self.batch_axis)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def stop(self):
+        """
+        Stops the worker thread once the pending requests are done.
+        """
+        self._stopped.set()
+        self._queue.put(None)
+        self._worker.join()
+        if self.num_batches > 0:
+            logger.info("BatchedPredictor ran {0} examples in {1} batches "
+                        "(mean batch size {2})".format(
+                            self.num_examples, self.num_batches,
+                            self.num_examples / float(self.num_batches)))
+
+
+def _recv_exactly(sock, size):
+    """
+    Reads exactly `size` bytes from `sock`.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        A connected socket.
+    size : int
+        The number of bytes to read.
+
+    Returns
+    -------
+    data : bytes or None
+        The bytes read, or None if the connection was closed first.
+    """
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def send_array(sock, array):
+    """
+    Sends an array over a socket, in the format read by `recv_array`.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        A connected socket.
+    array : numpy.ndarray
+        The array to send.
+    """
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(array))
+    data = buf.getvalue()
+    sock.sendall(struct.pack('>Q', len(data)) + data)
+
+
+def _recv_message(sock):
+    """
+    Reads the bytes of one message sent by `send_array` from a socket.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        A connected socket.
+
+    Returns
+    -------
+    data : bytes or None
+        The .npy data, or None if the connection was closed.
+    """
+    header = _recv_exactly(sock, 8)
+    if header is None:
+        return None
+    return _recv_exactly(sock, struct.unpack('>Q', header)[0])
+
+
+def _decode_array(data):
+    """
+    Loads an array from .npy data, refusing pickled objects when the
+    installed numpy allows it.
+
+    Parameters
+    ----------
+    data : bytes
+        The .npy data.
+
+    Returns
+    -------
+    array : numpy.ndarray
+        The array.
+    """
+    return np.load(io.BytesIO(data), **_LOAD_KWARGS)
+
+
+def recv_array(sock):
+    """
+    Reads an array sent by `send_array` from a socket.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        A connected socket.
+
+    Returns
+    -------
+    array : numpy.ndarray or None
+        The array, or None if the connection was closed.
+    """
+    data = _recv_message(sock)
+    if data is None:
+        return None
+    return _decode_array(data)
+
+
+class _PredictionHandler(socketserver.BaseRequestHandler):
+    """
+    Answers the requests of one client connection until it is closed.
+    """
+
+    def handle(self):
+        """
+        Reads arrays from the connection and sends back the predictions.
+        """
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        while True:
+            data = _recv_message(self.request)
+            if data is None:
+                return
+            try:
+                Y = self.server.predictor.predict(_decode_array(data))
+            except Exception as e:
+                logger.exception("Failed to answer a request")
+                # Predictions always have a batch axis, so a 0-d string
+                # array cannot be mistaken for one
+                Y = np.array(str(e))
+            send_array(self.request, Y)
+
+
+class PredictionServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """
+    TCP server answering each connection in its own thread with the
+    predictions of a `BatchedPredictor`, so that concurrent clients share
+    micro-batches.
+
+    Parameters
+    ----------
+    address : tuple
+        The (host, port) to listen on. Use port 0 to pick a free port.
+    predictor : BatchedPredictor
+        The predictor used to answer the requests.
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, predictor):
+        socketserver.TCPServer.__init__(self, address, _PredictionHandler)
+        self.predictor = predictor
+
+
+def serve(model, host='localhost', port=8000, **kwargs):
+    """
+    Serves the predictions of a model over TCP until interrupted.
+
+    Parameters
+    ----------
+    model : Model or str
+        The model, or the path of a pickle containing it.
+    host : str, optional
+        The host to listen on.
+    port : int, optional
+        The port to listen on.
+    kwargs : dict
+        Passed on to `BatchedPredictor`.
+    """
+    predictor = BatchedPredictor(model, **kwargs)
+    server = PredictionServer((host, port), predictor)
+    logger.info("Serving predictions on {0}:{1}".format(
+        *server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        predictor.stop()
+
+
+class PredictionClient(object):
+    """
+    Client of a `PredictionServer`. Each client holds one connection, so
+    use one client per thread.
+
+    Parameters
+    ----------
+    host : str, optional
+        The host the server listens on.
+    port : int, optional
+        The port the server listens on.
+    """
+
+    def __init__(self, host='localhost', port=8000):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def predict(self, X):
+        """
+        Asks the server for the output of the model on `X`.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            A batch of examples in the model's input space.
+
+        Returns
+        -------
+        Y : numpy.ndarray
+            The output of the model on `X`.
+
+        Raises
+        ------
+        RuntimeError
+            If the server could not answer the request.
+        """
+        send_array(self.sock, X)
+        Y = recv_array(self.sock)
+        if Y is None:
+            raise IOError("The prediction server closed the connection.")
+        if Y.ndim == 0 and Y.dtype.kind in 'SU':
+            raise RuntimeError("The prediction server failed to answer the "
+                               "request: {0}".format(Y))
+        return Y
+
+    def close(self):
+        """
+        Closes the connection.
+        """
+        self.sock.close()
@@ -0,0 +1,99 @@
+"""
+Tests for pylearn2.deploy.numpy_mlp
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from theano import config, function
+from nose.tools import assert_raises
+
+from pylearn2.deploy.numpy_mlp import export_mlp, load_numpy_mlp
+from pylearn2.models.maxout import Maxout
+from pylearn2.models.mlp import (ConvRectifiedLinear, Linear, MLP,
+                                 RectifiedLinear, Sigmoid, Softmax, Softplus,
+                                 Tanh)
+from pylearn2.space import Conv2DSpace
+
+
+def _check_export(mlp, X):
+    """
+    Exports an MLP and compares the output of the NumPy engine to the
+    output of `MLP.fprop` on `X`.
+    """
+    rng = np.random.RandomState(0)
+    for param in mlp.get_params():
+        value = param.get_value()
+        param.set_value(rng.uniform(-.5, .5, value.shape).astype(value.dtype))
+    X_sym = mlp.get_input_space().make_theano_batch()
+    expected = function([X_sym], mlp.fprop(X_sym))(X)
+
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, 'model.npz')
+        export_mlp(mlp, path)
+        model = load_numpy_mlp(path)
+    finally:
+        shutil.rmtree(dirname)
+    assert model.dtype == config.floatX
+    # The second call reuses the buffers of the first one
+    for i in range(2):
+        np.testing.assert_allclose(model.fprop(X), expected, rtol=1e-4,
+                                   atol=1e-6)
+
+
+def test_dense_layers():
+    """
+    Checks the export of an MLP made of all the supported dense layers.
+    """
+    mlp = MLP(nvis=7, layers=[Linear(6, 'h0', irange=.1),
+                              RectifiedLinear(dim=6, layer_name='h1',
+                                              irange=.1, left_slope=.2),
+                              Sigmoid(dim=5, layer_name='h2', irange=.1),
+                              Tanh(dim=8, layer_name='h3', irange=.1),
+                              Maxout('h4', num_units=3, num_pieces=3,
+                                     pool_stride=2, irange=.1,
+                                     min_zero=True),
+                              Softmax(4, 'y', irange=.1)])
+    X = np.random.RandomState(1).normal(size=(10, 7)).astype(config.floatX)
+    _check_export(mlp, X)
+
+
+def test_conv_layers():
+    """
+    Checks the export of a convolutional MLP.
+    """
+    mlp = MLP(input_space=Conv2DSpace(shape=[9, 8], num_channels=2,
+                                      axes=('b', 0, 1, 'c')),
+              layers=[ConvRectifiedLinear(output_channels=3,
+                                          kernel_shape=[3, 2],
+                                          pool_shape=[3, 2],
+                                          pool_stride=[2, 1],
+                                          layer_name='h0', irange=.1,
+                                          left_slope=.1),
+                      ConvRectifiedLinear(output_channels=2,
+                                          kernel_shape=[2, 2],
+                                          pool_shape=[2, 2],
+                                          pool_stride=[2, 2],
+                                          layer_name='h1', irange=.1,
+                                          border_mode='full', tied_b=True),
+                      Maxout('h2', num_units=4, num_pieces=2, irange=.1,
+                             randomize_pools=True),
+                      Softmax(3, 'y', irange=.1, non_redundant=True)])
+    X = np.random.RandomState(1).normal(
+        size=(5, 9, 8, 2)).astype(config.floatX)
+    _check_export(mlp, X)
+
+
+def test_unsupported_layer():
+    """
+    Checks that layers the engine can't run are refused.
+    """
+    mlp = MLP(nvis=3, layers=[Softplus(dim=2, layer_name='h0', irange=.1)])
+    dirname = tempfile.mkdtemp()
+    try:
+        assert_raises(NotImplementedError, export_mlp, mlp,
+                      os.path.join(dirname, 'model.npz'))
+    finally:
+        shutil.rmtree(dirname)
@@ -0,0 +1,75 @@
+"""
+Tests for pylearn2.deploy.predict
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from nose.plugins.skip import SkipTest
+from theano import config, function
+
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.deploy.predict import predict
+from pylearn2.models.mlp import MLP, Sigmoid, Softmax
+
+
+def _make_problem():
+    """
+    Makes a small MLP, a dataset, and the outputs of all the layers of
+    the MLP on the dataset.
+    """
+    rng = np.random.RandomState(0)
+    mlp = MLP(nvis=5, layers=[Sigmoid(layer_name='h0', dim=4, irange=.5),
+                              Softmax(3, 'y', irange=.5)])
+    X = rng.normal(size=(53, 5)).astype(config.floatX)
+    X_sym = mlp.get_input_space().make_theano_batch()
+    f = function([X_sym], mlp.fprop(X_sym, return_all=True))
+    return mlp, DenseDesignMatrix(X=X), f(X)
+
+
+def test_predict_npy_csv():
+    """
+    Checks the .npy and CSV outputs, with and without prefetching.
+    """
+    mlp, dataset, (H, Y) = _make_problem()
+    dirname = tempfile.mkdtemp()
+    try:
+        paths = predict(mlp, dataset, os.path.join(dirname, 'out.npy'),
+                        batch_size=10)
+        assert paths == [os.path.join(dirname, 'out.npy')]
+        np.testing.assert_allclose(np.load(paths[0]), Y, rtol=1e-5)
+
+        paths = predict(mlp, dataset, os.path.join(dirname, 'out.npy'),
+                        batch_size=7, layers='all', prefetch=0)
+        assert paths == [os.path.join(dirname, 'out_h0.npy'),
+                         os.path.join(dirname, 'out_y.npy')]
+        np.testing.assert_allclose(np.load(paths[0]), H, rtol=1e-5)
+        np.testing.assert_allclose(np.load(paths[1]), Y, rtol=1e-5)
+
+        paths = predict(mlp, dataset, os.path.join(dirname, 'out.csv'),
+                        batch_size=20, layers=['h0'])
+        np.testing.assert_allclose(np.loadtxt(paths[0], delimiter=','), H,
+                                   rtol=1e-5)
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_predict_hdf5():
+    """
+    Checks the HDF5 output.
+    """
+    try:
+        import h5py
+    except ImportError:
+        raise SkipTest("h5py is not available.")
+    mlp, dataset, (H, Y) = _make_problem()
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, 'out.h5')
+        predict(mlp, dataset, path, batch_size=10, layers=['y', 'h0'])
+        with h5py.File(path, 'r') as f:
+            np.testing.assert_allclose(f['h0'][:], H, rtol=1e-5)
+            np.testing.assert_allclose(f['y'][:], Y, rtol=1e-5)
+    finally:
+        shutil.rmtree(dirname)
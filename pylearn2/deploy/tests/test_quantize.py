@@ -0,0 +1,69 @@
+"""
+Tests for pylearn2.deploy.quantize
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from theano import config
+
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.deploy.numpy_mlp import load_numpy_mlp, mlp_to_numpy
+from pylearn2.deploy.quantize import quantize_mlp, quantize_weights
+from pylearn2.models.maxout import Maxout
+from pylearn2.models.mlp import MLP, RectifiedLinear, Softmax
+
+
+def test_quantize_weights():
+    """
+    Checks the int8 weights and that calibration doesn't increase the
+    error on the calibration inputs.
+    """
+    rng = np.random.RandomState(0)
+    W = rng.standard_t(3, size=(20, 6))
+    X = rng.normal(size=(50, 20))
+
+    W_q, scale = quantize_weights(W)
+    assert W_q.dtype == 'int8'
+    assert np.abs(W_q).max() <= 127
+    np.testing.assert_allclose(W_q * scale, W, atol=scale.max() / 2 + 1e-12)
+
+    W_c, scale_c = quantize_weights(W, X)
+    error = np.square(np.dot(X, W - W_q * scale)).sum(axis=0)
+    error_c = np.square(np.dot(X, W - W_c * scale_c)).sum(axis=0)
+    assert np.all(error_c <= error + 1e-12)
+    assert np.all(scale_c <= scale + 1e-12)
+
+
+def test_quantize_mlp():
+    """
+    Checks that a quantized MLP, calibrated on a dataset, stays close to
+    the float model.
+    """
+    rng = np.random.RandomState(0)
+    mlp = MLP(nvis=10, layers=[Maxout('h0', num_units=8, num_pieces=3,
+                                      irange=.5),
+                               RectifiedLinear(dim=12, layer_name='h1',
+                                               irange=.5),
+                               Softmax(4, 'y', irange=.5)])
+    dataset = DenseDesignMatrix(
+        X=rng.normal(size=(200, 10)).astype(config.floatX))
+    X = rng.normal(size=(30, 10)).astype(config.floatX)
+
+    model = mlp_to_numpy(mlp)
+    quantized = quantize_mlp(mlp, dataset, num_examples=150, batch_size=50)
+    for layer in quantized.layers:
+        assert layer.W.dtype == 'int8'
+    expected = model.fprop(X)
+    np.testing.assert_allclose(quantized.fprop(X), expected, atol=.05)
+
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, 'model.npz')
+        quantized.save(path)
+        loaded = load_numpy_mlp(path)
+    finally:
+        shutil.rmtree(dirname)
+    np.testing.assert_allclose(loaded.fprop(X), quantized.fprop(X),
+                               rtol=1e-5)
@@ -0,0 +1,121 @@
+"""
+Tests for pylearn2.deploy.server
+"""
+import os
+import tempfile
+import threading
+
+from nose.tools import assert_raises
+import numpy as np
+from theano import function
+from theano.compat.six.moves import xrange
+
+from pylearn2.deploy.server import (BatchedPredictor, PredictionClient,
+                                    PredictionServer)
+from pylearn2.models.mlp import MLP, Sigmoid, Softmax
+from pylearn2.utils import serial
+
+
+def _make_model():
+    """
+    Makes a small MLP and a function computing its output.
+    """
+    mlp = MLP(nvis=5, layers=[Sigmoid(layer_name='h0', dim=4, irange=.5),
+                              Softmax(3, 'y', irange=.5)])
+    X = mlp.get_input_space().make_theano_batch()
+    f = function([X], mlp.fprop(X), allow_input_downcast=True)
+    return mlp, f
+
+
+def test_batched_predictor():
+    """
+    Checks that concurrent predictions, padded and split into buckets,
+    match a direct fprop.
+    """
+    mlp, f = _make_model()
+    predictor = BatchedPredictor(mlp, batch_sizes=(2, 8), max_latency=.01)
+    rng = np.random.RandomState(0)
+    inputs = [rng.uniform(size=(n, 5)).astype('float32')
+              for n in [1, 3, 8, 11, 1, 2, 20, 5]]
+    outputs = [None] * len(inputs)
+
+    def run(i):
+        outputs[i] = predictor.predict(inputs[i])
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in xrange(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    predictor.stop()
+
+    for X, Y in zip(inputs, outputs):
+        np.testing.assert_allclose(Y, f(X), rtol=1e-5)
+    assert predictor.num_examples == sum(X.shape[0] for X in inputs)
+    assert predictor.num_batches <= len(inputs)
+
+
+def test_batched_predictor_bad_request():
+    """
+    Checks that a malformed request only fails itself, and not the
+    requests batched with it.
+    """
+    mlp, f = _make_model()
+    predictor = BatchedPredictor(mlp, batch_sizes=(8,), max_latency=.1)
+    rng = np.random.RandomState(0)
+    inputs = [rng.uniform(size=(2, 5)).astype('float32'),
+              rng.uniform(size=(2, 4)).astype('float32'),
+              rng.uniform(size=(3, 5)).astype('float32')]
+    outputs = [None] * len(inputs)
+
+    def run(i):
+        try:
+            outputs[i] = predictor.predict(inputs[i])
+        except Exception as e:
+            outputs[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in xrange(len(inputs))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    predictor.stop()
+
+    assert isinstance(outputs[1], Exception)
+    for i in [0, 2]:
+        np.testing.assert_allclose(outputs[i], f(inputs[i]), rtol=1e-5)
+
+
+def test_prediction_server():
+    """
+    Checks predictions made through the server against a direct fprop.
+    """
+    mlp, f = _make_model()
+    fd, fname = tempfile.mkstemp(suffix='.pkl')
+    os.close(fd)
+    try:
+        serial.save(fname, mlp)
+        predictor = BatchedPredictor(fname, batch_sizes=(1, 4))
+    finally:
+        os.remove(fname)
+    server = PredictionServer(('localhost', 0), predictor)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        client = PredictionClient(*server.server_address)
+        rng = np.random.RandomState(1)
+        for n in [1, 3, 6]:
+            X = rng.uniform(size=(n, 5)).astype('float32')
+            np.testing.assert_allclose(client.predict(X), f(X), rtol=1e-5)
+        # A bad request is answered with an error, and the connection
+        # stays usable
+        assert_raises(RuntimeError, client.predict, np.ones((2, 4)))
+        np.testing.assert_allclose(client.predict(X), f(X), rtol=1e-5)
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        predictor.stop()
@@ -3,8 +3,11 @@
 
     WRITEME
 """
+import multiprocessing
+
 import numpy
 import theano
+from theano.compat.six.moves import xrange
 T = theano.tensor
 
 
@@ -87,3 +90,231 @@ class ParzenWindows(object):
             lls.extend(self.lpdf(x[inds[i::n_batches]]))
 
         return numpy.array(lls).mean()
+
+
+def _parzen_log_pdf(x, mu, mu_sq, sigmas, center_batch_size):
+    """
+    Computes the log-densities of a tile of test points under Parzen
+    windows estimators with several standard deviations.
+
+    The squared distances to a tile of kernel centers are computed once
+    as ||x||^2 - 2 x.mu + ||mu||^2, and reused for all of the standard
+    deviations, and the log-mean-exp over the tiles of centers is
+    accumulated in a streaming fashion.
+
+    Parameters
+    ----------
+    x : numpy matrix
+        The test points.
+    mu : numpy matrix
+        The kernel centers.
+    mu_sq : numpy vector
+        The squared norms of the kernel centers.
+    sigmas : numpy vector
+        The standard deviations.
+    center_batch_size : int
+        The number of kernel centers per tile.
+
+    Returns
+    -------
+    lpdf : numpy matrix
+        The log-densities, with one row per standard deviation.
+    """
+    scales = -.5 / sigmas ** 2
+    x_sq = (x ** 2).sum(axis=1)
+    max_ = numpy.zeros((len(sigmas), x.shape[0])) - numpy.inf
+    sum_ = numpy.zeros((len(sigmas), x.shape[0]))
+    for start in xrange(0, mu.shape[0], center_batch_size):
+        stop = start + center_batch_size
+        d2 = numpy.dot(x, mu[start:stop].T)
+        d2 *= -2
+        d2 += x_sq[:, None]
+        d2 += mu_sq[None, start:stop]
+        numpy.maximum(d2, 0, out=d2)
+        min_d2 = d2.min(axis=1)
+        for i, scale in enumerate(scales):
+            new_max = numpy.maximum(max_[i], scale * min_d2)
+            sum_[i] *= numpy.exp(max_[i] - new_max)
+            a = d2 * d2.dtype.type(scale)
+            a -= new_max[:, None]
+            numpy.exp(a, out=a)
+            sum_[i] += a.sum(axis=1, dtype='float64')
+            max_[i] = new_max
+    Z = mu.shape[1] * numpy.log(sigmas * numpy.sqrt(numpy.pi * 2))
+    return max_ + numpy.log(sum_ / mu.shape[0]) - Z[:, None]
+
+
+# The kernel centers of the worker processes, set once by _init_worker so
+# that they aren't pickled with every tile.
+_worker_args = None
+
+
+def _init_worker(*args):
+    """
+    Stores the kernel centers and the standard deviations in a worker
+    process.
+    """
+    global _worker_args
+    _worker_args = args
+
+
+def _parzen_log_pdf_in_worker(x):
+    """
+    Calls `_parzen_log_pdf` with the kernel centers of the worker process.
+    """
+    mu, mu_sq, sigmas, center_batch_size = _worker_args
+    return _parzen_log_pdf(x, mu, mu_sq, sigmas, center_batch_size)
+
+
+def parzen_log_pdf(x, samples, sigma, batch_size=1000,
+                   center_batch_size=1000, n_jobs=1):
+    """
+    Evaluates the log-density of points under a Parzen windows estimator,
+    in bounded memory.
+
+    Unlike `make_lpdf`, which builds a tensor of size
+    n_points * n_samples * dim, this works on tiles of
+    `batch_size` points by `center_batch_size` samples, so memory use
+    doesn't depend on the number of points or samples. The tiles of
+    points can be spread over several processes.
+
+    Parameters
+    ----------
+    x : numpy matrix
+        The points at which to evaluate the log-density.
+    samples : numpy matrix
+        The kernel centers, see `make_lpdf`.
+    sigma : scalar or list
+        The standard deviation of the kernels. If a list is given, the
+        log-densities are computed for each standard deviation, reusing
+        the squared distances.
+    batch_size : int, optional
+        The number of points per tile.
+    center_batch_size : int, optional
+        The number of kernel centers per tile.
+    n_jobs : int, optional
+        The number of processes. If None, uses one per core. Each process
+        also runs the BLAS matrix products, which may be multithreaded.
+
+    Returns
+    -------
+    lpdf : numpy array
+        The log-densities of the points, or, if `sigma` is a list, a
+        matrix with the log-densities for each standard deviation in its
+        rows.
+    """
+    scalar = numpy.isscalar(sigma)
+    sigmas = numpy.atleast_1d(numpy.asarray(sigma, dtype='float64'))
+    dtype = numpy.result_type(x.dtype, samples.dtype, numpy.float32)
+    x = numpy.asarray(x, dtype=dtype)
+    samples = numpy.asarray(samples, dtype=dtype)
+    mu_sq = (samples ** 2).sum(axis=1)
+    if n_jobs is None:
+        n_jobs = multiprocessing.cpu_count()
+
+    tiles = [x[start:start + batch_size]
+             for start in xrange(0, x.shape[0], batch_size)]
+    if n_jobs > 1 and len(tiles) > 1:
+        pool = multiprocessing.Pool(n_jobs, _init_worker,
+                                    (samples, mu_sq, sigmas,
+                                     center_batch_size))
+        try:
+            results = pool.map(_parzen_log_pdf_in_worker, tiles)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_parzen_log_pdf(tile, samples, mu_sq, sigmas,
+                                   center_batch_size) for tile in tiles]
+    lpdf = numpy.concatenate(results, axis=1)
+
+    if scalar:
+        return lpdf[0]
+    return lpdf
+
+
+def cross_validate_sigma(samples, x, sigmas, **kwargs):
+    """
+    Chooses the standard deviation of a Parzen windows estimator that
+    maximizes the mean log-likelihood of validation points.
+
+    Parameters
+    ----------
+    samples : numpy matrix
+        The kernel centers, see `make_lpdf`.
+    x : numpy matrix
+        The validation points.
+    sigmas : list
+        The candidate standard deviations.
+    kwargs : dict
+        Passed on to `parzen_log_pdf`.
+
+    Returns
+    -------
+    sigma : float
+        The best standard deviation.
+    lls : numpy vector
+        The mean log-likelihood of the validation points for each
+        candidate.
+    """
+    lls = parzen_log_pdf(x, samples, list(sigmas), **kwargs).mean(axis=1)
+    return sigmas[numpy.argmax(lls)], lls
+
+
+class TiledParzenWindows(object):
+    """
+    A Parzen windows estimator evaluated in bounded memory by
+    `parzen_log_pdf`, with the interface of `ParzenWindows`.
+
+    Parameters
+    ----------
+    samples : numpy matrix
+        See description for make_lpdf
+    sigma : scalar
+        See description for make_lpdf
+    batch_size : int, optional
+        See description for parzen_log_pdf
+    center_batch_size : int, optional
+        See description for parzen_log_pdf
+    n_jobs : int, optional
+        See description for parzen_log_pdf
+    """
+    def __init__(self, samples, sigma, batch_size=1000,
+                 center_batch_size=1000, n_jobs=1):
+        self._samples = samples
+        self._sigma = sigma
+        self.batch_size = batch_size
+        self.center_batch_size = center_batch_size
+        self.n_jobs = n_jobs
+
+    def lpdf(self, x):
+        """
+        Evaluates the log-density of each of a set of datapoints.
+
+        Parameters
+        ----------
+        x : numpy matrix
+            The datapoints.
+
+        Returns
+        -------
+        lpdf : numpy vector
+            The log-density of each datapoint.
+        """
+        return parzen_log_pdf(x, self._samples, self._sigma,
+                              batch_size=self.batch_size,
+                              center_batch_size=self.center_batch_size,
+                              n_jobs=self.n_jobs)
+
+    def get_ll(self, x):
+        """
+        Evaluates the log likelihood of a set of datapoints with respect to
+        the probability distribution.
+
+        Parameters
+        ----------
+        x : numpy matrix
+            The set of points for which you want to evaluate the log
+            likelihood.
+        """
+        return self.lpdf(x).mean()
@@ -0,0 +1,55 @@
+"""
+Tests for pylearn2.distributions.parzen
+"""
+import numpy as np
+
+from pylearn2.distributions.parzen import (cross_validate_sigma,
+                                           parzen_log_pdf,
+                                           TiledParzenWindows)
+
+
+def _brute_force_log_pdf(x, samples, sigma):
+    """
+    Evaluates the log-density of a Parzen windows estimator directly.
+    """
+    d2 = ((x[:, None, :] - samples[None, :, :]) ** 2).sum(axis=2)
+    a = -.5 * d2 / sigma ** 2
+    m = a.max(axis=1)
+    log_mean = m + np.log(np.exp(a - m[:, None]).mean(axis=1))
+    return log_mean - x.shape[1] * np.log(sigma * np.sqrt(2 * np.pi))
+
+
+def test_parzen_log_pdf():
+    """
+    Checks the tiled, parallel estimator against a direct evaluation, for
+    tiles that don't divide the numbers of points and samples.
+    """
+    rng = np.random.RandomState(0)
+    samples = rng.normal(size=(53, 5))
+    x = rng.normal(size=(31, 5))
+    sigmas = [.05, .3, 1.]
+    expected = [_brute_force_log_pdf(x, samples, sigma) for sigma in sigmas]
+    for n_jobs in [1, 2]:
+        lpdf = parzen_log_pdf(x, samples, sigmas, batch_size=8,
+                              center_batch_size=10, n_jobs=n_jobs)
+        np.testing.assert_allclose(lpdf, expected, rtol=1e-10)
+
+    pw = TiledParzenWindows(samples.astype('float32'), .3, batch_size=7)
+    assert abs(pw.get_ll(x) - expected[1].mean()) < 1e-3
+
+
+def test_cross_validate_sigma():
+    """
+    Checks that cross-validation picks a kernel width suited to the data.
+    """
+    rng = np.random.RandomState(1)
+    samples = rng.normal(scale=.5, size=(200, 2))
+    valid = rng.normal(scale=.5, size=(100, 2))
+    sigmas = np.array([.001, .2, 10.])
+    sigma, lls = cross_validate_sigma(samples, valid, sigmas,
+                                      center_batch_size=64)
+    assert sigma == .2
+    assert lls.shape == (3,)
+    np.testing.assert_allclose(
+        lls, [_brute_force_log_pdf(valid, samples, s).mean()
+              for s in sigmas])
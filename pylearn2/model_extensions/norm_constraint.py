@@ -55,21 +55,43 @@ class MaxL2FilterNorm(ModelExtension):
 
         if W in updates:
             updated_W = updates[W]
-            l2_norms = T.sqrt(
-                T.square(updated_W).sum(
-                    axis=self.axis, keepdims=True
-                )
-            )
-            if self.min_limit is None:
-                min_limit = 0.
+            node = updated_W.owner
+            if (self.axis == 1 and self.max_limit is not None and
+                    node is not None and node.inputs[0] is W and
+                    isinstance(node.op, T.subtensor.AdvancedIncSubtensor1)):
+                # A row-sparse update (see SGD's sparse_updates): only the
+                # updated rows need to be constrained
+                indices = node.inputs[2]
+                updates[W] = T.set_subtensor(
+                    updated_W[indices],
+                    self._constrain(updated_W[indices]))
             else:
-                min_limit = self.min_limit
+                updates[W] = self._constrain(updated_W)
 
-            if self.max_limit is None:
-                max_limit = l2_norms.max()
-            else:
-                max_limit = self.max_limit
+    def _constrain(self, updated_W):
+        """
+        Returns the weights with their norms clipped to the limits.
+
+        Parameters
+        ----------
+        updated_W : Variable
+            The weights.
+        """
+        l2_norms = T.sqrt(
+            T.square(updated_W).sum(
+                axis=self.axis, keepdims=True
+            )
+        )
+        if self.min_limit is None:
+            min_limit = 0.
+        else:
+            min_limit = self.min_limit
+
+        if self.max_limit is None:
+            max_limit = l2_norms.max()
+        else:
+            max_limit = self.max_limit
 
-            desired_norms = T.clip(l2_norms, min_limit, max_limit)
-            scale = desired_norms / T.maximum(1e-7, l2_norms)
-            updates[W] = updated_W * scale
+        desired_norms = T.clip(l2_norms, min_limit, max_limit)
+        scale = desired_norms / T.maximum(1e-7, l2_norms)
+        return updated_W * scale
@@ -252,8 +252,10 @@ def block(l):
 
 # Make known modules inside this package
 # this needs to come after e.g. flatten(), since DBM depends on flatten()
+from pylearn2.models.dbm.chain_pool import ChainPool
 from pylearn2.models.dbm.dbm import DBM
 from pylearn2.models.dbm.inference_procedure import BiasInit
+from pylearn2.models.dbm.inference_procedure import CompiledMeanField
 from pylearn2.models.dbm.inference_procedure import InferenceProcedure
 from pylearn2.models.dbm.inference_procedure import MoreConsistent
 from pylearn2.models.dbm.inference_procedure import MoreConsistent2
@@ -0,0 +1,287 @@
+"""
+A pool of persistent Markov chains for the negative phase of DBM
+training, with optional parallel tempering.
+"""
+__copyright__ = "Copyright 2010-2015, Universite de Montreal"
+__license__ = "3-clause BSD"
+__maintainer__ = "LISA Lab"
+__email__ = "pylearn-dev@googlegroups"
+
+import logging
+
+import numpy as np
+import theano
+from theano.compat.six.moves import xrange
+import theano.tensor as T
+
+from pylearn2.compat import OrderedDict
+from pylearn2.models.dbm import flatten
+from pylearn2.utils import safe_izip, sharedX
+from pylearn2.utils.rng import make_np_rng, make_theano_rng
+
+
+logger = logging.getLogger(__name__)
+
+
+def _map_state(fn, *states):
+    """
+    Applies a function to the leaves of nested states, such as the
+    (p, h) tuples of `BinaryVectorMaxPool`, keeping their nesting.
+
+    Parameters
+    ----------
+    fn : callable
+        The function, called with one leaf of each state.
+    states : list
+        States with the same nesting.
+
+    Returns
+    -------
+    rval : object
+        The results, nested like the states.
+    """
+    if isinstance(states[0], (list, tuple)):
+        return type(states[0])([_map_state(fn, *elems)
+                                for elems in safe_izip(*states)])
+    return fn(*states)
+
+
+class ChainPool(object):
+    """
+    A pool of persistent chains for the negative phase of a DBM.
+
+    The states of the `num_chains` chains are kept in preallocated
+    shared variables, and each update advances only `num_active` of
+    them, chosen in round-robin order, by `num_gibbs_steps` steps of the
+    DBM's sampling procedure, all within the compiled training function.
+    This decouples the size of the pool from the cost of an update: a
+    large pool mixes better while the negative phase stays cheap.
+
+    With parallel tempering, the pool holds one replica of each chain per
+    inverse temperature. Each replica is advanced at its own temperature,
+    and after the Gibbs steps the states of neighbouring temperatures are
+    swapped with the Metropolis acceptance probability. Only the chains
+    at inverse temperature 1 are used for the negative phase. The DBM
+    at inverse temperature `beta` is obtained by multiplying all of its
+    parameters by `beta`, which tempers the distribution only if the
+    energy is linear in the parameters, as it is for `BinaryVector`,
+    `BinaryVectorMaxPool` and `Softmax` layers.
+
+    Parameters
+    ----------
+    dbm : DBM
+        The model.
+    num_chains : int
+        The number of chains in the pool, at each temperature.
+    num_active : int, optional
+        The number of chains advanced by each update. Defaults to
+        `num_chains`.
+    num_gibbs_steps : int, optional
+        The number of Gibbs steps applied to the active chains by each
+        update.
+    inverse_temperatures : list, optional
+        The inverse temperatures of the replicas, starting with 1 and
+        decreasing. By default, there is no tempering.
+    seed : int or list, optional
+        Seed of the random number generators.
+    """
+
+    def __init__(self, dbm, num_chains, num_active=None, num_gibbs_steps=1,
+                 inverse_temperatures=None, seed=None):
+        if num_active is None:
+            num_active = num_chains
+        if not 0 < num_active <= num_chains:
+            raise ValueError("num_active must be between 1 and num_chains "
+                             "(%d), got %d." % (num_chains, num_active))
+        if inverse_temperatures is None:
+            inverse_temperatures = [1.]
+        inverse_temperatures = [float(beta) for beta in inverse_temperatures]
+        if inverse_temperatures[0] != 1.:
+            raise ValueError("The first inverse temperature must be 1, got "
+                             + str(inverse_temperatures[0]))
+        if any(beta <= 0. for beta in inverse_temperatures) or \
+                any(low >= high for high, low in
+                    zip(inverse_temperatures, inverse_temperatures[1:])):
+            raise ValueError("The inverse temperatures must be positive and "
+                             "decreasing, got " + str(inverse_temperatures))
+
+        self.dbm = dbm
+        self.num_chains = num_chains
+        self.num_active = num_active
+        self.num_gibbs_steps = num_gibbs_steps
+        self.inverse_temperatures = inverse_temperatures
+
+        rng = make_np_rng(seed, [2015, 10, 18],
+                          which_method=['randint', 'uniform'])
+        self.theano_rngs = [make_theano_rng(int(rng.randint(2 ** 30)),
+                                            which_method='uniform')
+                            for beta in inverse_temperatures]
+        self.layers = [dbm.visible_layer] + dbm.hidden_layers
+        self.layer_to_chains = [dbm.make_layer_to_state(num_chains, rng)
+                                for beta in inverse_temperatures]
+        self._cursor = theano.shared(np.asarray(0, dtype='int64'),
+                                     name='chain_pool_cursor')
+
+        self.energy = sharedX(0., name='chain_pool_energy')
+        self.vis_change = sharedX(0., name='chain_pool_vis_change')
+        self.swap_rates = sharedX(np.zeros(len(inverse_temperatures) - 1),
+                                  name='chain_pool_swap_rates')
+
+    def _sample(self, layer_to_state, beta, theano_rng):
+        """
+        Advances chains by `num_gibbs_steps` steps at an inverse
+        temperature.
+
+        Parameters
+        ----------
+        layer_to_state : OrderedDict
+            Maps the layers to the symbolic states of the chains.
+        beta : float
+            The inverse temperature.
+        theano_rng : MRG_RandomStreams
+            The random number generator.
+
+        Returns
+        -------
+        layer_to_updated : OrderedDict
+            Maps the layers to the new states.
+        """
+        dbm = self.dbm
+        dbm.setup_sampling_procedure()
+        updated = dbm.sampling_procedure.sample(
+            layer_to_state, theano_rng, num_steps=self.num_gibbs_steps)
+        if beta == 1.:
+            return updated
+
+        # The tempered sampling graph is the untempered one with scaled
+        # parameters. The random states are left shared, and their
+        # default updates don't depend on the parameters.
+        params = []
+        for layer in self.layers:
+            for param in layer.get_params():
+                if param not in params:
+                    params.append(param)
+        beta = np.cast[theano.config.floatX](beta)
+        replace = OrderedDict((param, beta * param) for param in params)
+        states = [updated[layer] for layer in self.layers]
+        flat_states = theano.clone(flatten(states), replace=replace)
+        flat_states = iter(flat_states)
+        states = _map_state(lambda state: next(flat_states), states)
+        return OrderedDict(safe_izip(self.layers, states))
+
+    def _energy(self, layer_to_state):
+        """
+        Returns the energy of each chain, at inverse temperature 1.
+
+        Parameters
+        ----------
+        layer_to_state : OrderedDict
+            Maps the layers to the symbolic states of the chains.
+
+        Returns
+        -------
+        energy : tensor_like
+            A vector with the energy of each chain.
+        """
+        return self.dbm.energy(layer_to_state[self.dbm.visible_layer],
+                               [layer_to_state[layer]
+                                for layer in self.dbm.hidden_layers])
+
+    def get_updates(self):
+        """
+        Returns the updates that advance the active chains.
+
+        Returns
+        -------
+        updates : OrderedDict
+            Maps the shared variables of the pool to their new values.
+        layer_to_updated : OrderedDict
+            Maps the layers to the new states of the active chains at
+            inverse temperature 1, to use for the negative phase.
+        """
+        cursor = self._cursor
+        index = (cursor + T.arange(self.num_active)) % self.num_chains
+
+        old = []
+        new = []
+        for beta, theano_rng, layer_to_chains in safe_izip(
+                self.inverse_temperatures, self.theano_rngs,
+                self.layer_to_chains):
+            layer_to_state = OrderedDict(
+                (layer, _map_state(lambda chains: chains[index],
+                                   layer_to_chains[layer]))
+                for layer in self.layers)
+            old.append(layer_to_state)
+            new.append(self._sample(layer_to_state, beta, theano_rng))
+
+        updates = OrderedDict()
+        energies = [self._energy(layer_to_updated)
+                    for layer_to_updated in new]
+        swap_rates = []
+        for i in xrange(len(new) - 1):
+            # Swaps the states of temperatures i and i + 1 with probability
+            # min(1, exp((beta_i - beta_{i+1}) (E_i - E_{i+1})))
+            delta = self.inverse_temperatures[i] - \
+                self.inverse_temperatures[i + 1]
+            log_p = delta * (energies[i] - energies[i + 1])
+            u = self.theano_rngs[0].uniform(size=(self.num_active,),
+                                            dtype=theano.config.floatX)
+            swap = T.log(u) < log_p
+            swap_rates.append(T.cast(swap.mean(), theano.config.floatX))
+
+            def select(low, high):
+                mask = swap.dimshuffle(*([0] + ['x'] * (low.ndim - 1)))
+                return T.switch(mask, high, low)
+
+            def select_mirror(low, high):
+                return select(high, low)
+
+            for layer in self.layers:
+                low, high = new[i][layer], new[i + 1][layer]
+                new[i][layer] = _map_state(select, low, high)
+                new[i + 1][layer] = _map_state(select_mirror, low, high)
+            energies[i], energies[i + 1] = (
+                select(energies[i], energies[i + 1]),
+                select_mirror(energies[i], energies[i + 1]))
+
+        def scatter(chains, state):
+            updates[chains] = T.set_subtensor(chains[index], state)
+
+        for layer_to_chains, layer_to_updated in safe_izip(
+                self.layer_to_chains, new):
+            for layer in self.layers:
+                _map_state(scatter, layer_to_chains[layer],
+                           layer_to_updated[layer])
+        updates[cursor] = (cursor + self.num_active) % self.num_chains
+
+        floatX = theano.config.floatX
+        vis = self.dbm.visible_layer
+        updates[self.energy] = T.cast(energies[0].mean(), floatX)
+        updates[self.vis_change] = T.cast(
+            sum(abs(new_vis - old_vis).mean() for new_vis, old_vis
+                in safe_izip(flatten([new[0][vis]]), flatten([old[0][vis]])))
+            / len(flatten([old[0][vis]])), floatX)
+        if swap_rates:
+            updates[self.swap_rates] = T.stack(swap_rates)
+
+        return updates, new[0]
+
+    def get_monitoring_channels(self):
+        """
+        Returns mixing diagnostics of the last update.
+
+        Returns
+        -------
+        channels : OrderedDict
+            `chain_pool_energy` is the mean energy of the active chains
+            at inverse temperature 1, `chain_pool_vis_change` the mean
+            absolute change of their visible units during the update,
+            and `chain_pool_swap_rate_<i>` the fraction of accepted swaps
+            between inverse temperatures i and i + 1.
+        """
+        rval = OrderedDict()
+        rval['chain_pool_energy'] = self.energy
+        rval['chain_pool_vis_change'] = self.vis_change
+        for i in xrange(len(self.inverse_temperatures) - 1):
+            rval['chain_pool_swap_rate_%d' % i] = self.swap_rates[i]
+        return rval
@@ -18,7 +18,7 @@ from theano.gof.op import get_debug_values
 
 from pylearn2.models.dbm import block, flatten
 from pylearn2.models.dbm.layer import Softmax
-from pylearn2.utils import safe_izip, block_gradient, safe_zip
+from pylearn2.utils import function, safe_izip, block_gradient, safe_zip
 
 
 logger = logging.getLogger(__name__)
@@ -81,6 +81,73 @@ class InferenceProcedure(object):
         """
         raise NotImplementedError(str(type(self)) + " does not implement mf.")
 
+    def mf_init(self, V, Y=None):
+        """
+        Returns the mean field state after the first iteration of `mf`,
+        from which `mf_sweep` is iterated. Used by `CompiledMeanField`.
+        Subclasses may implement.
+
+        Parameters
+        ----------
+        V : Input space batch
+            The values of the input features modeled by the DBM.
+        Y : (Optional) Target space batch
+            The values of the labels, if they are observed.
+
+        Returns
+        -------
+        H_hat : list
+            A list with one element per hidden layer, containing the
+            mean field state of that layer. If `Y` is given, the last
+            element is `Y`.
+        """
+        raise NotImplementedError(str(type(self)) + " does not implement "
+                                  "mf_init.")
+
+    def mf_sweep(self, V, H_hat, Y=None):
+        """
+        Performs one iteration of mean field inference: updates the even
+        layers, then the odd layers, from their current neighbours.
+
+        Parameters
+        ----------
+        V : Input space batch
+            The values of the input features modeled by the DBM.
+        H_hat : list
+            The current mean field state of each hidden layer.
+        Y : (Optional) Target space batch
+            The values of the labels, if they are observed. The last
+            layer is then clamped to `Y`.
+
+        Returns
+        -------
+        H_hat : list
+            The updated mean field states.
+        """
+        dbm = self.dbm
+        H_hat = list(H_hat)
+        for parity in [0, 1]:
+            for j in xrange(parity, len(H_hat), 2):
+                if j == 0:
+                    state_below = dbm.visible_layer.upward_state(V)
+                else:
+                    state_below = dbm.hidden_layers[
+                        j - 1].upward_state(H_hat[j - 1])
+                if j == len(H_hat) - 1:
+                    state_above = None
+                    layer_above = None
+                else:
+                    state_above = dbm.hidden_layers[
+                        j + 1].downward_state(H_hat[j + 1])
+                    layer_above = dbm.hidden_layers[j + 1]
+                H_hat[j] = dbm.hidden_layers[j].mf_update(
+                    state_below=state_below,
+                    state_above=state_above,
+                    layer_above=layer_above)
+            if Y is not None:
+                H_hat[-1] = Y
+        return H_hat
+
     def set_batch_size(self, batch_size):
         """
         If the inference procedure is dependent on a batch size at all, makes
@@ -194,19 +261,25 @@ class WeightDoubling(InferenceProcedure):
     Hinton, 2008.
     """
 
-    @functools.wraps(InferenceProcedure.mf)
-    def mf(self, V, Y=None, return_history=False, niter=None, block_grad=None):
-
-        dbm = self.dbm
-
-        assert Y not in [True, False, 0, 1]
-        assert return_history in [True, False, 0, 1]
+    def _first_pass(self, V, Y=None):
+        """
+        Performs the first pass of mean field inference, with doubled
+        bottom-up weights.
 
-        if Y is not None:
-            dbm.hidden_layers[-1].get_output_space().validate(Y)
+        Parameters
+        ----------
+        V : Input space batch
+            The values of the input features modeled by the DBM.
+        Y : (Optional) Target space batch
+            The values of the labels, if they are observed.
 
-        if niter is None:
-            niter = dbm.niter
+        Returns
+        -------
+        H_hat : list
+            A list with one element per hidden layer. If `Y` is given,
+            the last element is `Y`.
+        """
+        dbm = self.dbm
 
         H_hat = []
         for i in xrange(0, len(dbm.hidden_layers) - 1):
@@ -256,6 +329,24 @@ class WeightDoubling(InferenceProcedure):
             # Last layer is clamped to Y
             H_hat[-1] = Y
 
+        return H_hat
+
+    @functools.wraps(InferenceProcedure.mf)
+    def mf(self, V, Y=None, return_history=False, niter=None, block_grad=None):
+
+        dbm = self.dbm
+
+        assert Y not in [True, False, 0, 1]
+        assert return_history in [True, False, 0, 1]
+
+        if Y is not None:
+            dbm.hidden_layers[-1].get_output_space().validate(Y)
+
+        if niter is None:
+            niter = dbm.niter
+
+        H_hat = self._first_pass(V, Y)
+
         if block_grad == 1:
             H_hat = block(H_hat)
 
@@ -337,6 +428,15 @@ class WeightDoubling(InferenceProcedure):
         else:
             return H_hat
 
+    @functools.wraps(InferenceProcedure.mf_init)
+    def mf_init(self, V, Y=None):
+        # The first pass, with the doubled weights, is the first iteration
+        # of mf. It is built directly rather than by calling mf with
+        # niter=1, whose checks expect every state to depend on Y.
+        if Y is not None:
+            self.dbm.hidden_layers[-1].get_output_space().validate(Y)
+        return self._first_pass(V, Y)
+
     @functools.wraps(InferenceProcedure.multi_infer)
     def multi_infer(self, V, return_history=False, niter=None,
                     block_grad=None):
@@ -1059,6 +1159,14 @@ class BiasInit(InferenceProcedure):
         else:
             return H_hat
 
+    @functools.wraps(InferenceProcedure.mf_init)
+    def mf_init(self, V, Y=None):
+        H_hat = [None] + [layer.init_mf_state()
+                          for layer in self.dbm.hidden_layers[1:]]
+        if Y is not None:
+            H_hat[-1] = Y
+        return self.mf_sweep(V, H_hat, Y=Y)
+
     def do_inpainting(self, V, Y=None, drop_mask=None, drop_mask_Y=None,
                       return_history=False, noise=False, niter=None,
                       block_grad=None):
@@ -1509,3 +1617,139 @@ class UpDown(InferenceProcedure):
             if Y is not None:
                 return V_hat, Y_hat
             return V_hat
+
+
+def _unflatten(template, values):
+    """
+    Inverse of `flatten`: arranges a list of objects with the same
+    nesting of lists and tuples as `template`.
+
+    Parameters
+    ----------
+    template : list
+        A nested list, such as a list of mean field states.
+    values : list
+        The objects, in the order given by `flatten(template)`.
+
+    Returns
+    -------
+    rval : list
+        The nested list.
+    """
+    values = iter(values)
+
+    def build(elem):
+        if isinstance(elem, (list, tuple)):
+            return type(elem)([build(sub_elem) for sub_elem in elem])
+        return next(values)
+
+    return build(template)
+
+
+class CompiledMeanField(object):
+
+    """
+    Runs mean field inference in a DBM as a numeric loop over a compiled
+    function that performs a single iteration.
+
+    The graph of `InferenceProcedure.mf` is unrolled over all the `niter`
+    iterations, so its compile time grows with `niter`. This class
+    compiles only the first iteration (`mf_init`) and one iteration of
+    the fixed-point updates (`mf_sweep`), and iterates the latter until
+    the mean field state of the batch stops changing, so easy batches
+    stop early. It only works on numeric batches, and is meant for
+    evaluation: training costs still need the symbolic `mf`.
+
+    Parameters
+    ----------
+    dbm : DBM
+        The model. Its inference procedure must implement `mf_init`, as
+        `WeightDoubling` and `BiasInit` do.
+    tol : float, optional
+        Inference stops when no element of the mean field state changes
+        by more than `tol` during an iteration.
+    max_iter : int, optional
+        The maximum number of iterations, counting the first one.
+        Defaults to `dbm.niter`.
+    supervised : bool, optional
+        If True, the labels are given and the last layer is clamped to
+        them.
+    """
+
+    def __init__(self, dbm, tol=1e-4, max_iter=None, supervised=False):
+        dbm.setup_inference_procedure()
+        inference_procedure = dbm.inference_procedure
+        if max_iter is None:
+            max_iter = dbm.niter
+        if max_iter < 1:
+            raise ValueError("max_iter must be at least 1, got " +
+                             str(max_iter))
+        self.dbm = dbm
+        self.tol = tol
+        self.max_iter = max_iter
+        self.supervised = supervised
+        self.num_steps = None
+
+        V = dbm.get_input_space().make_theano_batch(name='V')
+        inputs = [V]
+        Y = None
+        if supervised:
+            Y = dbm.hidden_layers[-1].get_output_space().make_theano_batch(
+                name='Y')
+            inputs.append(Y)
+        num_inferred = len(dbm.hidden_layers) - int(supervised)
+
+        H_hat = inference_procedure.mf_init(V, Y=Y)[:num_inferred]
+        self._template = H_hat
+        flat_H_hat = flatten(H_hat)
+        self._init = function(inputs, flat_H_hat, name='mf_init')
+
+        state = [elem.type() for elem in flat_H_hat]
+        H_hat = _unflatten(H_hat, state)
+        if supervised:
+            H_hat.append(Y)
+        H_hat = inference_procedure.mf_sweep(V, H_hat, Y=Y)[:num_inferred]
+        flat_H_hat = flatten(H_hat)
+        change = T.max(T.stack([abs(new - old).max()
+                                for new, old in safe_zip(flat_H_hat,
+                                                         state)]))
+        self._step = function(inputs + state, flat_H_hat + [change],
+                              name='mf_step')
+
+    def __call__(self, V, Y=None):
+        """
+        Runs mean field inference on a batch.
+
+        Parameters
+        ----------
+        V : numpy.ndarray
+            The batch of input features.
+        Y : numpy.ndarray, optional
+            The batch of labels. Required if and only if the object was
+            built with `supervised=True`.
+
+        Returns
+        -------
+        H_hat : list
+            A list with one element per inferred hidden layer, containing
+            the numeric mean field state of that layer. If `Y` is given,
+            the last hidden layer is not included.
+        num_steps : int
+            The number of iterations run, also stored in `num_steps`.
+        """
+        if (Y is not None) != self.supervised:
+            raise ValueError("Y must be given if and only if the "
+                             "CompiledMeanField is supervised.")
+        inputs = [V] if Y is None else [V, Y]
+        state = self._init(*inputs)
+        num_steps = 1
+        while num_steps < self.max_iter:
+            outputs = self._step(*(inputs + state))
+            state = outputs[:-1]
+            num_steps += 1
+            if outputs[-1] <= self.tol:
+                break
+        self.num_steps = num_steps
+        logger.debug("Mean field inference converged in {0} "
+                     "iterations".format(num_steps))
+        return _unflatten(self._template, state), num_steps
@@ -17,6 +17,8 @@ __license__ = "3-clause BSD"
 
 import copy
 import functools
+import logging
+import time
 import warnings
 
 import numpy as np
@@ -25,10 +27,11 @@ import theano
 T = theano.tensor
 
 from pylearn2.blocks import StackedBlocks
+from pylearn2.compat import OrderedDict
 from pylearn2.expr.activations import identity
 from pylearn2.models.autoencoder import Autoencoder
 from pylearn2.models.model import Model
-from pylearn2.utils import safe_zip
+from pylearn2.utils import safe_zip, sharedX
 
 # Enforce correct restructured text list format.
 # Be sure to re-run docgen.py and make sure there are no warnings if you
@@ -37,6 +40,9 @@ assert """:
 
 - """ in __doc__
 
+logger = logging.getLogger(__name__)
+
+
 class GSN(StackedBlocks, Model):
     """
     .. todo::
@@ -932,3 +938,119 @@ class JointGSN(GSN):
                                 symbolic=False)
 
         return np.array(data)[:, 0, :, :]
+
+
+class GSNSampler(object):
+    """
+    Runs many chains of a GSN in parallel.
+
+    `GSN.get_samples` either unrolls the walkback steps into one symbolic
+    graph, or calls a compiled step function that takes and returns the
+    activations of all of the layers at each step. Here, the activations
+    of all of the chains are kept in preallocated shared variables, one
+    per layer, which a compiled one-step function updates in place,
+    returning only the layer being sampled. The samples can be streamed
+    to a .npy file, so their number is not limited by memory.
+
+    Parameters
+    ----------
+    gsn : GSN
+        The model. Its corruption, sampling and bias switches are read
+        when the sampler is built.
+    num_chains : int
+        The number of chains.
+    index : int, optional
+        The index of the layer to sample, which may be negative. Defaults
+        to the visible layer.
+
+    Notes
+    -----
+    As in `GSN.get_samples`, the samples are the activations of the layer
+    before sampling and post-activation corruption.
+    """
+
+    def __init__(self, gsn, num_chains, index=0):
+        self.gsn = gsn
+        self.num_chains = num_chains
+        self.index = index % gsn.nlayers
+        self.samples_per_second = None
+
+        sizes = [gsn.aes[0].nvis] + [ae.nhid for ae in gsn.aes]
+        self.activations = [sharedX(np.zeros((num_chains, size)),
+                                    name='gsn_chains_%d' % i)
+                            for i, size in enumerate(sizes)]
+
+        def get_updates(noisy):
+            return OrderedDict((shared, T.cast(value, shared.dtype))
+                               for shared, value in safe_zip(
+                                   self.activations, noisy))
+
+        data = T.matrix('data')
+        noisy = gsn._set_activations([(0, data)], corrupt=True)[gsn.nlayers:]
+        self._init = theano.function([data], [], updates=get_updates(noisy),
+                                     allow_input_downcast=True)
+
+        step = gsn._update(list(self.activations), return_activations=True)
+        sample = T.cast(step[self.index], theano.config.floatX)
+        updates = get_updates(step[gsn.nlayers:])
+        self._step = theano.function([], sample, updates=updates)
+        self._advance = theano.function([], [], updates=updates)
+
+    def reset(self, data):
+        """
+        Starts the chains from visible data.
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            A design matrix. If it has fewer rows than there are chains,
+            its rows are reused cyclically.
+        """
+        data = np.asarray(data)
+        self._init(data[np.arange(self.num_chains) % data.shape[0]])
+
+    def sample(self, num_samples, thin=1, path=None):
+        """
+        Advances the chains and collects their samples.
+
+        After the call, `samples_per_second` holds the number of samples
+        collected per second, over all of the chains.
+
+        Parameters
+        ----------
+        num_samples : int
+            The number of samples to collect from each chain.
+        thin : int, optional
+            The number of steps between two collected samples.
+        path : str, optional
+            If given, the samples are written to this .npy file through
+            a memmap instead of being kept in memory.
+
+        Returns
+        -------
+        samples : numpy.ndarray
+            The samples, of shape (num_samples, num_chains, layer size),
+            as a memmap on `path` if it is given.
+        """
+        dim = self.activations[self.index].get_value(borrow=True).shape[1]
+        shape = (num_samples, self.num_chains, dim)
+        if path is None:
+            samples = np.empty(shape, dtype=theano.config.floatX)
+        else:
+            samples = np.lib.format.open_memmap(
+                path, mode='w+', dtype=theano.config.floatX, shape=shape)
+
+        start = time.time()
+        for i in xrange(num_samples):
+            for _ in xrange(thin - 1):
+                self._advance()
+            samples[i] = self._step()
+        elapsed = max(time.time() - start, 1e-6)
+        if path is not None:
+            samples.flush()
+
+        self.samples_per_second = num_samples * self.num_chains / elapsed
+        logger.info('GSNSampler: %d samples from %d chains in %.2f s '
+                    '(%.1f samples/s)', num_samples, self.num_chains, elapsed,
+                    self.samples_per_second)
+        return samples
@@ -1,7 +1,9 @@
 """K-means as a postprocessing Block subclass."""
 
 import logging
+from multiprocessing.pool import ThreadPool
 import numpy
+import scipy.sparse
 from theano.compat.six.moves import xrange
 from pylearn2.blocks import Block
 from pylearn2.models.model import Model
@@ -10,6 +12,7 @@ from pylearn2.utils import sharedX
 from pylearn2.utils.mem import improve_memory_error_message
 from pylearn2.utils import wraps
 from pylearn2.utils import contains_nan
+from pylearn2.utils.rng import make_np_rng
 import warnings
 
 try:
@@ -18,11 +21,173 @@ except ImportError:
     milk = None
     warnings.warn(""" Install milk ( http://packages.python.org/milk/ )
                     It has a better k-means implementation. Falling back to
-                    our own really slow implementation. """)
+                    our own implementation. """)
 
 logger = logging.getLogger(__name__)
 
 
+def _assign(X, mu, chunk_size=None, pool=None):
+    """
+    Finds the closest mean to each example.
+
+    The squared distances are computed with the expansion
+    ||x||^2 - 2 x.mu + ||mu||^2 so most of the work is done by a matrix
+    product, one chunk of examples at a time so that at most
+    chunk_size * k distances are stored at once per thread.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of examples of shape (n, d)
+    mu : numpy.ndarray
+        Matrix of means of shape (k, d)
+    chunk_size : int, optional
+        Number of examples processed at once. Defaults to all of them.
+    pool : multiprocessing.pool.ThreadPool, optional
+        If given, the chunks are processed in parallel by this pool. The
+        matrix products release the GIL, so threads run concurrently.
+
+    Returns
+    -------
+    assignments : numpy.ndarray
+        Vector of length n containing the index of the closest mean.
+    min_dists : numpy.ndarray
+        Vector of length n containing the squared distance to the
+        closest mean.
+    """
+    n = X.shape[0]
+    if chunk_size is None:
+        chunk_size = n
+    assignments = numpy.zeros(n, dtype='int64')
+    min_dists = numpy.zeros(n, dtype=X.dtype)
+    mu_sq = numpy.square(mu).sum(axis=1)
+
+    def assign_chunk(start):
+        stop = min(start + chunk_size, n)
+        chunk = X[start:stop]
+        try:
+            dists = numpy.dot(chunk, mu.T)
+        except MemoryError as e:
+            improve_memory_error_message(e, "dying trying to allocate "
+                                            "dists matrix for {0} "
+                                            "examples and {1} "
+                                            "means".format(stop - start,
+                                                           mu.shape[0]))
+        dists *= -2.
+        dists += mu_sq
+        assignments[start:stop] = dists.argmin(axis=1)
+        chunk_min = dists[numpy.arange(stop - start),
+                          assignments[start:stop]]
+        chunk_min += numpy.square(chunk).sum(axis=1)
+        # Rounding errors in the expansion can make tiny distances negative
+        min_dists[start:stop] = numpy.maximum(chunk_min, 0.)
+
+    starts = range(0, n, chunk_size)
+    if pool is None:
+        for start in starts:
+            assign_chunk(start)
+    else:
+        pool.map(assign_chunk, starts)
+    return assignments, min_dists
+
+
+def _cluster_sums(X, assignments, k, chunk_size=None):
+    """
+    Sums the examples assigned to each cluster.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of examples of shape (n, d)
+    assignments : numpy.ndarray
+        Vector of length n containing the cluster of each example.
+    k : int
+        Number of clusters
+    chunk_size : int, optional
+        Number of examples processed at once. Defaults to all of them.
+
+    Returns
+    -------
+    sums : numpy.ndarray
+        Matrix of shape (k, d) containing the sum of the examples
+        assigned to each cluster.
+    counts : numpy.ndarray
+        Vector of length k containing the number of examples assigned
+        to each cluster.
+    """
+    n = X.shape[0]
+    if chunk_size is None:
+        chunk_size = n
+    sums = numpy.zeros((k, X.shape[1]), dtype='float64')
+    for start in xrange(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        one_hot = scipy.sparse.csr_matrix(
+            (numpy.ones(stop - start), (assignments[start:stop],
+                                        numpy.arange(stop - start))),
+            shape=(k, stop - start))
+        sums += one_hot.dot(X[start:stop])
+    counts = numpy.bincount(assignments, minlength=k)
+    return sums, counts
+
+
+def kmeans_plus_plus(X, k, rng, chunk_size=None):
+    """
+    Picks initial means with the k-means++ seeding procedure.
+
+    The first mean is an example chosen uniformly at random, and each
+    following one is an example chosen with probability proportional to
+    its squared distance to the closest mean chosen so far.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of examples of shape (n, d)
+    k : int
+        Number of means to pick
+    rng : numpy.random.RandomState
+        Random number generator
+    chunk_size : int, optional
+        Number of examples processed at once when updating the
+        distances. Defaults to all of them.
+
+    Returns
+    -------
+    mu : numpy.ndarray
+        Matrix of shape (k, d) containing the initial means.
+
+    References
+    ----------
+    .. [1] D. Arthur and S. Vassilvitskii. "k-means++: The Advantages of
+       Careful Seeding". SODA 2007.
+    """
+    n = X.shape[0]
+    if chunk_size is None:
+        chunk_size = n
+    mu = numpy.zeros((k, X.shape[1]), dtype=X.dtype)
+    mu[0] = X[rng.randint(n)]
+    min_dists = numpy.zeros(n, dtype='float64')
+    for start in xrange(0, n, chunk_size):
+        min_dists[start:start + chunk_size] = numpy.square(
+            X[start:start + chunk_size] - mu[0]).sum(axis=1)
+    for i in xrange(1, k):
+        total = min_dists.sum()
+        if total > 0:
+            cumulative = numpy.cumsum(min_dists)
+            idx = numpy.searchsorted(cumulative, rng.uniform(0., total),
+                                     side='right')
+            idx = min(idx, n - 1)
+        else:
+            # All the examples coincide with a mean already
+            idx = rng.randint(n)
+        mu[i] = X[idx]
+        for start in xrange(0, n, chunk_size):
+            dists = numpy.square(X[start:start + chunk_size] -
+                                 mu[i]).sum(axis=1)
+            numpy.minimum(min_dists[start:start + chunk_size], dists,
+                          out=min_dists[start:start + chunk_size])
+    return mu
+
+
 class KMeans(Block, Model):
     """
     Block that outputs a vector of probabilities that a sample belong
@@ -38,13 +203,35 @@ class KMeans(Block, Model):
         Threshold of distance to clusters under which k-means stops
         iterating.
     max_iter : int, optional
-        Maximum number of iterations. Defaults to infinity.
+        Maximum number of iterations. Defaults to infinity. In mini-batch
+        mode, each mini-batch update counts as one iteration.
     verbose : bool
         WRITEME
+    init : str, optional
+        How to pick the initial means when they are not given to
+        `train_all`: 'random' picks k random examples, 'kmeans++' uses
+        k-means++ seeding.
+    batch_size : int, optional
+        If given, trains with mini-batch k-means (Sculley, 2010): each
+        iteration assigns a random mini-batch of examples and moves each
+        mean towards the examples assigned to it with a per-mean learning
+        rate of 1 / (number of examples assigned to it so far).
+        Convergence is then tested on an exponential moving average of
+        the mini-batch cost.
+    chunk_size : int, optional
+        Number of examples whose distances to the means are computed at
+        once. Bounds the memory used by the distance computation to
+        O(chunk_size * k) per thread. Defaults to 10000.
+    n_jobs : int, optional
+        Number of threads used to assign examples to means.
+    seed : int or list, optional
+        Seed for the random number generator used to initialize the means
+        and draw the mini-batches.
     """
 
     def __init__(self, k, nvis, convergence_th=1e-6, max_iter=None,
-                 verbose=False):
+                 verbose=False, init='random', batch_size=None,
+                 chunk_size=10000, n_jobs=1, seed=None):
         Block.__init__(self)
         Model.__init__(self)
 
@@ -62,6 +249,106 @@ class KMeans(Block, Model):
 
         self.verbose = verbose
 
+        if init not in ['random', 'kmeans++']:
+            raise ValueError("KMeans init: init should be 'random' or "
+                             "'kmeans++', got " + str(init))
+        self.init = init
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+        self.rng = make_np_rng(seed, [2012, 11, 6],
+                               which_method=['randint', 'uniform'])
+
+    def _init_mu(self, X):
+        """
+        Picks the initial means according to `self.init`.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of examples of shape (n, d)
+
+        Returns
+        -------
+        mu : numpy.ndarray
+            Matrix of shape (k, d) containing the initial means.
+        """
+        if self.init == 'kmeans++':
+            if self.batch_size is not None:
+                # Seed from a subsample, so the seeding doesn't cost more
+                # than the mini-batch updates themselves
+                init_size = min(X.shape[0], 3 * max(self.batch_size, self.k))
+                indices = self.rng.permutation(X.shape[0])[:init_size]
+                sample = X[numpy.sort(indices)]
+            else:
+                sample = X
+            return kmeans_plus_plus(sample, self.k, self.rng,
+                                    self.chunk_size)
+        indices = self.rng.randint(X.shape[0], size=self.k)
+        return X[indices].copy()
+
+    def _train_mini_batch(self, X, mu, pool):
+        """
+        Runs mini-batch k-means.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of examples of shape (n, d)
+        mu : numpy.ndarray
+            Matrix of shape (k, d) containing the initial means. It is
+            updated in place.
+        pool : multiprocessing.pool.ThreadPool or None
+            Pool used to assign examples to means.
+
+        Returns
+        -------
+        mu : numpy.ndarray or None
+            The final means, or None if a NaN was found.
+        """
+        n = X.shape[0]
+        batch_size = min(self.batch_size, n)
+        counts = numpy.zeros(self.k, dtype='float64')
+        # Weight of each new mini-batch in the moving average of the
+        # cost: roughly an average over one pass through the data.
+        decay = min(1., 2. * batch_size / (n + 1.))
+        ewa_cost = prev_ewa_cost = None
+        iter = 0
+        while True:
+            batch = X[numpy.sort(self.rng.randint(n, size=batch_size))]
+            assignments, min_dists = _assign(batch, mu, self.chunk_size,
+                                             pool)
+            cost = min_dists.mean()
+            prev_ewa_cost = ewa_cost
+            if ewa_cost is None:
+                ewa_cost = cost
+            else:
+                ewa_cost = (1. - decay) * ewa_cost + decay * cost
+            if self.verbose:
+                logger.info('kmeans mini-batch iter {0} cost: {1} '
+                            'smoothed cost: {2}'.format(iter, cost,
+                                                        ewa_cost))
+            sums, batch_counts = _cluster_sums(batch, assignments, self.k,
+                                               self.chunk_size)
+            counts += batch_counts
+            updated = batch_counts > 0
+            # Running mean of all the examples ever assigned to each mean,
+            # equivalent to a per-mean learning rate of 1 / counts
+            mu[updated] += ((sums[updated] -
+                             batch_counts[updated, None] * mu[updated]) /
+                            counts[updated, None])
+            if contains_nan(mu):
+                logger.info('nan found')
+                return None
+            iter += 1
+            if iter >= self.max_iter:
+                break
+            if (prev_ewa_cost is not None and
+                    abs(ewa_cost - prev_ewa_cost) < self.convergence_th):
+                break
+        logger.info('cost: {0}'.format(ewa_cost))
+        return mu
+
     def train_all(self, dataset, mu=None):
         """
         Process kmeans algorithm on the input to localize clusters.
@@ -84,7 +371,15 @@ class KMeans(Block, Model):
         n, m = X.shape
         k = self.k
 
-        if milk is not None:
+        if mu is not None:
+            if not len(mu) == k:
+                raise Exception("You gave %i clusters"
+                                ", but k=%i were expected"
+                                % (len(mu), k))
+            mu = numpy.array(mu, dtype=X.dtype)
+
+        if (milk is not None and mu is None and self.init == 'random' and
+                self.batch_size is None):
             # use the milk implementation of k-means if it's available
             cluster_ids, mu = milk.kmeans(X, k)
         else:
@@ -92,107 +387,103 @@ class KMeans(Block, Model):
 
             # taking random inputs as initial clusters if user does not provide
             # them.
-            if mu is not None:
-                if not len(mu) == k:
-                    raise Exception("You gave %i clusters"
-                                    ", but k=%i were expected"
-                                    % (len(mu), k))
-            else:
-                indices = numpy.random.randint(X.shape[0], size=k)
-                mu = X[indices]
+            if mu is None:
+                mu = self._init_mu(X)
 
+            if self.n_jobs > 1:
+                pool = ThreadPool(self.n_jobs)
+            else:
+                pool = None
             try:
-                dists = numpy.zeros((n, k))
-            except MemoryError as e:
-                improve_memory_error_message(e, "dying trying to allocate "
-                                                "dists matrix for {0} "
-                                                "examples and {1} "
-                                                "means".format(n, k))
-
-            old_kills = {}
-
-            iter = 0
-            mmd = prev_mmd = float('inf')
-            while True:
-                if self.verbose:
-                    logger.info('kmeans iter {0}'.format(iter))
-
-                # print 'iter:',iter,' conv crit:',abs(mmd-prev_mmd)
-                # if numpy.sum(numpy.isnan(mu)) > 0:
-                if contains_nan(mu):
-                    logger.info('nan found')
-                    return X
-
-                # computing distances
-                for i in xrange(k):
-                    dists[:, i] = numpy.square((X - mu[i, :])).sum(axis=1)
-
-                if iter > 0:
-                    prev_mmd = mmd
-
-                min_dists = dists.min(axis=1)
-
-                # mean minimum distance:
-                mmd = min_dists.mean()
-
-                logger.info('cost: {0}'.format(mmd))
-
-                if iter > 0 and (iter >= self.max_iter or
-                                 abs(mmd - prev_mmd) < self.convergence_th):
-                    # converged
-                    break
-
-                # finding minimum distances
-                min_dist_inds = dists.argmin(axis=1)
-
-                # computing means
-                i = 0
-                blacklist = []
-                new_kills = {}
-                while i < k:
-                    b = min_dist_inds == i
-                    if not numpy.any(b):
-                        killed_on_prev_iter = True
-                        # initializes empty cluster to be the mean of the d
-                        # data points farthest from their corresponding means
-                        if i in old_kills:
-                            d = old_kills[i] - 1
-                            if d == 0:
-                                d = 50
-                            new_kills[i] = d
-                        else:
-                            d = 5
-                        mu[i, :] = 0
-                        for j in xrange(d):
-                            idx = numpy.argmax(min_dists)
-                            min_dists[idx] = 0
-                            # chose point idx
-                            mu[i, :] += X[idx, :]
-                            blacklist.append(idx)
-                        mu[i, :] /= float(d)
-                        # cluster i was empty, reset it to d far out data
-                        # points recomputing distances for this cluster
-                        dists[:, i] = numpy.square((X - mu[i, :])).sum(axis=1)
-                        min_dists = dists.min(axis=1)
-                        for idx in blacklist:
-                            min_dists[idx] = 0
-                        min_dist_inds = dists.argmin(axis=1)
-                        # done
-                        i += 1
-                    else:
-                        mu[i, :] = numpy.mean(X[b, :], axis=0)
-                        if contains_nan(mu):
-                            logger.info('nan found at {0}'.format(i))
-                            return X
-                        i += 1
-
-                old_kills = new_kills
-
-                iter += 1
+                if self.batch_size is not None:
+                    mu = self._train_mini_batch(X, mu, pool)
+                else:
+                    mu = self._train_lloyd(X, mu, pool)
+            finally:
+                if pool is not None:
+                    pool.close()
+            if mu is None:
+                return X
 
         self.mu = sharedX(mu)
         self._params = [self.mu]
 
+    def _train_lloyd(self, X, mu, pool):
+        """
+        Runs the standard k-means algorithm over the whole dataset.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of examples of shape (n, d)
+        mu : numpy.ndarray
+            Matrix of shape (k, d) containing the initial means. It is
+            updated in place.
+        pool : multiprocessing.pool.ThreadPool or None
+            Pool used to assign examples to means.
+
+        Returns
+        -------
+        mu : numpy.ndarray or None
+            The final means, or None if a NaN was found.
+        """
+        k = self.k
+        old_kills = {}
+
+        iter = 0
+        mmd = prev_mmd = float('inf')
+        while True:
+            if self.verbose:
+                logger.info('kmeans iter {0}'.format(iter))
+
+            if contains_nan(mu):
+                logger.info('nan found')
+                return None
+
+            min_dist_inds, min_dists = _assign(X, mu, self.chunk_size, pool)
+
+            if iter > 0:
+                prev_mmd = mmd
+
+            # mean minimum distance:
+            mmd = min_dists.mean()
+
+            logger.info('cost: {0}'.format(mmd))
+
+            if iter > 0 and (iter >= self.max_iter or
+                             abs(mmd - prev_mmd) < self.convergence_th):
+                # converged
+                break
+
+            # computing means
+            sums, counts = _cluster_sums(X, min_dist_inds, k,
+                                         self.chunk_size)
+            nonempty = counts > 0
+            mu[nonempty] = sums[nonempty] / counts[nonempty, None]
+
+            new_kills = {}
+            for i in numpy.where(~nonempty)[0]:
+                # initializes empty cluster to be the mean of the d
+                # data points farthest from their corresponding means
+                if i in old_kills:
+                    d = old_kills[i] - 1
+                    if d == 0:
+                        d = 50
+                    new_kills[i] = d
+                else:
+                    d = 5
+                d = min(d, len(min_dists))
+                farthest = numpy.argsort(min_dists)[-d:]
+                mu[i, :] = X[farthest].mean(axis=0)
+                # don't use the same points for other empty clusters
+                min_dists[farthest] = 0
+
+            old_kills = new_kills
+
+            iter += 1
+
+        return mu
+
     @wraps(Model.continue_learning)
     def continue_learning(self):
         # One call to train_all currently trains the model fully,
@@ -226,12 +517,13 @@ class KMeans(Block, Model):
         -------
         WRITEME
         """
-        n, m = X.shape
-        k = self.k
         mu = self.mu
-        dists = numpy.zeros((n, k))
-        for i in xrange(k):
-            dists[:, i] = numpy.square((X - mu[i, :])).sum(axis=1)
+        if hasattr(mu, 'get_value'):
+            mu = mu.get_value()
+        dists = numpy.dot(X, -2. * mu.T)
+        dists += numpy.square(mu).sum(axis=1)
+        dists += numpy.square(X).sum(axis=1)[:, None]
+        dists = numpy.maximum(dists, 0.)
         return dists / dists.sum(axis=1).reshape(-1, 1)
 
     def get_weights(self):
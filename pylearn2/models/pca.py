@@ -53,6 +53,7 @@ except ImportError:
 # Local imports
 from pylearn2.blocks import Block
 from pylearn2.utils import sharedX
+from pylearn2.utils.rng import make_np_rng
 
 
 logger = logging.getLogger()
@@ -508,6 +509,280 @@ class SVDPCA(_PCABase):
         return s ** 2, Vh.T
 
 
+class RandomizedPCA(_PCABase):
+    """
+    PCA using a randomized truncated SVD (Halko et al., 2011).
+
+    Only the leading `num_components` components are computed, with a cost
+    of O(n * d * (num_components + oversampling)) per pass over the data
+    instead of the O(n * d^2 + d^3) of `CovEigPCA`, so it is much faster
+    when `num_components` is much smaller than the input dimension. The
+    data is never centered in place, so no centered copy of the data is
+    made.
+
+    The eigenvalues are those of the covariance matrix, as with
+    `CovEigPCA`.
+
+    Parameters
+    ----------
+    num_components : int
+        Number of components to compute. Unlike the other PCA classes,
+        this is required.
+    oversampling : int, optional
+        Number of extra random directions used to capture the range of
+        the data. More makes the result more accurate.
+    n_iter : int, optional
+        Number of power iterations. More makes the result more accurate
+        when the spectrum decays slowly, at the cost of two extra passes
+        over the data per iteration.
+    seed : int or list, optional
+        Seed for the random projection.
+    kwargs : dict
+        Passed on to the superclass.
+
+    References
+    ----------
+    .. [1] N. Halko, P. G. Martinsson, and J. A. Tropp. "Finding Structure
+       with Randomness: Probabilistic Algorithms for Constructing
+       Approximate Matrix Decompositions". SIAM Review, 2011.
+    """
+
+    def __init__(self, num_components, oversampling=10, n_iter=4, seed=None,
+                 **kwargs):
+        super(RandomizedPCA, self).__init__(num_components=num_components,
+                                            **kwargs)
+        self.oversampling = oversampling
+        self.n_iter = n_iter
+        self.rng = make_np_rng(seed, [2015, 3, 7], which_method='normal')
+
+    def train(self, X, mean=None):
+        """
+        Compute the PCA transformation matrix.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of shape (n, d) on which to train PCA
+        mean : numpy.ndarray, optional
+            Feature means of shape (d,). If provided, X is assumed to be
+            centered already.
+        """
+        # self.mean_ is what _cov_eigen still has to subtract from X
+        if mean is None:
+            mean = X.mean(axis=0)
+            self.mean_ = mean
+        else:
+            self.mean_ = numpy.zeros_like(mean)
+        super(RandomizedPCA, self).train(X, mean=mean)
+
+    def _cov_eigen(self, X):
+        """
+        Compute the leading eigen{values,vectors} of the covariance matrix
+        with a randomized SVD of the implicitly centered data.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of shape (n, d), not centered. `self.mean_` is
+            subtracted implicitly.
+
+        Returns
+        -------
+        v : numpy.ndarray
+            Leading eigenvalues in decreasing order
+        W : numpy.ndarray
+            Matrix containing the corresponding eigenvectors in its columns
+        """
+        n, d = X.shape
+        num_components = min(self.num_components, n, d)
+        num_random = min(num_components + self.oversampling, n, d)
+        mean = self.mean_.astype(X.dtype)
+
+        # (X - 1 mean') M and (X - 1 mean')' M without forming X - 1 mean'
+        def centered_dot(M):
+            return numpy.dot(X, M) - numpy.dot(mean, M)
+
+        def centered_dot_t(M):
+            return numpy.dot(X.T, M) - numpy.outer(mean, M.sum(axis=0))
+
+        omega = self.rng.normal(size=(d, num_random)).astype(X.dtype)
+        Q, _ = linalg.qr(centered_dot(omega), mode='economic')
+        for i in xrange(self.n_iter):
+            # Orthonormalize between products to avoid losing the small
+            # singular values to rounding errors
+            Z, _ = linalg.qr(centered_dot_t(Q), mode='economic')
+            Q, _ = linalg.qr(centered_dot(Z), mode='economic')
+        # B = Q' (X - 1 mean') is only num_random x d
+        B = centered_dot_t(Q).T
+        _, s, Vh = linalg.svd(B, full_matrices=False)
+        s = s[:num_components]
+        W = Vh[:num_components].T
+        return s ** 2 / max(n - 1, 1), W
+
+
+class IncrementalPCA(_PCABase):
+    """
+    PCA computed from blocks of examples with an incremental SVD
+    (Ross et al., 2008).
+
+    The data is consumed `batch_size` examples at a time, keeping only
+    the running mean and the leading `num_components` singular values and
+    vectors in memory, so the data never needs to fit in memory (it can
+    be a memory-mapped array or come from a dataset iterator). Each block
+    costs one SVD of a (num_components + batch_size + 1) x d matrix.
+
+    The result is exact when `num_components` is at least the rank of
+    the data and approximate otherwise. The eigenvalues are those of the
+    covariance matrix, as with `CovEigPCA`.
+
+    Parameters
+    ----------
+    num_components : int
+        Number of components to keep. Unlike the other PCA classes, this
+        is required.
+    batch_size : int, optional
+        Number of examples per block.
+    kwargs : dict
+        Passed on to the superclass.
+
+    References
+    ----------
+    .. [1] D. Ross, J. Lim, R. Lin, and M. Yang. "Incremental Learning for
+       Robust Visual Tracking". International Journal of Computer Vision,
+       2008.
+    """
+
+    def __init__(self, num_components, batch_size=1000, **kwargs):
+        super(IncrementalPCA, self).__init__(num_components=num_components,
+                                             **kwargs)
+        self.batch_size = batch_size
+        self._reset()
+
+    def _reset(self):
+        """
+        Forgets all the examples seen so far.
+        """
+        self.n_seen_ = 0
+        self.mean_ = None
+        self.singular_values_ = None
+        self.components_ = None
+
+    def partial_train(self, X):
+        """
+        Updates the running mean and singular vectors with a block of
+        examples. Call `finish_training` once all the blocks have been
+        seen.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of shape (b, d) containing a block of examples.
+        """
+        X = numpy.asarray(X, dtype='float64')
+        b = X.shape[0]
+        if b == 0:
+            return
+        batch_mean = X.mean(axis=0)
+        if self.n_seen_ == 0:
+            stacked = X - batch_mean
+            new_mean = batch_mean
+        else:
+            n = self.n_seen_
+            new_mean = self.mean_ + (batch_mean - self.mean_) * b / (n + b)
+            # The correction term accounts for the shift of the mean
+            correction = (numpy.sqrt(n * b / float(n + b)) *
+                          (self.mean_ - batch_mean))
+            stacked = numpy.vstack((
+                self.singular_values_[:, None] * self.components_,
+                X - batch_mean,
+                correction[None, :]))
+        k = self.num_components
+        if stacked.shape[0] < stacked.shape[1]:
+            # Diagonalizing the Gram matrix of the rows is much cheaper than
+            # an SVD when the block is wide, and accurate enough for the
+            # leading components
+            w, U = linalg.eigh(numpy.dot(stacked, stacked.T))
+            w, U = w[::-1][:k], U[:, ::-1][:, :k]
+            s = numpy.sqrt(numpy.maximum(w, 0.))
+            Vh = numpy.dot(U.T, stacked) / numpy.where(s > 0, s, 1.)[:, None]
+        else:
+            _, s, Vh = linalg.svd(stacked, full_matrices=False)
+        self.n_seen_ += b
+        self.mean_ = new_mean
+        self.singular_values_ = s[:k]
+        self.components_ = Vh[:k]
+
+    def finish_training(self):
+        """
+        Builds the PCA transformation from the blocks given to
+        `partial_train`.
+        """
+        if self.n_seen_ == 0:
+            raise ValueError("IncrementalPCA has not seen any examples.")
+        super(IncrementalPCA, self).train(
+            numpy.zeros((0, self.mean_.shape[0])), mean=self.mean_)
+
+    def train(self, X, mean=None):
+        """
+        Compute the PCA transformation matrix from a design matrix,
+        `batch_size` examples at a time.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of shape (n, d) on which to train PCA. Can be a
+            memory-mapped array.
+        mean : numpy.ndarray, optional
+            Not supported, must be None. The mean is computed
+            incrementally.
+        """
+        if mean is not None:
+            raise NotImplementedError("IncrementalPCA computes the mean "
+                                      "itself.")
+        self._reset()
+        for i in xrange(0, X.shape[0], self.batch_size):
+            self.partial_train(X[i:i + self.batch_size])
+        self.finish_training()
+
+    def train_iterator(self, iterator):
+        """
+        Compute the PCA transformation matrix from an iterator over
+        blocks of examples, e.g. the iterator returned by
+        `dataset.iterator(mode='sequential', batch_size=batch_size,
+        data_specs=(VectorSpace(dim), 'features'))`.
+
+        Parameters
+        ----------
+        iterator : iterable
+            Yields matrices of shape (b, d).
+        """
+        self._reset()
+        for batch in iterator:
+            self.partial_train(batch)
+        self.finish_training()
+
+    def _cov_eigen(self, X):
+        """
+        Returns the eigen{values,vectors} of the covariance matrix from the
+        singular values and vectors accumulated by `partial_train`. `X`
+        is ignored.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Ignored.
+
+        Returns
+        -------
+        v : numpy.ndarray
+            Leading eigenvalues in decreasing order
+        W : numpy.ndarray
+            Matrix containing the corresponding eigenvectors in its columns
+        """
+        v = self.singular_values_ ** 2 / max(self.n_seen_ - 1, 1)
+        return v, self.components_.T
+
+
 class SparsePCA(_PCABase):
     """
     .. todo::
@@ -833,7 +1108,8 @@ if __name__ == "__main__":
                         help='File where the PCA pickle will be saved')
     parser.add_argument('-a', '--algorithm', action='store',
                         type=str,
-                        choices=['cov_eig', 'svd', 'online'],
+                        choices=['cov_eig', 'svd', 'online', 'randomized',
+                                 'incremental'],
                         default='cov_eig',
                         required=False,
                         help='Which algorithm to use to compute the PCA')
@@ -841,7 +1117,8 @@ if __name__ == "__main__":
                         type=int,
                         default=500,
                         required=False,
-                        help='Size of minibatches used in online algorithm')
+                        help='Size of minibatches used in online and '
+                             'incremental algorithms')
     parser.add_argument('-n', '--num-components', action='store',
                         type=int,
                         default=None,
@@ -883,6 +1160,11 @@ if __name__ == "__main__":
     elif args.algorithm == 'online':
         PCAImpl = OnlinePCA
         conf['minibatch_size'] = args.minibatch_size
+    elif args.algorithm == 'randomized':
+        PCAImpl = RandomizedPCA
+    elif args.algorithm == 'incremental':
+        PCAImpl = IncrementalPCA
+        conf['batch_size'] = args.minibatch_size
     else:
         # This should never happen.
         raise NotImplementedError(args.algorithm)
@@ -2429,3 +2429,194 @@ class E_Step_Scan(E_Step):
                 'var_s0_hat' : var_s0_hat,
                 'var_s1_hat': var_s1_hat,
                 }
+
+
+class CompiledEStep(object):
+    """
+    Runs the damped fixed point updates of an E-step until each example
+    has converged, for fast feature extraction.
+
+    `E_Step` and `E_Step_Scan` apply the same number of updates to every
+    example of a batch. Here, the updates are compiled into a function
+    applied to a pool of active examples, and the truncated KL
+    divergence of each example is computed after each update. An example
+    is frozen as soon as its KL divergence changes by at most `tol`, or
+    after `max_iter` updates, and is removed from the pool, which is then
+    refilled with new examples. The matrix products thus always run on
+    a full batch of unconverged examples.
+
+    The damping coefficients of the i-th update of an example are the
+    i-th ones of the schedules of the E-step; the last ones are reused
+    beyond the end of the schedules.
+
+    Parameters
+    ----------
+    e_step : E_Step
+        An autonomous E-step, registered with its model. It provides the
+        updates, the damping schedules and the reflection clipping. Note
+        that the ceiling of the reflection clipping is computed over the
+        pool rather than over a batch.
+    tol : float, optional
+        An example has converged when its truncated KL divergence changes
+        by at most `tol` during an update. A negative value disables
+        early stopping.
+    max_iter : int, optional
+        The maximum number of updates applied to an example. Defaults to
+        the length of the damping schedules.
+    """
+
+    def __init__(self, e_step, tol=1e-4, max_iter=None):
+        if not e_step.autonomous:
+            raise ValueError("CompiledEStep needs an autonomous E-step, "
+                             "with damping schedules.")
+        model = e_step.model
+        if model is None:
+            raise ValueError("The E-step is not registered with a model.")
+        if model.recycle_q:
+            raise ValueError("CompiledEStep does not support recycle_q, "
+                             "since its batches change size.")
+
+        def schedule(coeffs):
+            if hasattr(coeffs, 'get_value'):
+                coeffs = coeffs.get_value()
+            return np.cast[config.floatX](coeffs)
+
+        self.h_new_coeff_schedule = schedule(e_step.h_new_coeff_schedule)
+        self.s_new_coeff_schedule = schedule(e_step.s_new_coeff_schedule)
+        if max_iter is None:
+            max_iter = len(self.h_new_coeff_schedule)
+        if max_iter < 1:
+            raise ValueError("max_iter must be positive, got %d" % max_iter)
+        self.e_step = e_step
+        self.tol = tol
+        self.max_iter = max_iter
+
+        if not hasattr(model, 'w'):
+            model.make_pseudoparams()
+
+        V = T.matrix(name='V')
+        H_hat = T.matrix(name='H_hat')
+        S_hat = T.matrix(name='S_hat')
+        new_H_coeff = T.vector(name='new_H_coeff')
+        new_S_coeff = T.vector(name='new_S_coeff')
+
+        self._init = function([V], [e_step.init_H_hat(V),
+                                    e_step.init_S_hat(V)])
+
+        new_S_hat = e_step.infer_S_hat(V, H_hat, S_hat)
+        if e_step.clip_reflections:
+            new_S_hat = reflection_clip(S_hat=S_hat, new_S_hat=new_S_hat,
+                                        rho=e_step.rho)
+        new_S_hat = damp(old=S_hat, new=new_S_hat,
+                         new_coeff=new_S_coeff.dimshuffle(0, 'x'))
+        new_H_hat = damp(old=H_hat,
+                         new=e_step.infer_H_hat(V, H_hat, new_S_hat),
+                         new_coeff=new_H_coeff.dimshuffle(0, 'x'))
+        obs = {'H_hat': new_H_hat,
+               'S_hat': new_S_hat,
+               'var_s0_hat': e_step.infer_var_s0_hat(),
+               'var_s1_hat': e_step.infer_var_s1_hat()}
+        KL = e_step.truncated_KL(V, obs=obs)
+        self._step = function([V, H_hat, S_hat, new_H_coeff, new_S_coeff],
+                              [new_H_hat, new_S_hat, KL])
+
+        self.num_steps = None
+        self.kl = None
+        self.converged = None
+
+    def __call__(self, X, batch_size=None):
+        """
+        Infers the variational parameters of a design matrix.
+
+        After the call, `num_steps` holds the number of updates applied to
+        each example, `kl` the final truncated KL divergence of each
+        example, and `converged` whether each example stopped before
+        `max_iter` updates.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            The design matrix.
+        batch_size : int, optional
+            The number of examples updated together. Defaults to all of
+            them.
+
+        Returns
+        -------
+        obs : dict
+            `H_hat` and `S_hat`, the variational parameters of each
+            example.
+        """
+        X = np.cast[config.floatX](X)
+        num_examples = X.shape[0]
+        if batch_size is None:
+            batch_size = num_examples
+        nhid = self.e_step.model.nhid
+        last = len(self.h_new_coeff_schedule) - 1
+
+        H_hat = np.zeros((num_examples, nhid), dtype=config.floatX)
+        S_hat = np.zeros((num_examples, nhid), dtype=config.floatX)
+        num_steps = np.zeros(num_examples, dtype='int64')
+        kl = np.zeros(num_examples, dtype=config.floatX)
+        converged = np.zeros(num_examples, dtype='bool')
+
+        # The pool of active examples
+        index = np.zeros(0, dtype='int64')
+        V_a = X[:0]
+        H_a = H_hat[:0]
+        S_a = S_hat[:0]
+        kl_a = kl[:0]
+        steps_a = num_steps[:0]
+        next_example = 0
+
+        while True:
+            num_new = min(batch_size - len(index),
+                          num_examples - next_example)
+            if num_new > 0:
+                new_index = np.arange(next_example, next_example + num_new)
+                next_example += num_new
+                V_new = X[new_index]
+                H_new, S_new = self._init(V_new)
+                index = np.concatenate((index, new_index))
+                V_a = np.concatenate((V_a, V_new))
+                H_a = np.concatenate((H_a, H_new))
+                S_a = np.concatenate((S_a, S_new))
+                kl_a = np.concatenate((kl_a, np.zeros(
+                    num_new, dtype=config.floatX) + np.inf))
+                steps_a = np.concatenate((steps_a,
+                                          np.zeros(num_new, dtype='int64')))
+            if len(index) == 0:
+                break
+
+            schedule_index = np.minimum(steps_a, last)
+            H_a, S_a, new_kl_a = self._step(
+                V_a, H_a, S_a, self.h_new_coeff_schedule[schedule_index],
+                self.s_new_coeff_schedule[schedule_index])
+            steps_a += 1
+            stop = abs(new_kl_a - kl_a) <= self.tol
+            converged[index[stop]] = True
+            stop |= steps_a >= self.max_iter
+            kl_a = new_kl_a
+
+            if stop.any():
+                done = index[stop]
+                H_hat[done] = H_a[stop]
+                S_hat[done] = S_a[stop]
+                kl[done] = kl_a[stop]
+                num_steps[done] = steps_a[stop]
+                keep = ~stop
+                index = index[keep]
+                V_a = V_a[keep]
+                H_a = H_a[keep]
+                S_a = S_a[keep]
+                kl_a = kl_a[keep]
+                steps_a = steps_a[keep]
+
+        self.num_steps = num_steps
+        self.kl = kl
+        self.converged = converged
+        logger.debug('CompiledEStep: %d examples, %.2f updates per example, '
+                     '%d converged', num_examples, num_steps.mean(),
+                     converged.sum())
+
+        return {'H_hat': H_hat, 'S_hat': S_hat}
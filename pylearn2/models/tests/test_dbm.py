@@ -1,6 +1,9 @@
 from __future__ import print_function
 
+from pylearn2.models.dbm import ChainPool, flatten
 from pylearn2.models.dbm.dbm import DBM
+from pylearn2.models.dbm.inference_procedure import (BiasInit,
+                                                     CompiledMeanField)
 from pylearn2.models.dbm.layer import BinaryVector, BinaryVectorMaxPool, Softmax, GaussianVisLayer
 
 __authors__ = "Ian Goodfellow"
@@ -21,7 +24,7 @@ from theano import tensor as T
 
 from pylearn2.expr.basic import is_binary
 from pylearn2.expr.nnet import inverse_sigmoid_numpy
-from pylearn2.costs.dbm import VariationalCD
+from pylearn2.costs.dbm import PooledPCD, VariationalCD
 import pylearn2.testing.datasets as datasets
 from pylearn2.space import VectorSpace
 from pylearn2.utils import sharedX
@@ -1196,6 +1199,107 @@ def test_variational_cd():
     grads, updates = cost.get_gradients(model, nested_args)
 
 
+def test_compiled_mean_field():
+    """
+    Checks that CompiledMeanField matches the unrolled mean field
+    inference, and that it stops early once the state converges.
+    """
+    batch_size = 5
+    rng = np.random.RandomState(0)
+    V = (rng.uniform(size=(batch_size, 7)) > .5).astype(config.floatX)
+    Y = np.eye(3, dtype=config.floatX)[rng.randint(3, size=batch_size)]
+
+    for inference_procedure in [None, BiasInit()]:
+        dbm = DBM(visible_layer=BinaryVector(nvis=7),
+                  hidden_layers=[BinaryVectorMaxPool(detector_layer_dim=6,
+                                                     pool_size=2,
+                                                     layer_name='h0',
+                                                     irange=1.),
+                                 BinaryVectorMaxPool(detector_layer_dim=4,
+                                                     pool_size=1,
+                                                     layer_name='h1',
+                                                     irange=1.),
+                                 Softmax(3, 'y', irange=1.)],
+                  batch_size=batch_size,
+                  niter=6,
+                  inference_procedure=inference_procedure)
+
+        for supervised in [False, True]:
+            V_sym = dbm.get_input_space().make_theano_batch()
+            inputs = [V_sym]
+            Y_sym = None
+            if supervised:
+                Y_sym = T.matrix()
+                inputs.append(Y_sym)
+            H_hat = dbm.mf(V_sym, Y=Y_sym)
+            if supervised:
+                H_hat = H_hat[:-1]
+            outputs = flatten(H_hat)
+            expected = function(inputs, outputs)(*[V, Y][:len(inputs)])
+
+            mf = CompiledMeanField(dbm, tol=0., supervised=supervised)
+            H_hat, num_steps = mf(V, Y if supervised else None)
+            assert num_steps == mf.num_steps == 6
+            for value, expected_value in safe_zip(flatten(H_hat), expected):
+                np.testing.assert_allclose(value, expected_value,
+                                           rtol=1e-4, atol=1e-6)
+
+            mf = CompiledMeanField(dbm, tol=2., max_iter=100,
+                                   supervised=supervised)
+            H_hat, num_steps = mf(V, Y if supervised else None)
+            assert num_steps == 2
+
+
+def test_chain_pool():
+    """
+    Checks that a ChainPool advances only its active chains, in
+    round-robin order, and that PooledPCD trains with tempering.
+    """
+    def make_dbm():
+        return DBM(visible_layer=BinaryVector(nvis=6),
+                   hidden_layers=[BinaryVectorMaxPool(detector_layer_dim=4,
+                                                      pool_size=1,
+                                                      layer_name='h0',
+                                                      irange=1.),
+                                  BinaryVectorMaxPool(detector_layer_dim=3,
+                                                      pool_size=1,
+                                                      layer_name='h1',
+                                                      irange=1.)],
+                   batch_size=4,
+                   niter=2)
+
+    dbm = make_dbm()
+    pool = ChainPool(dbm, num_chains=10, num_active=4, num_gibbs_steps=3,
+                     inverse_temperatures=[1., .5, .25], seed=0)
+    updates, layer_to_updated = pool.get_updates()
+    V = pool.layer_to_chains[0][dbm.visible_layer]
+    f = function([], layer_to_updated[dbm.visible_layer], updates=updates)
+    for start in [0, 4, 8]:
+        old = V.get_value()
+        sample = f()
+        assert sample.shape == (4, 6)
+        index = np.arange(start, start + 4) % 10
+        new = V.get_value()
+        np.testing.assert_equal(new[index], sample)
+        untouched = np.setdiff1d(np.arange(10), index)
+        np.testing.assert_equal(new[untouched], old[untouched])
+    channels = pool.get_monitoring_channels()
+    for i in xrange(2):
+        assert 0. <= channels['chain_pool_swap_rate_%d' % i].get_value() <= 1.
+
+    dbm = make_dbm()
+    cost = PooledPCD(num_chains=8, num_gibbs_steps=2, num_active=4,
+                     inverse_temperatures=[1., .5])
+    X = T.matrix()
+    grads, updates = cost.get_gradients(dbm, X)
+    assert len(dbm.chain_pool.layer_to_chains) == 2
+    assert dbm.layer_to_chains is dbm.chain_pool.layer_to_chains[0]
+    f = function([X], list(grads.values()), updates=updates)
+    rng = np.random.RandomState(0)
+    f((rng.uniform(size=(4, 6)) > .5).astype(config.floatX))
+    assert 'chain_pool_swap_rate_0' in cost.get_monitoring_channels(dbm, X)
+
+
 def test_extra():
     """
     Test functionality that remains private, if available.
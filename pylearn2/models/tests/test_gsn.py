@@ -1,4 +1,47 @@
 """
-No tests for now, but there is an example of use in
+Tests for pylearn2.models.gsn. There is also an example of use in
 pylearn2/scripts/gsn_example.py
 """
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from pylearn2.corruption import (BinomialSampler, GaussianCorruptor,
+                                 SaltPepperCorruptor)
+from pylearn2.models.gsn import GSN, GSNSampler
+
+
+def test_gsn_sampler():
+    """
+    Runs many chains of a small GSN in parallel, streaming the samples
+    to disk.
+    """
+    gsn = GSN.new(layer_sizes=[6, 5, 4],
+                  activation_funcs=["sigmoid", "tanh", "tanh"],
+                  pre_corruptors=[None, GaussianCorruptor(.5),
+                                  GaussianCorruptor(.5)],
+                  post_corruptors=[SaltPepperCorruptor(.3), None, None],
+                  layer_samplers=[BinomialSampler(), None, None])
+    sampler = GSNSampler(gsn, num_chains=7)
+    data = np.random.RandomState(0).binomial(1, .5, (3, 6))
+    sampler.reset(data)
+
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, 'samples.npy')
+        samples = sampler.sample(4, thin=2, path=path)
+        assert samples.shape == (4, 7, 6)
+        assert np.all((samples > 0) & (samples < 1))
+        assert sampler.samples_per_second > 0
+        np.testing.assert_array_equal(np.load(path), samples)
+        del samples
+
+        sampler = GSNSampler(gsn, num_chains=5, index=-1)
+        sampler.reset(data)
+        hidden = sampler.sample(3)
+        assert hidden.shape == (3, 5, 4)
+        assert np.all(np.abs(hidden) < 1)
+    finally:
+        shutil.rmtree(dirname)
@@ -26,3 +26,70 @@ def test_kmeans():
 
     train = Train(model=model, dataset=dataset)
     train.main_loop()
+
+
+def test_kmeans_modes():
+    """
+    Tests that k-means++ seeding, mini-batch training and multi-threaded
+    chunked assignment all recover well separated clusters.
+    """
+
+    rng = np.random.RandomState([2015, 3, 4])
+    centers = 10 * rng.randn(5, 10)
+    labels = rng.randint(5, size=1000)
+    X = centers[labels] + rng.randn(1000, 10)
+
+    dataset = DenseDesignMatrix(X)
+
+    for kwargs in [dict(init='kmeans++'),
+                   dict(init='kmeans++', batch_size=100, max_iter=200),
+                   dict(init='kmeans++', chunk_size=64, n_jobs=2)]:
+        model = KMeans(k=5, nvis=10, seed=0, **kwargs)
+        model.train_all(dataset)
+        mu = model.get_params()[0].get_value()
+        dists = np.square(X[:, None, :] - mu[None, :, :]).sum(axis=2)
+        assert dists.min(axis=1).mean() < 2 * X.shape[1]
+
+
+def test_kmeans_empty_cluster():
+    """
+    Tests that a cluster left empty is reseeded with the points farthest
+    from their means.
+    """
+
+    rng = np.random.RandomState([2015, 3, 6])
+    centers = np.array([[0., 0.], [10., 0.], [-10., 0.]])
+    X = np.repeat(centers, 50, axis=0) + .1 * rng.randn(150, 2)
+    dataset = DenseDesignMatrix(X)
+
+    # The second mean is a copy of the first one, so its cluster is empty
+    mu = np.array([[0., 0.], [0., 0.], [10., 0.]])
+    model = KMeans(k=3, nvis=2)
+    model.train_all(dataset, mu=mu)
+    mu = model.get_params()[0].get_value()
+    dists = np.square(centers[:, None, :] - mu[None, :, :]).sum(axis=2)
+    assert np.all(dists.min(axis=1) < 1.)
+
+
+def test_assign():
+    """
+    Tests that the chunked distance computation finds the closest means.
+    """
+
+    from multiprocessing.pool import ThreadPool
+    from pylearn2.models.kmeans import _assign
+
+    rng = np.random.RandomState([2015, 3, 5])
+    X = rng.randn(100, 4)
+    mu = rng.randn(7, 4)
+    dists = np.square(X[:, None, :] - mu[None, :, :]).sum(axis=2)
+
+    pool = ThreadPool(2)
+    try:
+        for chunk_size, p in [(None, None), (13, pool)]:
+            assignments, min_dists = _assign(X, mu, chunk_size, p)
+            assert np.all(assignments == dists.argmin(axis=1))
+            assert np.allclose(min_dists, dists.min(axis=1))
+    finally:
+        pool.close()
+        pool.join()
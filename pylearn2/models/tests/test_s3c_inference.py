@@ -4,6 +4,7 @@ from pylearn2.models.s3c import S3C
 from pylearn2.models.s3c import E_Step_Scan
 from pylearn2.models.s3c import Grad_M_Step
 from pylearn2.models.s3c import E_Step
+from pylearn2.models.s3c import CompiledEStep
 from pylearn2.utils import contains_nan
 from theano import function
 import numpy as np
@@ -114,6 +115,32 @@ class Test_S3C_Inference:
         for i in xrange(0,len(outputs),2):
             assert np.allclose(outputs[i],outputs[i+1])
 
+    def test_compiled_e_step(self):
+        """ tests that the early stopping E step matches the scan E step
+        without early stopping, and converges with it """
+
+        V = T.matrix()
+        scan_result = self.e_step.infer(V)
+        f = function([V], [scan_result['H_hat'], scan_result['S_hat']])
+        H, S = f(self.X)
+
+        e_step = CompiledEStep(self.e_step, tol = -1.)
+        obs = e_step(self.X, batch_size = 300)
+        assert np.allclose(obs['H_hat'], H)
+        assert np.allclose(obs['S_hat'], S)
+        assert np.all(e_step.num_steps == len(self.h_new_coeff_schedule))
+        assert not e_step.converged.any()
+
+        e_step = CompiledEStep(self.e_step, tol = 1e-7, max_iter = 500)
+        obs = e_step(self.X, batch_size = 300)
+        assert e_step.converged.all()
+        assert e_step.num_steps.max() < 500
+
+        reference = CompiledEStep(self.e_step, tol = -1., max_iter = 500)
+        reference_obs = reference(self.X)
+        assert np.allclose(obs['H_hat'], reference_obs['H_hat'], atol = 1e-3)
+        assert np.allclose(e_step.kl, reference.kl, atol = 1e-5)
+
 
     def test_grad_s(self):
 
@@ -16,6 +16,7 @@ import time
 import numpy as np
 from theano.compat.six.moves import xrange
 
+import theano
 from theano import config
 from theano.printing import var_descriptor
 import theano.tensor as T
@@ -63,6 +64,23 @@ class BatchGradientDescent(object):
         search direction conjugate to the last one (even though the
         objective function might be totally different on each call to
         minimize)
+    lbfgs_memory : int, optional
+        If not None, picks the search direction using limited-memory BFGS
+        with the `lbfgs_memory` most recent (step, gradient change) pairs.
+        Incompatible with `conjugate`. The history is stored on the host
+        as preallocated arrays of shape (lbfgs_memory, total number of
+        parameters). The pairs are measured at the points the optimizer
+        actually visits, so modifications of the parameters between calls
+        to minimize (e.g. by BGD's `scale_step`) are taken into account.
+        The L-BFGS direction is not normalized, since its scale already
+        estimates the step to the minimum, and `init_alpha` defaults to
+        step sizes around 1.
+    reset_lbfgs : bool, optional
+        Has no effect unless lbfgs_memory is not None. If True, the L-BFGS
+        history is cleared at the start of each call to minimize, which is
+        appropriate if each call uses a different batch. Otherwise, the
+        history is kept across calls, which is appropriate for full-batch
+        objectives.
     gradients : WRITEME
         If None, compute the gradients of obj using T.grad otherwise, a
         dictionary mapping from params to expressions for their gradients
@@ -71,6 +89,25 @@ class BatchGradientDescent(object):
     gradient_updates : dict
         A dictionary of shared variable updates to run each time the
         gradient is computed
+    line_search_mode : str, optional
+        If None, tries each step size in `init_alpha` with a separate
+        call to the objective function and adapts the list of step sizes
+        between iterations. If 'exhaustive', does a binary search for the
+        best step size. If 'vectorized', adapts the list of step sizes
+        like the default mode but evaluates the objective at the current
+        point and at every candidate step size with a single compiled
+        function that returns a vector of objective values, and breaks
+        ties toward the smaller step size. With `accumulate`, this means
+        each line search makes only one pass over the batches. The parts
+        of the graph that do not depend on the parameters (e.g.
+        preprocessing of the inputs) are computed once per batch and
+        shared by all the step sizes, while the parts that do depend on
+        the parameters are duplicated once per step size, so memory usage
+        grows linearly with `len(init_alpha)`.
+    accumulate : bool, optional
+        If True, `inputs` are passed to `minimize` as lists of batches and
+        the objective and gradients are averaged across the batches using
+        an `Accumulator`.
 
     Notes
     -----
@@ -84,13 +121,16 @@ class BatchGradientDescent(object):
                  reset_alpha=True, conjugate=False,
                  reset_conjugate=True, gradients=None,
                  gradient_updates=None, line_search_mode=None,
-                 accumulate=False, theano_function_mode=None):
+                 accumulate=False, theano_function_mode=None,
+                 lbfgs_memory=None, reset_lbfgs=False):
 
         self.__dict__.update(locals())
         del self.self
 
-        if line_search_mode is None:
-            if init_alpha is None:
+        if line_search_mode in [None, 'vectorized']:
+            if init_alpha is None and lbfgs_memory is not None:
+                init_alpha = (.25, .5, 1., 2.)
+            elif init_alpha is None:
                 init_alpha = (.001, .005, .01, .05, .1)
         else:
             assert line_search_mode == 'exhaustive'
@@ -99,6 +139,11 @@ class BatchGradientDescent(object):
 
         self.init_alpha = tuple([float(elem) for elem in init_alpha])
 
+        if conjugate and lbfgs_memory is not None:
+            raise ValueError("conjugate and lbfgs_memory are mutually "
+                             "exclusive ways of picking the search "
+                             "direction.")
+
         if inputs is None:
             inputs = []
 
@@ -197,12 +242,51 @@ class BatchGradientDescent(object):
             mode=self.theano_function_mode,
             name='BatchGradientDescent._goto_alpha')
 
+        if self.line_search_mode == 'vectorized':
+            if self.verbose:
+                logger.info('batch gradient class compiling vectorized '
+                            'objective function')
+            # Element 0 of alphas is always 0, so the same pass over the
+            # data also gives us the objective at the starting point.
+            alphas = T.vector(name='alphas')
+            alphas.tag.test_value = np.cast[alphas.dtype](
+                (0.,) + self.init_alpha)
+            objs = []
+            for i in xrange(len(self.init_alpha) + 1):
+                alpha_updates = OrderedDict()
+                for param in params:
+                    cached = self.param_to_cache[param]
+                    g = self.param_to_grad_shared[param]
+                    if lr_scalers is not None and param in lr_scalers:
+                        scaled_alpha = alphas[i] * lr_scalers[param]
+                    else:
+                        scaled_alpha = alphas[i]
+                    alpha_updates[param] = cached - scaled_alpha * g
+                for param_constrainer in param_constrainers:
+                    param_constrainer(alpha_updates)
+                objs.append(theano.clone(obj, replace=alpha_updates))
+            objs = T.stack(*objs)
+            objs.name = 'BatchGradientDescent.objs'
+            # alphas goes last because Accumulator infers the batch size
+            # from its first input
+            if self.accumulate:
+                self._objs = Accumulator(list(inputs) + [alphas], objs)
+            else:
+                self._objs = function(list(inputs) + [alphas], objs,
+                                      mode=self.theano_function_mode,
+                                      name='BatchGradientDescent._objs')
+            if self.verbose:
+                logger.info('done')
+
         norm = T.sqrt(sum([T.sqr(elem).sum() for elem in
                            self.param_to_grad_shared.values()]))
         norm.name = 'BatchGradientDescent.norm'
         normalize_grad_updates = OrderedDict()
-        for grad_shared in self.param_to_grad_shared.values():
-            normalize_grad_updates[grad_shared] = grad_shared / norm
+        # The L-BFGS direction is only measured, so that a step size of 1
+        # keeps its meaning
+        if self.lbfgs_memory is None:
+            for grad_shared in self.param_to_grad_shared.values():
+                normalize_grad_updates[grad_shared] = grad_shared / norm
 
         # useful for monitoring
         self.ave_grad_size = sharedX(0.)
@@ -281,6 +365,11 @@ class BatchGradientDescent(object):
                         'BatchGradientDescent._make_conjugate output '
                         + var_descriptor(output) + '\n')
 
+        if self.lbfgs_memory is not None:
+            self._lbfgs = LBFGSMemory(
+                [param.get_value().shape for param in self.params],
+                self.lbfgs_memory)
+
         if tol is None:
             if objective.dtype == "float32":
                 self.tol = 1e-6
@@ -291,6 +380,149 @@ class BatchGradientDescent(object):
 
         self.ave_step_size = sharedX(0.)
         self.ave_grad_mult = sharedX(0.)
+        # Number of passes over the inputs made by each line search, i.e.
+        # the number of calls to a compiled objective function
+        self.ave_line_search_evals = sharedX(0.)
+
+    def clear_lbfgs_history(self):
+        """
+        Forgets the curvature information gathered by L-BFGS, so the next
+        iteration uses the direction of steepest descent. Has no effect
+        unless `lbfgs_memory` is not None.
+        """
+        if self.lbfgs_memory is not None:
+            self._lbfgs.reset()
+
+    def _make_lbfgs_direction(self):
+        """
+        Replaces the gradient stored in `param_to_grad_shared` with the
+        L-BFGS search direction, after recording the most recent
+        (step, gradient change) pair.
+        """
+        grad_shared = list(self.param_to_grad_shared.values())
+        self._lbfgs.update([param.get_value(borrow=True)
+                            for param in self.params],
+                           [g.get_value(borrow=True) for g in grad_shared])
+        direction = self._lbfgs.direction()
+        for g, value in safe_zip(grad_shared, direction):
+            g.set_value(np.cast[g.dtype](value))
+
+    def _obj(self, *inputs):
+        """
+        Evaluates the objective function, counting the number of
+        evaluations made by the current line search.
+
+        Parameters
+        ----------
+        inputs : list
+            The inputs to the objective function.
+
+        Returns
+        -------
+        obj : float
+            The value of the objective function.
+        """
+        self._num_evals += 1
+        return self.obj(*inputs)
+
+    def _vectorized_objs(self, alpha_list, *inputs):
+        """
+        Evaluates the objective function at the current point and at
+        every step size in `alpha_list` with a single compiled function.
+
+        Parameters
+        ----------
+        alpha_list : list
+            The step sizes to try. Must have the same length as
+            `init_alpha`.
+        inputs : list
+            The inputs to the objective function.
+
+        Returns
+        -------
+        objs : numpy.ndarray
+            A vector containing the objective function at the current
+            point followed by its value at each step size.
+        """
+        assert len(alpha_list) == len(self.init_alpha)
+        alphas = np.cast[config.floatX]([0.] + list(alpha_list))
+        self._num_evals += 1
+        if self.accumulate:
+            return self._objs(*[list(batch) + [alphas] for batch in inputs])
+        return self._objs(*(list(inputs) + [alphas]))
+
+    def _adapt_alpha_list(self, alpha_list, best_alpha, best_alpha_ind):
+        """
+        Picks the step sizes to try on the next iteration of the default
+        and vectorized line searches.
+
+        Parameters
+        ----------
+        alpha_list : list
+            The step sizes tried on the current iteration, in increasing
+            order.
+        best_alpha : float
+            The best step size found, or 0 if none of them improved the
+            objective function.
+        best_alpha_ind : int
+            The index of `best_alpha` in `alpha_list`, or -1 if none of the
+            step sizes improved the objective function.
+
+        Returns
+        -------
+        alpha_list : list
+            The step sizes to try on the next iteration.
+        converged : bool
+            True if the optimization has converged.
+        """
+        # if best_obj == prev_best_obj and alpha_list[0] < 1e-5:
+        #    break
+        if best_alpha_ind < 1 and alpha_list[0] > self.tol:
+            alpha_list = [alpha / 3. for alpha in alpha_list]
+            if self.verbose:
+                logger.info('shrinking the step size')
+        elif best_alpha_ind > len(alpha_list) - 2:
+            alpha_list = [alpha * 2. for alpha in alpha_list]
+            if self.verbose:
+                logger.info('growing the step size')
+        elif best_alpha_ind == -1 and alpha_list[0] <= self.tol:
+            if alpha_list[-1] > 1:
+                if self.verbose:
+                    logger.info('converged')
+                return alpha_list, True
+            if self.verbose:
+                logger.info('expanding the range of step sizes')
+            for i in xrange(len(alpha_list)):
+                for j in xrange(i, len(alpha_list)):
+                    alpha_list[j] *= 1.5
+                # end for j
+            # end for i
+        else:
+            # if a step succeeded and didn't result in growing or
+            # shrinking the step size then we can probably benefit
+            # from more fine-grained exploration of the middle
+            # ranges of step size (this is especially necessary if
+            # we've executed the 'expanding the range of step sizes'
+            # case multiple times)
+            a = np.asarray(alpha_list)
+            s = a[1:]/a[:-1]
+            max_gap = 5.
+            if s.max() > max_gap:
+                weight = .99
+                if self.verbose:
+                    logger.info('shrinking the range of step sizes')
+                alpha_list = [(alpha ** weight) * (best_alpha
+                              ** (1.-weight)) for alpha in alpha_list]
+                assert all([second > first for first, second in
+                           safe_zip(alpha_list[:-1], alpha_list[1:])])
+                # y^(weight) best^(1-weight) / x^(weight)
+                # best^(1-weight) = (y/x)^weight
+                # so this shrinks the ratio between each successive
+                # pair of alphas by raising it to weight
+                # weight = .99 -> a gap of 5 is shrunk to 4.92
+
+        # end check on alpha_ind
+        return alpha_list, False
 
     def minimize(self, * inputs):
         """
@@ -326,6 +558,9 @@ class BatchGradientDescent(object):
         else:
             norm = 1.
 
+        if self.lbfgs_memory is not None and self.reset_lbfgs:
+            self.clear_lbfgs_history()
+
         while iters != self.max_iter:
             if self.verbose:
                 logger.info('batch gradient descent iteration '
@@ -337,16 +572,19 @@ class BatchGradientDescent(object):
             self._compute_grad(*inputs)
             if self.conjugate:
                 self._make_conjugate()
+            if self.lbfgs_memory is not None:
+                self._make_lbfgs_direction()
             norm = self._normalize_grad()
 
+            self._num_evals = 0
             if self.line_search_mode is None:
                 best_obj, best_alpha, best_alpha_ind = \
-                    self.obj(* inputs), 0., -1
+                    self._obj(* inputs), 0., -1
                 prev_best_obj = best_obj
 
                 for ind, alpha in enumerate(alpha_list):
                     self._goto_alpha(alpha)
-                    obj = self.obj(*inputs)
+                    obj = self._obj(*inputs)
                     if self.verbose:
                         logger.info('\t{0} {1}'.format(alpha, obj))
 
@@ -368,53 +606,38 @@ class BatchGradientDescent(object):
 
                 step_size = best_alpha
 
-                # if best_obj == prev_best_obj and alpha_list[0] < 1e-5:
-                #    break
-                if best_alpha_ind < 1 and alpha_list[0] > self.tol:
-                    alpha_list = [alpha / 3. for alpha in alpha_list]
-                    if self.verbose:
-                        logger.info('shrinking the step size')
-                elif best_alpha_ind > len(alpha_list) - 2:
-                    alpha_list = [alpha * 2. for alpha in alpha_list]
-                    if self.verbose:
-                        logger.info('growing the step size')
-                elif best_alpha_ind == -1 and alpha_list[0] <= self.tol:
-                    if alpha_list[-1] > 1:
-                        if self.verbose:
-                            logger.info('converged')
-                        break
-                    if self.verbose:
-                        logger.info('expanding the range of step sizes')
-                    for i in xrange(len(alpha_list)):
-                        for j in xrange(i, len(alpha_list)):
-                            alpha_list[j] *= 1.5
-                        # end for j
-                    # end for i
+                alpha_list, converged = self._adapt_alpha_list(
+                    alpha_list, best_alpha, best_alpha_ind)
+                if converged:
+                    break
+            elif self.line_search_mode == 'vectorized':
+                objs = self._vectorized_objs(alpha_list, *inputs)
+                # Regard NaN results as infinitely bad so they
+                # won't be picked as the min objective
+                objs = np.where(np.isnan(objs), np.inf, objs)
+                # argmin returns the first minimum, so if there are ties
+                # the smaller step size wins, and a flat objective leaves
+                # the parameters in place (alpha = 0 is objs[0])
+                best_alpha_ind = int(np.argmin(objs)) - 1
+                if best_alpha_ind == -1:
+                    best_alpha = 0.
                 else:
-                    # if a step succeeded and didn't result in growing or
-                    # shrinking the step size then we can probably benefit
-                    # from more fine-grained exploration of the middle
-                    # ranges of step size (this is especially necessary if
-                    # we've executed the 'expanding the range of step sizes'
-                    # case multiple times)
-                    a = np.asarray(alpha_list)
-                    s = a[1:]/a[:-1]
-                    max_gap = 5.
-                    if s.max() > max_gap:
-                        weight = .99
-                        if self.verbose:
-                            logger.info('shrinking the range of step sizes')
-                        alpha_list = [(alpha ** weight) * (best_alpha
-                                      ** (1.-weight)) for alpha in alpha_list]
-                        assert all([second > first for first, second in
-                                   safe_zip(alpha_list[:-1], alpha_list[1:])])
-                        # y^(weight) best^(1-weight) / x^(weight)
-                        # best^(1-weight) = (y/x)^weight
-                        # so this shrinks the ratio between each successive
-                        # pair of alphas by raising it to weight
-                        # weight = .99 -> a gap of 5 is shrunk to 4.92
-
-                # end check on alpha_ind
+                    best_alpha = alpha_list[best_alpha_ind]
+                best_obj = objs[best_alpha_ind + 1]
+                if self.verbose:
+                    for alpha, obj in safe_zip(alpha_list, objs[1:]):
+                        logger.info('\t{0} {1}'.format(alpha, obj))
+                    logger.info(best_obj)
+
+                assert not np.isnan(best_obj)
+                self._goto_alpha(best_alpha)
+
+                step_size = best_alpha
+
+                alpha_list, converged = self._adapt_alpha_list(
+                    alpha_list, best_alpha, best_alpha_ind)
+                if converged:
+                    break
             else:
                 assert self.line_search_mode == 'exhaustive'
 
@@ -429,7 +652,7 @@ class BatchGradientDescent(object):
                 if self.verbose > 1:
                     logger.info('Exhaustive line search')
 
-                obj = self.obj(*inputs)
+                obj = self._obj(*inputs)
                 if np.isnan(obj):
                     logger.warning("Objective is NaN for these parameters.")
                 results = [(0., obj)]
@@ -440,7 +663,7 @@ class BatchGradientDescent(object):
                                      '{0}'.format(results[-1][0]))
                         assert False
                     self._goto_alpha(alpha)
-                    obj = self.obj(*inputs)
+                    obj = self._obj(*inputs)
                     if np.isnan(obj):
                         obj = np.inf
                     results.append((alpha, obj))
@@ -459,7 +682,7 @@ class BatchGradientDescent(object):
 
                     def do_point(x):
                         self._goto_alpha(x)
-                        res = self.obj(*inputs)
+                        res = self._obj(*inputs)
                         if self.verbose > 1:
                             logger.info('\t{0} {1}'.format(x, res))
                         # Regard NaN results as infinitely bad so they
@@ -530,9 +753,21 @@ class BatchGradientDescent(object):
             self.ave_step_size.set_value(update)
 
             old = self.ave_grad_mult.get_value()
-            update = new_weight * (step_size / norm) + (1. - new_weight) * old
+            if self.lbfgs_memory is None:
+                grad_mult = step_size / norm
+            else:
+                grad_mult = step_size
+            update = new_weight * grad_mult + (1. - new_weight) * old
             update = np.cast[config.floatX](update)
             self.ave_grad_mult.set_value(update)
+
+            old = self.ave_line_search_evals.get_value()
+            update = new_weight * self._num_evals + (1. - new_weight) * old
+            update = np.cast[config.floatX](update)
+            self.ave_line_search_evals.set_value(update)
+            if self.verbose:
+                logger.info('line search used {0} evaluations of the '
+                            'objective'.format(self._num_evals))
             # it is initialized to 1 to get all the means started at
             # data points, but then we turn it into a running average
             if new_weight == 1.:
@@ -555,6 +790,129 @@ class BatchGradientDescent(object):
         return best_obj
 
 
+class LBFGSMemory(object):
+    """
+    The history of (step, gradient change) pairs used by limited-memory
+    BFGS, stored in a ring buffer of preallocated arrays.
+
+    Parameters
+    ----------
+    shapes : list
+        The shapes of the parameters being optimized.
+    memory : int
+        The number of pairs to keep.
+    dtype : str, optional
+        The dtype of the history. Defaults to config.floatX.
+
+    Notes
+    -----
+    All the parameters are flattened into a single vector, so each pair
+    takes 2 * sum of the parameter sizes elements of memory.
+    """
+
+    def __init__(self, shapes, memory, dtype=None):
+        if memory < 1:
+            raise ValueError("memory must be at least 1, got " + str(memory))
+        if dtype is None:
+            dtype = config.floatX
+        self.shapes = [tuple(shape) for shape in shapes]
+        self.sizes = [int(np.prod(shape)) for shape in self.shapes]
+        self.memory = memory
+        dim = sum(self.sizes)
+        self.s = np.zeros((memory, dim), dtype=dtype)
+        self.y = np.zeros((memory, dim), dtype=dtype)
+        self.rho = np.zeros((memory,), dtype='float64')
+        self._alpha = np.zeros((memory,), dtype='float64')
+        self._x = np.zeros((dim,), dtype=dtype)
+        self._g = np.zeros((dim,), dtype=dtype)
+        self._prev_x = np.zeros((dim,), dtype=dtype)
+        self._prev_g = np.zeros((dim,), dtype=dtype)
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets all the stored pairs.
+        """
+        self.count = 0
+        self.head = 0
+        self._has_prev = False
+
+    def _flatten(self, values, out):
+        """
+        Copies a list of arrays with shapes `self.shapes` into the vector
+        `out`.
+        """
+        offset = 0
+        for value, size in safe_zip(values, self.sizes):
+            out[offset:offset + size] = value.ravel()
+            offset += size
+
+    def update(self, x, g):
+        """
+        Records the current point and gradient, storing the pair formed
+        with the previous point if it satisfies the curvature condition.
+
+        Parameters
+        ----------
+        x : list
+            The values of the parameters.
+        g : list
+            The gradient of the objective with respect to each parameter.
+        """
+        self._flatten(x, self._x)
+        self._flatten(g, self._g)
+        if self._has_prev:
+            # Compute the pair in place in the buffers of the previous
+            # point, since these get overwritten below anyway
+            s = np.subtract(self._x, self._prev_x, out=self._prev_x)
+            y = np.subtract(self._g, self._prev_g, out=self._prev_g)
+            sy = np.dot(s.astype('float64'), y)
+            # Skip pairs that would make the Hessian approximation
+            # indefinite (e.g. because the objective is not convex here)
+            if sy > 1e-10 * np.dot(y.astype('float64'), y):
+                self.s[self.head] = s
+                self.y[self.head] = y
+                self.rho[self.head] = 1. / sy
+                self.head = (self.head + 1) % self.memory
+                self.count = min(self.count + 1, self.memory)
+        self._prev_x[:] = self._x
+        self._prev_g[:] = self._g
+        self._has_prev = True
+
+    def direction(self):
+        """
+        Computes the product of the inverse Hessian approximation with the
+        most recently recorded gradient using the L-BFGS two-loop
+        recursion.
+
+        Returns
+        -------
+        direction : list
+            The direction, with one array per parameter. Stepping in the
+            negative of this direction decreases the objective.
+        """
+        q = self._g.astype('float64')
+        # Newest pair first
+        order = [(self.head - 1 - i) % self.memory
+                 for i in xrange(self.count)]
+        for i in order:
+            self._alpha[i] = self.rho[i] * np.dot(self.s[i], q)
+            q -= self._alpha[i] * self.y[i]
+        if self.count > 0:
+            newest = order[0]
+            y = self.y[newest].astype('float64')
+            q *= 1. / (self.rho[newest] * np.dot(y, y))
+        for i in reversed(order):
+            beta = self.rho[i] * np.dot(self.y[i], q)
+            q += (self._alpha[i] - beta) * self.s[i]
+        rval = []
+        offset = 0
+        for shape, size in safe_zip(self.shapes, self.sizes):
+            rval.append(q[offset:offset + size].reshape(shape))
+            offset += size
+        return rval
+
+
 class Accumulator(object):
     """
     Standin for a theano function with the given inputs, outputs, updates.
@@ -626,10 +984,9 @@ class Accumulator(object):
 
             WRITEME
         """
-        for elem, mask, shared in safe_zip(inputs, self._shared_mask,
-                                           self._shared):
-            if mask:
-                shared.set_value(elem)
+        for elem, shared in safe_zip(self._shared_inputs(inputs),
+                                     self._shared):
+            shared.set_value(elem)
 
     def __call__(self, * batches):
         """
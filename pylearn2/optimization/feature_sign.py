@@ -9,9 +9,10 @@ __license__ = "3-clause BSD"
 __maintainer__ = "David Warde-Farley"
 __email__ = "wardefar@iro"
 
-__all__ = ["feature_sign_search"]
+__all__ = ["feature_sign_search", "batched_feature_sign_search"]
 
 from itertools import count
+from multiprocessing import Pool
 
 import logging
 import numpy as np
@@ -21,6 +22,33 @@ from theano.compat.six.moves import zip as izip
 log = logging.getLogger(__name__)
 log.setLevel(logging.INFO)
 
+# numpy.linalg.solve broadcasts over stacks of systems since numpy 1.8
+_STACKED_SOLVE = tuple(int(v) for v in np.__version__.split('.')[:2]) >= (1, 8)
+
+
+def _solve_stacked(a, b):
+    """
+    Solves a stack of linear systems.
+
+    Parameters
+    ----------
+    a : ndarray, 3-dimensional
+        The matrices of the systems, of shape (n, k, k).
+    b : ndarray, 2-dimensional
+        The right hand sides, of shape (n, k).
+
+    Returns
+    -------
+    x : ndarray, 2-dimensional
+        The solutions, of shape (n, k).
+    """
+    if _STACKED_SOLVE:
+        return np.linalg.solve(a, b[:, :, None])[:, :, 0]
+    x = np.empty(b.shape, dtype=np.result_type(a, b))
+    for i in range(len(b)):
+        x[i] = np.linalg.solve(a[i], b[i])
+    return x
+
 
 def _feature_sign_checkargs(dictionary, signals, sparsity, max_iter,
                             solution):
@@ -316,3 +344,264 @@ def feature_sign_search(dictionary, signals, sparsity, max_iter=1000,
     elif orig_sol is None and signals_ndim == 1:
         solution = solution.squeeze()
     return solution
+
+
+def _batched_feature_sign_line_search(gram, corr, sds, sparsity, old, new,
+                                      old_signs):
+    """
+    Vectorized version of the line search over zero-crossings done by
+    `_feature_sign_search_single`, for a group of signals sharing the
+    same active set size.
+
+    Parameters
+    ----------
+    gram : ndarray, shape (n, k, k)
+        The restrictions of the Gram matrix to each active set.
+    corr : ndarray, shape (n, k)
+        The restrictions of the target correlations to each active set.
+    sds : ndarray, shape (n,)
+        The squared norm of each signal.
+    sparsity : float
+        The coefficient on the L1 penalty term of the cost function.
+    old : ndarray, shape (n, k)
+        The current solution restricted to each active set.
+    new : ndarray, shape (n, k)
+        The solution of the unconstrained problem over each active set.
+    old_signs : ndarray, shape (n, k)
+        The current signs of the active coefficients.
+
+    Returns
+    -------
+    best : ndarray, shape (n, k)
+        For each signal, whichever of `new` and the points where the
+        segment from `old` to `new` crosses zero has the lowest cost.
+    """
+    def cost(points):
+        # points has shape (n, c, k): c candidate points per signal
+        quad = np.einsum('ncj,njl,ncl->nc', points, gram, points)
+        return (sds[:, None] + quad
+                - 2 * np.einsum('ncj,nj->nc', points, corr)
+                + sparsity * np.abs(points).sum(axis=2))
+    flips = np.abs(np.sign(new) - old_signs) > 1
+    best = new.copy()
+    rows = np.where(flips.any(axis=1))[0]
+    if len(rows) == 0:
+        return best
+    gram = gram[rows]
+    corr = corr[rows]
+    sds = sds[rows]
+    old = old[rows]
+    new = new[rows]
+    flips = flips[rows]
+    denominator = np.where(flips, old - new, 1.)
+    prop = np.where(flips, old / denominator, 0.)
+    # candidates[n, c] is the point where coefficient c crosses zero
+    candidates = old[:, None, :] - prop[:, :, None] * (old - new)[:, None, :]
+    candidate_costs = cost(candidates)
+    candidate_costs[~flips] = np.inf
+    new_costs = cost(new[:, None, :])[:, 0]
+    # Ties go to the earliest candidate, and to `new` over any candidate,
+    # like the sequential line search
+    best_candidate = np.argmin(candidate_costs, axis=1)
+    improved = (candidate_costs[np.arange(len(rows)), best_candidate] <
+                new_costs)
+    best[rows[improved]] = candidates[np.where(improved)[0],
+                                      best_candidate[improved]]
+    return best
+
+
+def _batched_feature_sign_search_chunk(dictionary, signals, sparsity,
+                                       max_iter, solution, gram_matrix=None):
+    """
+    Runs feature-sign search on every row of `signals` in lockstep.
+
+    Parameters
+    ----------
+    dictionary : ndarray, 2-dimensional
+        The dictionary of basis functions, with one basis vector per
+        column.
+    signals : ndarray, 2-dimensional
+        The signals to decompose, one per row.
+    sparsity : float
+        The coefficient on the L1 penalty term of the cost function.
+    max_iter : int
+        The maximum number of iterations to run for each signal.
+    solution : ndarray, 2-dimensional
+        Pre-allocated matrix used to store the solutions.
+    gram_matrix : ndarray, 2-dimensional, optional
+        `np.dot(dictionary.T, dictionary)`, if already computed.
+
+    Returns
+    -------
+    solution : ndarray, 2-dimensional
+        `solution`, updated in place.
+    iters : ndarray, 1-dimensional
+        The number of iterations run for each signal.
+    """
+    sparsity = np.array(sparsity).astype(dictionary.dtype)
+    effective_zero = 1e-18
+    if gram_matrix is None:
+        gram_matrix = np.dot(dictionary.T, dictionary)
+    target_correlation = np.dot(signals, dictionary)
+    sds = (signals ** 2).sum(axis=1)
+    num_signals, num_features = target_correlation.shape
+    solution[...] = 0.
+    signs = np.zeros((num_signals, num_features), dtype=np.int8)
+    z_opt = np.inf * np.ones(num_signals)
+    nz_optimal = np.ones(num_signals, dtype=bool)
+    grad = - 2 * target_correlation
+    running = np.ones(num_signals, dtype=bool)
+    iters = np.zeros(num_signals, dtype='int64')
+    for iteration in count(0):
+        running &= (z_opt > sparsity) | ~nz_optimal
+        if iteration == max_iter:
+            break
+        if not running.any():
+            break
+        iters[running] += 1
+        # Activate a new feature in each signal whose currently
+        # active coefficients are optimal.
+        adding = np.where(running & nz_optimal)[0]
+        if len(adding) > 0:
+            masked = np.abs(grad[adding]) * (signs[adding] == 0)
+            candidate = np.argmax(masked, axis=1)
+            candidate_grad = grad[adding, candidate]
+            new_signs = np.where(candidate_grad > sparsity, -1,
+                                 np.where(candidate_grad < -sparsity, 1, 0))
+            activated = new_signs != 0
+            signs[adding[activated], candidate[activated]] = \
+                new_signs[activated]
+            solution[adding[activated], candidate[activated]] = 0.
+            empty = adding[(signs[adding] == 0).all(axis=1)]
+            running[empty] = False
+        active = signs != 0
+        active_size = active.sum(axis=1)
+        # Solve the unconstrained problems with one batched LAPACK call
+        # per active set size (one call per problem before numpy 1.8).
+        for k in np.unique(active_size[running]):
+            rows = np.where(running & (active_size == k))[0]
+            indices = np.nonzero(active[rows])[1].reshape(len(rows), k)
+            restr_gram = gram_matrix[indices[:, :, None],
+                                     indices[:, None, :]]
+            restr_corr = target_correlation[rows[:, None], indices]
+            restr_sign = signs[rows[:, None], indices]
+            rhs = restr_corr - sparsity * restr_sign / 2
+            new_solution = _solve_stacked(restr_gram, rhs)
+            restr_oldsol = solution[rows[:, None], indices]
+            best = _batched_feature_sign_line_search(
+                restr_gram, restr_corr, sds[rows], sparsity, restr_oldsol,
+                new_solution, restr_sign)
+            best[np.abs(best) < effective_zero] = 0.
+            solution[rows[:, None], indices] = best
+            signs[rows[:, None], indices] = np.int8(np.sign(best))
+        rows = np.where(running)[0]
+        grad[rows] = (- 2 * target_correlation[rows] +
+                      2 * np.dot(solution[rows], gram_matrix))
+        zero = signs[rows] == 0
+        z_opt[rows] = np.where(zero, np.abs(grad[rows]), 0.).max(axis=1)
+        nz_opt = np.where(zero, 0., np.abs(grad[rows] + sparsity *
+                                           signs[rows])).max(axis=1)
+        nz_optimal[rows] = np.abs(nz_opt) <= 1e-8
+    return solution, iters
+
+
+def _batched_feature_sign_search_star(args):
+    """
+    Unpacks the arguments of `_batched_feature_sign_search_chunk`, for
+    use with `multiprocessing.Pool.map`.
+    """
+    return _batched_feature_sign_search_chunk(*args)
+
+
+def batched_feature_sign_search(dictionary, signals, sparsity, max_iter=1000,
+                                solution=None, chunk_size=1000, n_jobs=1):
+    """
+    Solve many L1-penalized quadratic minimization problems with
+    feature-sign search at once.
+
+    Gives the same results as `feature_sign_search`, but instead of
+    solving the problem for each signal in turn, all the signals of a
+    chunk are advanced one feature-sign iteration at a time. The Gram
+    matrix of the dictionary is computed only once, the target
+    correlations and gradients are computed with matrix products over the
+    whole chunk, and the signals whose active sets have the same size
+    have their small linear systems solved by a single batched call to
+    `numpy.linalg.solve` (one call per system before numpy 1.8).
+
+    Parameters
+    ----------
+    dictionary : array_like, 2-dimensional
+        The dictionary of basis functions from which to form the
+        sparse linear combination. Each column constitutes a basis
+        vector for the sparse code.
+    signals : array_like, 1- or 2-dimensional
+        The signal(s) to be decomposed, one per row.
+    sparsity : float
+        The coefficient on the L1 penalty term of the cost function.
+    max_iter : int, optional
+        The maximum number of iterations to run, per code vector, if
+        the optimization has still not converged. Default is 1000.
+    solution : ndarray, 1- or 2-dimensional, optional
+        Pre-allocated vector or matrix used to store the solution(s).
+        If provided, it should have the same rank as `signals`.
+    chunk_size : int, optional
+        The number of signals solved in lockstep. Memory usage is
+        O(chunk_size * dictionary.shape[1]) plus the restricted Gram
+        matrices of the chunk.
+    n_jobs : int, optional
+        If greater than 1, the chunks are distributed over a pool of
+        `n_jobs` processes.
+
+    Returns
+    -------
+    solution : ndarray, 1- or 2-dimensional
+        Matrix where each row contains the solution corresponding to a
+        row of `signals`. If an array was passed in as the argument
+        `solution`, it will be updated in place and the same object
+        will be returned.
+
+    See Also
+    --------
+    feature_sign_search : The sequential version of this function.
+    """
+    dictionary = np.asarray(dictionary)
+    _feature_sign_checkargs(dictionary, signals, sparsity, max_iter, solution)
+    signals_ndim = signals.ndim
+    signals = np.atleast_2d(signals)
+    if solution is None:
+        solution = np.zeros((signals.shape[0], dictionary.shape[1]),
+                            dtype=signals.dtype)
+        orig_sol = None
+    else:
+        orig_sol = solution
+        solution = np.atleast_2d(solution)
+    starts = range(0, signals.shape[0], chunk_size)
+    if n_jobs > 1:
+        pool = Pool(n_jobs)
+        try:
+            results = pool.map(
+                _batched_feature_sign_search_star,
+                [(dictionary, signals[start:start + chunk_size], sparsity,
+                  max_iter, solution[start:start + chunk_size])
+                 for start in starts])
+        finally:
+            pool.close()
+        for start, (chunk_solution, _) in izip(starts, results):
+            solution[start:start + chunk_size] = chunk_solution
+    else:
+        gram_matrix = np.dot(dictionary.T, dictionary)
+        results = []
+        for start in starts:
+            results.append(_batched_feature_sign_search_chunk(
+                dictionary, signals[start:start + chunk_size], sparsity,
+                max_iter, solution[start:start + chunk_size], gram_matrix))
+    for start, (_, iters) in izip(starts, results):
+        for row in np.where(iters >= max_iter)[0]:
+            log.warning("maximum number of iterations reached when "
+                        "optimizing code for training case %d; solution "
+                        "may not be optimal" % (start + row))
+    if orig_sol is not None and orig_sol.ndim == 1:
+        solution = orig_sol
+    elif orig_sol is None and signals_ndim == 1:
+        solution = solution.squeeze()
+    return solution
@@ -1,6 +1,7 @@
 from __future__ import print_function
 
 from pylearn2.optimization.batch_gradient_descent import BatchGradientDescent
+from pylearn2.optimization.batch_gradient_descent import LBFGSMemory
 import theano.tensor as T
 from pylearn2.utils import sharedX
 import numpy as np
@@ -171,5 +172,79 @@ def test_batch_gradient_descent():
                 assert False
 
 
+def test_vectorized_line_search():
+    """ Verify that the vectorized line search minimizes a quadratic
+    function and evaluates the objective once per line search, both
+    with and without accumulating over batches."""
+
+    n = 3
+
+    rng = np.random.RandomState([1, 2, 4])
+    A = np.cast[config.floatX](rng.randn(2 * n, n))
+    A = np.cast[config.floatX](np.dot(A.T, A) + np.identity(n))
+    b = np.cast[config.floatX](rng.randn(n))
+    analytical_x = np.linalg.solve(A, -b)
+
+    X = T.matrix(name='X')
+    x = sharedX(np.zeros((n,)), name='x')
+    half = np.cast[config.floatX](0.5)
+    obj = half * T.dot(T.dot(x, A), x) + T.dot(b, x) + 0. * X.sum()
+
+    for accumulate in [False, True]:
+        minimizer = BatchGradientDescent(objective=obj,
+                                         params=[x],
+                                         inputs=[X],
+                                         line_search_mode='vectorized',
+                                         accumulate=accumulate)
+        x.set_value(np.cast[config.floatX](rng.randn(n)))
+        data = np.cast[config.floatX](rng.randn(4, n))
+        if accumulate:
+            inputs = [[data[:2]], [data[2:]]]
+        else:
+            inputs = [data]
+
+        actual_obj = minimizer.minimize(*inputs)
+        assert np.allclose(actual_obj, minimizer.obj(*inputs))
+        assert np.allclose(x.get_value(), analytical_x, atol=1e-2)
+        assert minimizer.ave_line_search_evals.get_value() == 1.
+
+
+def test_lbfgs():
+    """ Verify that the L-BFGS direction mode minimizes a quadratic
+    function, and that the L-BFGS direction satisfies the secant
+    condition for the most recent pair."""
+
+    n = 4
+
+    rng = np.random.RandomState([1, 2, 5])
+    A = np.cast[config.floatX](rng.randn(2 * n, n))
+    A = np.cast[config.floatX](np.dot(A.T, A) + np.identity(n))
+    b = np.cast[config.floatX](rng.randn(n))
+    analytical_x = np.linalg.solve(A, -b)
+
+    x = sharedX(rng.randn(n), name='x')
+    half = np.cast[config.floatX](0.5)
+    obj = half * T.dot(T.dot(x, A), x) + T.dot(b, x)
+
+    minimizer = BatchGradientDescent(objective=obj, params=[x],
+                                     line_search_mode='exhaustive',
+                                     lbfgs_memory=3, max_iter=30)
+    minimizer.minimize()
+    assert np.allclose(x.get_value(), analytical_x, atol=1e-2)
+
+    memory = LBFGSMemory([(2,), (n - 2,)], 2, dtype='float64')
+    x0 = rng.randn(n)
+    x1 = rng.randn(n)
+    # Revisiting x1 stores no pair, since the step is zero, but makes the
+    # change in gradient between x0 and x1 the most recent gradient
+    for point, g in [(x0, np.dot(A, x0)), (x1, np.dot(A, x1)),
+                     (x1, np.dot(A, x1 - x0))]:
+        memory.update([point[:2], point[2:]], [g[:2], g[2:]])
+    assert memory.count == 1
+    # The inverse Hessian approximation maps the most recent change in
+    # gradient to the most recent step
+    assert np.allclose(np.concatenate(memory.direction()), x1 - x0)
+
+
 if __name__ == '__main__':
     test_batch_gradient_descent()
@@ -11,6 +11,7 @@ __email__ = "wardefar@iro"
 
 import numpy as np
 from pylearn2.optimization.feature_sign import feature_sign_search
+from pylearn2.optimization.feature_sign import batched_feature_sign_search
 
 
 class TestFeatureSign(object):
@@ -414,3 +415,32 @@ class TestFeatureSign(object):
         newsol = feature_sign_search(self.dictionary, signal, sparsity,
                                      solution=solution)
         assert solution is newsol
+
+    def test_batched_driver(self):
+        for index in range(len(self.penalties)):
+            solution_vector = np.zeros(self.dictionary.shape[1])
+            batched_feature_sign_search(self.dictionary, self.signal,
+                                        self.penalties[index],
+                                        solution=solution_vector)
+            yield self.check_against_reference, solution_vector, index
+            yield self.check_zeros_against_reference, solution_vector, index
+
+    def test_batched_matches_sequential(self):
+        rng = np.random.RandomState(1)
+        signals = rng.normal(size=(20, self.dictionary.shape[0])) / 1000
+        sparsity = self.penalties[3]
+        reference = feature_sign_search(self.dictionary, signals, sparsity)
+        for n_jobs in [1, 2]:
+            solution = batched_feature_sign_search(self.dictionary, signals,
+                                                   sparsity, chunk_size=7,
+                                                   n_jobs=n_jobs)
+            assert np.allclose(solution, reference)
+            assert np.all((solution == 0) == (reference == 0))
+
+    def test_batched_solution_identity_2d_provided(self):
+        sparsity = self.penalties[0]
+        solution = np.zeros((1, self.dictionary.shape[1]))
+        signal = self.signal.reshape(1, -1)
+        newsol = batched_feature_sign_search(self.dictionary, signal,
+                                             sparsity, solution=solution)
+        assert solution is newsol
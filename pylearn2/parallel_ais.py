@@ -0,0 +1,479 @@
+"""
+Annealed importance sampling (AIS) spread over several processes.
+
+`ParallelAIS` splits the AIS runs into chunks advanced by a pool of
+worker processes, evaluates the free energies of all the chains of a
+chunk at two consecutive temperatures with a single pass over the
+weights, checkpoints the partial log-weights so that an interrupted
+estimate can be resumed, and logs the estimate of the log-partition
+function and its standard error as the temperatures go by.
+
+The annealing path is described by a picklable object such as
+`BinaryDBMAnnealing`, which covers binary RBMs and binary DBMs, and is
+evaluated with NumPy so that it can run in the worker processes.
+
+References
+----------
+.. [1] Neal, R. M. (1998) "Annealed importance sampling",
+   Technical Report No. 9805 (revised), Dept. of Statistics,
+   University of Toronto, 25 pages
+.. [2] Ruslan Salakhutdinov, Iain Murray. "On the quantitative
+   analysis of deep belief networks". Proceedings of the 25th
+   International Conference on Machine Learning, p.872-879,
+   July 5--9, 2008, Helsinki, Finland
+"""
+__copyright__ = "Copyright 2010-2015, Universite de Montreal"
+__license__ = "3-clause BSD"
+__maintainer__ = "LISA Lab"
+__email__ = "pylearn-dev@googlegroups"
+
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from theano.compat.six.moves import xrange
+
+from pylearn2.utils import serial
+from pylearn2.utils.rng import make_np_rng
+
+
+logger = logging.getLogger(__name__)
+
+
+def default_betas():
+    """
+    Returns the default inverse temperatures of `rbm_tools.AIS`.
+
+    Returns
+    -------
+    betas : numpy.ndarray
+        The inverse temperatures, from 0 to 1.
+    """
+    return np.hstack((np.linspace(0, 0.5, 1000),
+                      np.linspace(0.5, 0.9, 10000),
+                      np.linspace(0.9, 1.0, 10000)))
+
+
+def _sigmoid(x):
+    """
+    Returns the logistic sigmoid of an array.
+    """
+    return 1. / (1. + np.exp(-x))
+
+
+def _sample_bernoulli(p, rng):
+    """
+    Returns binary samples with probabilities `p`, in the dtype of `p`.
+    """
+    return (rng.random_sample(p.shape) < p).astype(p.dtype)
+
+
+class BinaryDBMAnnealing(object):
+    """
+    The AIS path between a base-rate model and a DBM with binary units,
+    or an RBM when there is a single weight matrix.
+
+    As in `scripts/dbm/dbm_metrics.py`, the odd layers are summed out
+    if the number of layers (visible layer included) is even, and the
+    even layers otherwise. The distribution at inverse temperature
+    `beta` is the DBM with its weights and biases multiplied by `beta`,
+    times the base-rate model raised to the power `1 - beta`. The
+    base-rate model has no weights and only has biases on the first
+    layer that is not summed out, so it can be sampled exactly.
+
+    Parameters
+    ----------
+    weights : list
+        The weight matrices, `weights[i]` connecting layer `i` (the
+        visible layer being layer 0) to layer `i + 1`.
+    biases : list
+        The biases of all the layers, starting with the visible layer.
+    base_bias : numpy.ndarray, optional
+        The biases of the base-rate model, ideally those that match the
+        marginals of that layer under the data. Defaults to the biases of
+        the DBM.
+    """
+
+    def __init__(self, weights, biases, base_bias=None):
+        if len(weights) != len(biases) - 1:
+            raise ValueError("Expected one weight matrix less than biases, "
+                             "got %d and %d." % (len(weights), len(biases)))
+        self.weights = [np.asarray(W) for W in weights]
+        self.biases = [np.asarray(b) for b in biases]
+        depth = len(self.biases)
+        marginalize_odd = (depth % 2) == 0
+        self.kept = list(xrange(int(not marginalize_odd), depth, 2))
+        self.summed = list(xrange(int(marginalize_odd), depth, 2))
+        if base_bias is None:
+            base_bias = self.biases[self.kept[0]]
+        self.base_bias = np.asarray(base_bias, dtype=self.biases[0].dtype)
+
+    def _net_input(self, state, i):
+        """
+        Returns the input of layer `i` from its neighbours and its bias.
+        """
+        rval = self.biases[i]
+        if i > 0:
+            rval = rval + np.dot(state[i - 1], self.weights[i - 1])
+        if i < len(self.biases) - 1:
+            rval = rval + np.dot(state[i + 1], self.weights[i].T)
+        return rval
+
+    def log_z_base(self):
+        """
+        Returns the log-partition function of the base-rate model.
+
+        Returns
+        -------
+        log_z : float
+            The log-partition function.
+        """
+        num_units = sum(b.shape[0] for b in self.biases)
+        num_units -= self.base_bias.shape[0]
+        return (np.logaddexp(0, self.base_bias).sum() +
+                num_units * np.log(2.))
+
+    def sample_base(self, n, rng):
+        """
+        Draws exact samples from the base-rate model.
+
+        Parameters
+        ----------
+        n : int
+            The number of samples.
+        rng : numpy.random.RandomState
+            The random number generator.
+
+        Returns
+        -------
+        state : list
+            The state of each layer. Summed-out layers are left at zero.
+        """
+        dtype = self.biases[0].dtype
+        state = [np.zeros((n, b.shape[0]), dtype=dtype) for b in self.biases]
+        for i in self.kept:
+            if i == self.kept[0]:
+                p = np.tile(_sigmoid(self.base_bias), (n, 1))
+            else:
+                p = np.empty_like(state[i])
+                p.fill(.5)
+            state[i] = _sample_bernoulli(p.astype(dtype), rng)
+        return state
+
+    def free_energies(self, state, betas):
+        """
+        Computes the free energy of each chain at several inverse
+        temperatures, sharing the products with the weights.
+
+        Parameters
+        ----------
+        state : list
+            The state of each layer.
+        betas : list
+            The inverse temperatures.
+
+        Returns
+        -------
+        free_energies : numpy.ndarray
+            The free energies, one row per inverse temperature.
+        """
+        base_term = np.dot(state[self.kept[0]], self.base_bias)
+        bias_term = sum(np.dot(state[i], self.biases[i]) for i in self.kept)
+        net_inputs = [self._net_input(state, i) for i in self.summed]
+        rval = np.empty((len(betas), base_term.shape[0]))
+        for k, beta in enumerate(betas):
+            rval[k] = -beta * bias_term - (1. - beta) * base_term
+            for net_input in net_inputs:
+                rval[k] -= np.logaddexp(0, beta * net_input).sum(axis=1)
+        return rval
+
+    def sample(self, state, beta, rng):
+        """
+        Performs one Gibbs step at an inverse temperature: samples the
+        summed-out layers, then the other ones.
+
+        Parameters
+        ----------
+        state : list
+            The state of each layer.
+        beta : float
+            The inverse temperature.
+        rng : numpy.random.RandomState
+            The random number generator.
+
+        Returns
+        -------
+        state : list
+            The new state.
+        """
+        state = list(state)
+        for layers in [self.summed, self.kept]:
+            for i in layers:
+                net_input = beta * self._net_input(state, i)
+                if i == self.kept[0]:
+                    net_input += (1. - beta) * self.base_bias
+                state[i] = _sample_bernoulli(_sigmoid(net_input), rng)
+        return state
+
+
+def _advance(annealing, state, log_w, rng, betas):
+    """
+    Advances a chunk of AIS runs through a sequence of temperatures.
+
+    Parameters
+    ----------
+    annealing : object
+        The annealing path, such as a `BinaryDBMAnnealing`.
+    state : object
+        The state of the runs, at inverse temperature `betas[0]`.
+    log_w : numpy.ndarray
+        The log-weights of the runs.
+    rng : numpy.random.RandomState
+        The random number generator of the chunk.
+    betas : numpy.ndarray
+        The inverse temperatures.
+
+    Returns
+    -------
+    state : object
+        The state of the runs, at inverse temperature `betas[-1]`.
+    log_w : numpy.ndarray
+        The updated log-weights.
+    rng : numpy.random.RandomState
+        The random number generator.
+    """
+    log_w = log_w.copy()
+    for i in xrange(len(betas) - 1):
+        free_energies = annealing.free_energies(state, betas[i:i + 2])
+        log_w += free_energies[0] - free_energies[1]
+        state = annealing.sample(state, betas[i + 1], rng)
+    return state, log_w, rng
+
+
+# The annealing path of the worker processes, set once by _init_worker so
+# that it isn't pickled with every task.
+_worker_annealing = None
+
+
+def _init_worker(annealing):
+    """
+    Stores the annealing path in a worker process.
+    """
+    global _worker_annealing
+    _worker_annealing = annealing
+
+
+def _advance_in_worker(args):
+    """
+    Calls `_advance` with the annealing path of the worker process.
+    """
+    return _advance(_worker_annealing, *args)
+
+
+def estimate_from_weights(log_ais_w):
+    """
+    Estimates the log-ratio of partition functions from AIS log-weights.
+
+    Parameters
+    ----------
+    log_ais_w : numpy.ndarray
+        The log-weights of the runs.
+
+    Returns
+    -------
+    dlogz : float
+        The log of the mean of the weights.
+    std_err : float
+        The standard error of `dlogz`, from the variance of the weights
+        by the delta method.
+    """
+    log_ais_w = np.asarray(log_ais_w, dtype='float64')
+    m = log_ais_w.max()
+    w = np.exp(log_ais_w - m)
+    dlogz = np.log(w.mean()) + m
+    var_dlogz = w.shape[0] * np.square(w).sum() / w.sum() ** 2 - 1.
+    return dlogz, np.sqrt(max(var_dlogz, 0.) / w.shape[0])
+
+
+class ParallelAIS(object):
+    """
+    Runs annealed importance sampling in chunks spread over processes.
+
+    The runs are split into `n_chunks` chunks, each with its own random
+    number generator, so the result depends on `n_chunks` and `seed` but
+    not on `n_jobs`, on the machine or on interruptions. The temperatures
+    are processed `checkpoint_period` at a time: after each period the
+    estimate is logged and, if `checkpoint` is given, the states and
+    log-weights are saved there. A `ParallelAIS` built with an existing
+    checkpoint resumes from it.
+
+    Parameters
+    ----------
+    annealing : object
+        The annealing path. It must be picklable and implement
+        `log_z_base()`, `sample_base(n, rng)`, `free_energies(state,
+        betas)` and `sample(state, beta, rng)`, as `BinaryDBMAnnealing`
+        does.
+    n_runs : int
+        The number of AIS runs.
+    betas : numpy.ndarray, optional
+        The increasing inverse temperatures, from 0 to 1. Defaults to
+        `default_betas()`.
+    n_jobs : int, optional
+        The number of worker processes. Defaults to the number of CPUs.
+        With 1, everything runs in the calling process.
+    n_chunks : int, optional
+        The number of chunks the runs are split into, and so the maximum
+        number of processes used at once. It is fixed rather than derived
+        from `n_jobs`, which defaults to the number of CPUs, so that the
+        estimate does not change with the machine.
+    checkpoint : str, optional
+        The path of the checkpoint file.
+    checkpoint_period : int, optional
+        The number of temperatures between checkpoints and log messages.
+    seed : int or list, optional
+        The seed of the random number generators.
+    """
+
+    def __init__(self, annealing, n_runs, betas=None, n_jobs=None,
+                 n_chunks=16, checkpoint=None, checkpoint_period=1000,
+                 seed=None):
+        if betas is None:
+            betas = default_betas()
+        betas = np.asarray(betas, dtype='float64')
+        if betas[0] != 0. or betas[-1] != 1. or np.any(np.diff(betas) < 0):
+            raise ValueError("betas must increase from 0 to 1.")
+        if n_jobs is None:
+            n_jobs = multiprocessing.cpu_count()
+        n_chunks = min(n_chunks, n_runs)
+
+        self.annealing = annealing
+        self.n_runs = n_runs
+        self.betas = betas
+        self.n_jobs = n_jobs
+        self.checkpoint = checkpoint
+        self.checkpoint_period = checkpoint_period
+        self.history = []
+
+        if checkpoint is not None and os.path.exists(checkpoint):
+            self._load(checkpoint)
+            return
+
+        rng = make_np_rng(seed, [2015, 10, 18], which_method='randint')
+        sizes = [len(chunk) for chunk in
+                 np.array_split(np.arange(n_runs), n_chunks)]
+        self.rngs = [np.random.RandomState(rng.randint(2 ** 30))
+                     for size in sizes]
+        self.states = [annealing.sample_base(size, chunk_rng)
+                       for size, chunk_rng in zip(sizes, self.rngs)]
+        self.log_ais_w = [np.zeros(size) for size in sizes]
+        self.step = 0
+
+    def _load(self, path):
+        """
+        Restores the progress saved in a checkpoint.
+
+        Parameters
+        ----------
+        path : str
+            The path of the checkpoint.
+        """
+        saved = serial.load(path)
+        if saved['n_runs'] != self.n_runs or \
+                not np.array_equal(saved['betas'], self.betas):
+            raise ValueError("The checkpoint %s was made with different "
+                             "runs or temperatures." % path)
+        self.states = saved['states']
+        self.log_ais_w = saved['log_ais_w']
+        self.rngs = saved['rngs']
+        self.step = saved['step']
+        self.history = saved['history']
+        logger.info("Resuming AIS from temperature {0}/{1} of {2}"
+                    .format(self.step, len(self.betas) - 1, path))
+
+    def _save(self):
+        """
+        Saves the progress to the checkpoint.
+        """
+        serial.save(self.checkpoint,
+                    {'n_runs': self.n_runs,
+                     'betas': self.betas,
+                     'states': self.states,
+                     'log_ais_w': self.log_ais_w,
+                     'rngs': self.rngs,
+                     'step': self.step,
+                     'history': self.history},
+                    on_overwrite='backup')
+
+    def estimate(self):
+        """
+        Estimates the log-partition function at the current temperature.
+
+        Returns
+        -------
+        log_z : float
+            The estimate of the log-partition function of the distribution
+            at inverse temperature `betas[step]`, which is the target
+            model once `run` is over.
+        std_err : float
+            The standard error of the estimate.
+        """
+        dlogz, std_err = estimate_from_weights(np.hstack(self.log_ais_w))
+        return self.annealing.log_z_base() + dlogz, std_err
+
+    def run(self, n_steps=None):
+        """
+        Runs AIS until the last temperature.
+
+        Parameters
+        ----------
+        n_steps : int, optional
+            If given, stops after this many temperatures, so that a long
+            estimate can be split into several jobs through the checkpoint.
+
+        Returns
+        -------
+        log_z : float
+            See `estimate`.
+        std_err : float
+            See `estimate`.
+        """
+        last = len(self.betas) - 1
+        if n_steps is not None:
+            last = min(last, self.step + n_steps)
+        pool = None
+        if self.n_jobs > 1 and len(self.states) > 1:
+            pool = multiprocessing.Pool(self.n_jobs, _init_worker,
+                                        (self.annealing,))
+        try:
+            t0 = time.time()
+            while self.step < last:
+                end = min(self.step + self.checkpoint_period, last)
+                betas = self.betas[self.step:end + 1]
+                tasks = [(state, log_w, rng, betas) for state, log_w, rng
+                         in zip(self.states, self.log_ais_w, self.rngs)]
+                if pool is None:
+                    results = [_advance(self.annealing, *task)
+                               for task in tasks]
+                else:
+                    results = pool.map(_advance_in_worker, tasks)
+                self.states, self.log_ais_w, self.rngs = \
+                    [list(elem) for elem in zip(*results)]
+                self.step = end
+
+                log_z, std_err = self.estimate()
+                self.history.append((self.betas[end], log_z, std_err))
+                logger.info("AIS temperature {0}/{1} (beta={2:.4f}): "
+                            "log Z = {3:.4f} +/- {4:.4f} ({5:.1f}s)"
+                            .format(end, len(self.betas) - 1,
+                                    self.betas[end], log_z, std_err,
+                                    time.time() - t0))
+                if self.checkpoint is not None:
+                    self._save()
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        return self.estimate()
@@ -1,12 +1,40 @@
 """Tools for estimating the partition function of an RBM"""
+import multiprocessing
+
 import numpy
 from theano.compat.six.moves import xrange
 import theano
 from theano import tensor, config
 from theano.tensor import nnet
+from pylearn2.parallel_ais import BinaryDBMAnnealing, ParallelAIS
+from pylearn2.utils.bit_strings import all_bit_strings, bit_strings_range
 from pylearn2.utils.exc import reraise_as
 from pylearn2.utils.rng import make_np_rng, make_theano_rng
-from pylearn2.utils.mem import improve_memory_error_message
+
+
+def _log_sum_exp(log_total, values):
+    """
+    Returns log(exp(log_total) + sum(exp(values))), computed stably, to
+    accumulate a log-sum-exp over blocks of values.
+
+    Parameters
+    ----------
+    log_total : float
+        The log-sum-exp of the previous values, -inf if there are none.
+    values : numpy.ndarray
+        The new values.
+
+    Returns
+    -------
+    log_total : float
+        The log-sum-exp of all the values.
+    """
+    values = numpy.asarray(values, dtype='float64')
+    m = max(log_total, values.max())
+    if m == -numpy.inf:
+        return m
+    return m + numpy.log(numpy.exp(log_total - m) +
+                         numpy.exp(values - m).sum())
 
 
 def compute_log_z(rbm, free_energy_fn, max_bits=15):
@@ -27,70 +55,151 @@ def compute_log_z(rbm, free_energy_fn, max_bits=15):
     Notes
     -----
     This function enumerates a sum with exponentially many terms, and
-    should not be used with more than a small, toy model.
+    should not be used with more than a small, toy model. See
+    `rbm_log_z` for a faster version that doesn't need a free energy
+    function.
     """
     # Pick whether to iterate over visible or hidden states.
     if rbm.nvis < rbm.nhid:
         width = rbm.nvis
-        type = 'vis'
     else:
         width = rbm.nhid
-        type = 'hid'
 
     # Determine in how many steps to compute Z.
     block_bits = width if (not max_bits or width < max_bits) else max_bits
     block_size = 2 ** block_bits
+    high_bits = width - block_bits
 
     # Allocate storage for 2**block_bits of the 2**width possible
     # configurations.
     try:
-        logz_data_c = numpy.zeros(
-            (block_size, width),
-            order='C',
-            dtype=config.floatX
-        )
+        logz_data = numpy.empty((block_size, width), order='F',
+                                dtype=config.floatX)
     except MemoryError:
         reraise_as(MemoryError("failed to allocate (%d, %d) matrix of "
                                "type %s in compute_log_z; try a smaller "
                                "value of max_bits" %
-                          (block_size, width, str(config.floatX))))
+                               (block_size, width, str(config.floatX))))
 
-    # fill in the first block_bits, which will remain fixed for all
+    # fill in the last block_bits, which will remain fixed for all
     # 2**width configs
-    tensor_10D_idx = numpy.ndindex(*([2] * block_bits))
-    for i, j in enumerate(tensor_10D_idx):
-        logz_data_c[i, -block_bits:] = j
-    try:
-        logz_data = numpy.array(logz_data_c, order='F', dtype=config.floatX)
-    except MemoryError:
-        reraise_as(MemoryError("failed to allocate (%d, %d) matrix of "
-                               "type %s in compute_log_z; try a smaller "
-                               "value of max_bits" %
-                          (block_size, width, str(config.floatX))))
-
-    # Allocate storage for (negative) free-energy of all 2**width
-    # configurations.
-    try:
-        nFE = numpy.zeros(2 ** width, dtype=config.floatX)
-    except MemoryError as e:
-        improve_memory_error_message(e, 
-            "failed to allocate free energy storage "
-            "array in compute_log_z; your model is too "
-            "big to use with this function")
+    logz_data[:, high_bits:] = all_bit_strings(block_bits,
+                                               dtype=config.floatX)
 
     # now loop 2**(width - block_bits) times, filling in the
-    # most-significant bits
-    for bi, up_bits in enumerate(numpy.ndindex(*([2] * (width - block_bits)))):
-        logz_data[:, :width - block_bits] = up_bits
-        nFE[bi * block_size:(bi + 1) * block_size] = -free_energy_fn(logz_data)
-    alpha = nFE.max()
-    # Do the subtraction and exponentiation in-place so as to not incur a copy.
-    nFE -= alpha
-    numpy.exp(nFE, nFE)
-    log_z = numpy.log(nFE.sum()) + alpha
+    # most-significant bits, and accumulate the log-sum-exp of the
+    # negative free energies
+    log_z = -numpy.inf
+    for up_bits in xrange(2 ** high_bits):
+        logz_data[:, :high_bits] = bit_strings_range(high_bits, up_bits,
+                                                     up_bits + 1)
+        log_z = _log_sum_exp(log_z, -free_energy_fn(logz_data))
+    return log_z
+
+
+def _rbm_log_z_blocks(args):
+    """
+    Computes the log-sum-exp of the negative free energies of a range of
+    blocks of states of the enumerated layer of an RBM.
+
+    Parameters
+    ----------
+    args : tuple
+        The weights, from the enumerated layer to the other one, the
+        biases of both layers, the number of bits enumerated within a
+        block, and the range of blocks.
+
+    Returns
+    -------
+    log_z : float
+        The log-sum-exp.
+    """
+    weights, bias, other_bias, block_bits, start, stop = args
+    high_bits = weights.shape[0] - block_bits
+
+    # The products with the low bits are the same for all the blocks:
+    # only the contribution of the high bits changes.
+    low = all_bit_strings(block_bits, dtype=weights.dtype)
+    low_act = numpy.dot(low, weights[high_bits:]) + other_bias
+    low_term = numpy.dot(low, bias[high_bits:])
+    act = numpy.empty_like(low_act)
+    buf = numpy.empty_like(low_act)
+
+    log_z = -numpy.inf
+    for high in bit_strings_range(high_bits, start, stop,
+                                  dtype=weights.dtype):
+        numpy.add(low_act, numpy.dot(high, weights[:high_bits]), out=act)
+        # softplus(act) = max(act, 0) + log(1 + exp(-|act|)), in place,
+        # which is several times faster than numpy.logaddexp
+        numpy.abs(act, out=buf)
+        numpy.negative(buf, out=buf)
+        numpy.exp(buf, out=buf)
+        numpy.log1p(buf, out=buf)
+        numpy.maximum(act, 0, out=act)
+        act += buf
+        log_z = _log_sum_exp(log_z, act.sum(axis=1) + low_term +
+                             numpy.dot(high, bias[:high_bits]))
     return log_z
 
 
+def rbm_log_z(rbm_params, max_bits=15, n_jobs=1):
+    """
+    Computes the exact log partition function of a binary-binary RBM by
+    enumerating the states of its smaller layer with NumPy.
+
+    The states are enumerated by blocks of `2 ** max_bits`, which share
+    their least significant bits, so that the products with the weights
+    are computed once for all the blocks. The blocks can be spread over
+    several processes.
+
+    Parameters
+    ----------
+    rbm_params : list
+        list of `numpy.ndarrays` containing model parameters:
+        [weights,visbias,hidbias]
+    max_bits : int, optional
+        The (base-2) log of the number of states to enumerate at a time.
+    n_jobs : int, optional
+        The number of processes.
+
+    Returns
+    -------
+    log_z : float
+        The log partition function.
+
+    Notes
+    -----
+    The cost is exponential in the size of the smaller layer, which
+    should not have many more than 25 units.
+    """
+    weights, visbias, hidbias = [numpy.asarray(param, dtype='float64')
+                                 for param in rbm_params]
+    if visbias.shape[0] < hidbias.shape[0]:
+        bias, other_bias = visbias, hidbias
+    else:
+        weights, bias, other_bias = weights.T, hidbias, visbias
+    weights = numpy.ascontiguousarray(weights)
+
+    width = weights.shape[0]
+    block_bits = min(width, max_bits)
+    num_blocks = 2 ** (width - block_bits)
+    bounds = numpy.linspace(0, num_blocks, min(num_blocks, 4 * n_jobs) + 1)
+    bounds = numpy.round(bounds).astype('int64')
+    tasks = [(weights, bias, other_bias, block_bits, start, stop)
+             for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    if n_jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(n_jobs)
+        try:
+            results = pool.map(_rbm_log_z_blocks, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_rbm_log_z_blocks(task) for task in tasks]
+    return _log_sum_exp(-numpy.inf, results)
+
+
 def compute_nll(rbm, data, log_z, free_energy_fn, bufsize=1000, preproc=None):
     """
     .. todo::
@@ -161,19 +270,7 @@ def rbm_ais(rbm_params, n_runs, visbias_a=None, data=None,
 
     rng = make_np_rng(rng, seed, ['random_sample', 'rand'])
 
-    if data is None:
-        if visbias_a is None:
-            # configure base-rate biases to those supplied by user
-            visbias_a = visbias
-        else:
-            visbias_a = visbias_a
-    else:
-        # set biases of base-rate model to ML solution
-        data = numpy.asarray(data, dtype=config.floatX)
-        data = numpy.mean(data, axis=0)
-        data = numpy.minimum(data, 1 - 1e-5)
-        data = numpy.maximum(data, 1e-5)
-        visbias_a = -numpy.log(1. / data - 1)
+    visbias_a = _base_rate_visbias(visbias, visbias_a, data)
     hidbias_a = numpy.zeros_like(hidbias)
     weights_a = numpy.zeros_like(weights)
     # generate exact sample for the base model
@@ -191,6 +288,84 @@ def rbm_ais(rbm_params, n_runs, visbias_a=None, data=None,
     return (ais.log_zb, var_dlogz), ais
 
 
+def _base_rate_visbias(visbias, visbias_a=None, data=None):
+    """
+    Returns the visible biases of the base-rate model used by AIS.
+
+    Parameters
+    ----------
+    visbias : numpy.ndarray
+        The visible biases of the RBM.
+    visbias_a : numpy.ndarray, optional
+        See `rbm_ais`.
+    data : numpy.ndarray, optional
+        See `rbm_ais`.
+
+    Returns
+    -------
+    visbias_a : numpy.ndarray
+        The visible biases of the base-rate model.
+    """
+    if data is None:
+        if visbias_a is None:
+            # configure base-rate biases to those supplied by user
+            visbias_a = visbias
+        return visbias_a
+    # set biases of base-rate model to ML solution
+    data = numpy.asarray(data, dtype=config.floatX)
+    data = numpy.mean(data, axis=0)
+    data = numpy.minimum(data, 1 - 1e-5)
+    data = numpy.maximum(data, 1e-5)
+    return -numpy.log(1. / data - 1)
+
+
+def rbm_ais_parallel(rbm_params, n_runs, visbias_a=None, data=None,
+                     betas=None, n_jobs=None, checkpoint=None, seed=23098):
+    """
+    Implements Annealed Importance Sampling for Binary-Binary RBMs with
+    the runs spread over several processes, using
+    `pylearn2.parallel_ais.ParallelAIS`.
+
+    Parameters
+    ----------
+    rbm_params : list
+        list of `numpy.ndarrays` containing model parameters:
+        [weights,visbias,hidbias]
+    n_runs : int
+        Number of particles to use in AIS simulation
+    visbias_a : numpy.ndarray, optional
+        See `rbm_ais`.
+    data : numpy.ndarray, optional
+        See `rbm_ais`.
+    betas : numpy.ndarray, optional
+        Vector specifying inverse temperature of intermediate
+        distributions (in increasing order, from 0 to 1).
+        If None, defaults to the same temperatures as AIS.dflt_beta
+    n_jobs : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    checkpoint : str, optional
+        If given, the partial AIS weights are saved to this file, and
+        the estimate is resumed from it if it exists.
+    seed : int, optional
+        Seed of the random number generators.
+
+    Returns
+    -------
+    (log_z, std_err) : tuple
+        The estimate of the log-partition function of the RBM and its
+        standard error.
+    ais : ParallelAIS
+        The object that ran AIS.
+    """
+    (weights, visbias, hidbias) = rbm_params
+    visbias_a = _base_rate_visbias(visbias, visbias_a, data)
+    annealing = BinaryDBMAnnealing([weights], [visbias, hidbias],
+                                   base_bias=visbias_a)
+    ais = ParallelAIS(annealing, n_runs, betas=betas, n_jobs=n_jobs,
+                      checkpoint=checkpoint, seed=seed)
+    return ais.run(), ais
+
+
 def rbm_z_ratio(rbmA_params, rbmB_params, n_runs, v0=None,
                 betas=None, key_betas=None, rng=None, seed=23098):
     """
@@ -45,3 +45,26 @@ class ContextualBanditAlgorithm(Algorithm):
         if r.ndim > 0:
             r = r.mean()
         self.agent.reward_record.append(r)
+
+
+class BatchContextualBanditAlgorithm(Algorithm):
+    """
+    Drives many independent contextual bandit learning problems in
+    lockstep, with a batch environment returning (num_runs, batch_size,
+    ...) arrays and a batch agent acting on them.
+
+    The reward recorded at each step is a vector of the mean reward of
+    each run. Non-contextual batch problems are driven by `Algorithm`,
+    which records the vectors of rewards as they are.
+    """
+
+    def setup(self, agent, environment):
+        self.context_func = environment.get_context_func()
+        super(BatchContextualBanditAlgorithm, self).setup(agent, environment)
+
+    def train(self):
+        s = self.context_func()
+        a = self.decide_func(s)
+        r = self.action_func(a)
+        self.learn_func(s, a, r)
+        self.agent.reward_record.append(r.mean(axis=1))
@@ -9,6 +9,7 @@ from theano import tensor as T
 from pylearn2.compat import OrderedDict
 from pylearn2.sandbox.lisa_rl.bandit.agent import Agent
 from pylearn2.utils import sharedX
+from pylearn2.utils.rng import make_np_rng
 
 class AverageAgent(Agent):
     """
@@ -68,3 +69,78 @@ class AverageAgent(Agent):
         rval = function([a, r], updates=updates)
 
         return rval
+
+
+class BatchAverageAgent(Agent):
+    """
+    `num_runs` independent `AverageAgent`s, which act and learn in
+    lockstep on vectors of actions and rewards, one per run.
+
+    The initial reward estimate and the exploration rate may differ
+    between runs, so that a hyperparameter sweep is a single batch of
+    runs.
+
+    Parameters
+    ----------
+    init_reward_estimate : float or array_like
+        The initial estimated reward of each arm, either the same for
+        all runs or a vector of one value per run.
+    num_arms : int
+        The number of arms of the bandits.
+    num_runs : int
+        The number of independent agents.
+    epsilon : float or array_like, optional
+        The probability of playing a random arm instead of the arm with
+        the highest estimated reward, either the same for all runs or a
+        vector of one value per run.
+    seed : int or list, optional
+        The seed of the random number generator used for exploration.
+    """
+
+    def __init__(self, init_reward_estimate, num_arms, num_runs, epsilon=0.,
+                 seed=None):
+        self.__dict__.update(locals())
+        del self.self
+        self.rng = make_np_rng(seed, [2013, 11, 12],
+                               which_method=["uniform", "randint"])
+        self.estimated_rewards = np.zeros((num_runs, num_arms)) + \
+            np.asarray(init_reward_estimate)[..., np.newaxis]
+        self.observation_counts = np.zeros((num_runs, num_arms))
+        self.epsilon = np.zeros(num_runs) + epsilon
+
+    def get_decide_func(self):
+        """
+        Returns a callable that returns a vector of one action per run.
+        """
+
+        def rval():
+            actions = np.argmax(self.estimated_rewards, axis=1)
+            explore = self.rng.uniform(size=self.num_runs) < self.epsilon
+            actions[explore] = self.rng.randint(self.num_arms,
+                                                size=explore.sum())
+            return actions
+
+        return rval
+
+    def get_learn_func(self):
+        """
+        Returns a callable that takes a vector of one action per run and
+        a vector of one reward per run, and updates the running averages
+        of the played arms.
+        """
+
+        runs = np.arange(self.num_runs)
+
+        def rval(a, r):
+            self.observation_counts[runs, a] += 1.
+            delta = r - self.estimated_rewards[runs, a]
+            self.estimated_rewards[runs, a] += \
+                delta / self.observation_counts[runs, a]
+
+        return rval
+
+    def get_param_values(self):
+        """
+        Returns the arrays of the state of the agents.
+        """
+        return [self.estimated_rewards, self.observation_counts]
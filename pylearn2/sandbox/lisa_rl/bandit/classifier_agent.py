@@ -3,12 +3,13 @@ __author__ = "Ian Goodfellow"
 import logging
 import time
 
+import numpy as np
 from theano import function
 import theano.tensor as T
 
 from pylearn2.sandbox.lisa_rl.bandit.agent import Agent
 from pylearn2.utils import sharedX
-from pylearn2.utils.rng import make_theano_rng
+from pylearn2.utils.rng import make_np_rng, make_theano_rng
 
 
 logger = logging.getLogger(__name__)
@@ -156,3 +157,154 @@ class ClassifierAgent(Agent):
 
     def fprop(self, state_below):
         return self.mlp.fprop(state_below)
+
+
+class BatchLinearClassifierAgent(Agent):
+    """
+    `num_runs` independent contextual bandit agents for classification
+    tasks, which act and learn in lockstep on arrays of contexts.
+
+    Each run is a `ClassifierAgent` whose model is a softmax regression
+    trained by SGD on the same fake targets, so that the models of all
+    the runs are stacked into (num_runs, num_features, num_classes)
+    weights and each step is a few batched matrix products instead of
+    one compiled function call per run. The learning rate and the
+    exploration rates may differ between runs, so that a hyperparameter
+    sweep is a single batch of runs.
+
+    Parameters
+    ----------
+    num_runs : int
+        The number of independent agents.
+    num_features : int
+        The dimension of the contexts.
+    num_classes : int
+        The number of classes, i.e. of actions.
+    learning_rate : float or array_like
+        The learning rate, either the same for all runs or a vector of
+        one value per run.
+    stochastic : bool, optional
+        If True, samples actions from P(y | x) otherwise, uses
+        argmax_y P(y | x)
+    epsilon : float or array_like, optional
+        The probability of taking a uniformly random action.
+    epsilon_stochastic : float or array_like, optional
+        The probability of sampling the action from P(y | x) instead.
+    neg_target : bool, optional
+        Use the action with a negative target when it was not rewarded.
+    ignore_wrong : bool, optional
+        Only learn from rewarded actions.
+    irange : float, optional
+        The weights are initialized uniformly in (-irange, irange).
+    seed : int or list, optional
+        The seed of the random number generator.
+    """
+
+    def __init__(self, num_runs, num_features, num_classes, learning_rate,
+                 stochastic=False, epsilon=None, neg_target=False,
+                 ignore_wrong=False, epsilon_stochastic=None, irange=0.,
+                 seed=None):
+        self.__dict__.update(locals())
+        del self.self
+        assert sum([self.neg_target, self.ignore_wrong]) <= 1
+
+        self.rng = make_np_rng(seed, [2013, 11, 20],
+                               which_method=["uniform", "randint"])
+        self.W = self.rng.uniform(-irange, irange,
+                                  (num_runs, num_features, num_classes))
+        self.b = np.zeros((num_runs, num_classes))
+        self.learning_rate = np.zeros(num_runs) + learning_rate
+        if epsilon is not None:
+            self.epsilon = np.zeros(num_runs) + epsilon
+        if epsilon_stochastic is not None:
+            self.epsilon_stochastic = np.zeros(num_runs) + epsilon_stochastic
+
+    def fprop(self, contexts):
+        """
+        Computes P(y | x) for each run.
+
+        Parameters
+        ----------
+        contexts : ndarray
+            A (num_runs, batch_size, num_features) array of contexts.
+
+        Returns
+        -------
+        y_hat : ndarray
+            The (num_runs, batch_size, num_classes) class probabilities.
+        """
+        z = np.einsum('rbf,rfc->rbc', contexts, self.W) + \
+            self.b[:, np.newaxis, :]
+        z -= z.max(axis=2)[..., np.newaxis]
+        y_hat = np.exp(z)
+        y_hat /= y_hat.sum(axis=2)[..., np.newaxis]
+        return y_hat
+
+    def _sample(self, pvals):
+        """
+        Draws one-hot samples from the last axis of `pvals`.
+        """
+        cdf = pvals.cumsum(axis=2)
+        u = self.rng.uniform(size=pvals.shape[:2])[..., np.newaxis]
+        idx = np.minimum((cdf < u).sum(axis=2), self.num_classes - 1)
+        return np.eye(self.num_classes)[idx]
+
+    def get_decide_func(self):
+        """
+        Returns a callable that takes a (num_runs, batch_size,
+        num_features) array of contexts and returns a (num_runs,
+        batch_size, num_classes) array of one-hot codes for actions.
+        """
+
+        def rval(contexts):
+            y_hat = self.fprop(contexts)
+            if self.stochastic:
+                a = self._sample(y_hat)
+            else:
+                a = np.eye(self.num_classes)[y_hat.argmax(axis=2)]
+            if self.epsilon is not None:
+                epsilon = self.epsilon[:, np.newaxis, np.newaxis]
+                a = self._sample((1. - epsilon) * a +
+                                 epsilon / self.num_classes)
+            if self.epsilon_stochastic is not None:
+                epsilon = self.epsilon_stochastic[:, np.newaxis, np.newaxis]
+                a = self._sample((1. - epsilon) * a + epsilon * y_hat)
+            return a
+
+        return rval
+
+    def get_learn_func(self):
+        """
+        Returns a callable that does a learning update of every run when
+        passed the contexts, the actions that the agents chose, and the
+        rewards they got, with the fake targets of `ClassifierAgent`.
+        """
+
+        def rval(contexts, actions, rewards):
+            rewards = rewards[..., np.newaxis]
+            if self.neg_target:
+                fake_targets = actions * (2. * rewards - 1.)
+            elif self.ignore_wrong:
+                fake_targets = actions * rewards
+            else:
+                roads_not_taken = (1. - actions) / (self.num_classes - 1.)
+                fake_targets = (actions * rewards +
+                                roads_not_taken * (1. - rewards))
+
+            # Gradient of the negative log-likelihood of the fake targets
+            # with respect to the pre-softmax activations
+            y_hat = self.fprop(contexts)
+            delta = (y_hat * fake_targets.sum(axis=2)[..., np.newaxis] -
+                     fake_targets) / contexts.shape[1]
+            lr = self.learning_rate[:, np.newaxis]
+            self.W -= lr[..., np.newaxis] * np.einsum('rbf,rbc->rfc',
+                                                      contexts, delta)
+            self.b -= lr * delta.sum(axis=1)
+
+        return rval
+
+    def get_param_values(self):
+        """
+        Returns the arrays of the parameters of the agents.
+        """
+        return [self.W, self.b]
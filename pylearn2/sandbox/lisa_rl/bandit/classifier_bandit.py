@@ -1,6 +1,9 @@
 __author__ = "Ian Goodfellow"
 
+import numpy as np
+
 from pylearn2.sandbox.lisa_rl.bandit.environment import Environment
+from pylearn2.utils.rng import make_np_rng
 
 class ClassifierBandit(Environment):
     """
@@ -53,3 +56,65 @@ class ClassifierBandit(Environment):
         """
 
         raise NotImplementedError()
+
+
+class BatchClassifierBandit(Environment):
+    """
+    `num_runs` independent contextual bandits based on the same
+    classification problem, simulated in lockstep with NumPy arrays.
+
+    At each step, each run draws its own minibatch of examples from the
+    dataset, and gets reward 1 for each example whose class it selects
+    and 0 otherwise, as in `ClassifierBandit`.
+
+    Parameters
+    ----------
+    dataset : DenseDesignMatrix
+        The classification problem, with one-hot targets or with integer
+        labels and `y_labels` set.
+    batch_size : int
+        The number of contexts per run and per step.
+    num_runs : int
+        The number of independent bandits.
+    seed : int or list, optional
+        The seed of the random number generator drawing the contexts.
+    """
+
+    def __init__(self, dataset, batch_size, num_runs, seed=None):
+        self.__dict__.update(locals())
+        del self.self
+        self.rng = make_np_rng(seed, [2013, 11, 20],
+                               which_method="randint")
+        self._X = dataset.get_design_matrix()
+        y = dataset.y
+        if y.ndim == 1 or y.shape[1] == 1:
+            y = np.eye(dataset.y_labels, dtype=self._X.dtype)[y.ravel()]
+        self._y = y
+
+    def get_context_func(self):
+        """
+        Returns a callable that takes no arguments and returns a
+        (num_runs, batch_size, num_features) array of contexts.
+        """
+
+        def rval():
+            idx = self.rng.randint(len(self._X),
+                                   size=(self.num_runs, self.batch_size))
+            self.y_cache = self._y[idx]
+            return self._X[idx]
+
+        return rval
+
+    def get_action_func(self):
+        """
+        Returns a callable that takes a (num_runs, batch_size,
+        num_classes) array of one-hot actions and returns the
+        (num_runs, batch_size) rewards.
+        Assumes that this function has been called after a call to
+        context_func that gave the contexts used to choose the actions.
+        """
+
+        def rval(a):
+            return (a * self.y_cache).sum(axis=2)
+
+        return rval
@@ -43,3 +43,51 @@ class GaussianBandit(Environment):
                 dtype=config.floatX, size=reward_mean.shape)
         rval = function([action], reward)
         return rval
+
+
+class BatchGaussianBandit(Environment):
+    """
+    `num_runs` independent n-armed Gaussian bandits, simulated in
+    lockstep with NumPy arrays.
+
+    Each run has its own means and standard deviations, drawn as in
+    `GaussianBandit`, and the reward function takes a vector of one
+    action per run and returns a vector of one reward per run.
+
+    Parameters
+    ----------
+    num_arms : int
+        The number of arms of each bandit.
+    num_runs : int
+        The number of independent bandits.
+    mean_std : float, optional
+        The standard deviation of the means of the arms.
+    std_std : float, optional
+        The standard deviation of the Gaussians whose absolute values are
+        the standard deviations of the arms.
+    seed : int or list, optional
+        The seed of the random number generator.
+    """
+
+    def __init__(self, num_arms, num_runs, mean_std=1.0, std_std=1.0,
+                 seed=None):
+        self.rng = make_np_rng(seed, [2013, 11, 12], which_method="randn")
+        self.means = self.rng.randn(num_runs, num_arms) * mean_std
+        self.stds = np.abs(self.rng.randn(num_runs, num_arms) * std_std)
+        self.num_runs = num_runs
+
+    def get_action_func(self):
+        """
+        Returns a callable that takes a vector of one action per run and
+        returns a vector of one reward per run.
+        """
+
+        runs = np.arange(self.num_runs)
+
+        def rval(actions):
+            means = self.means[runs, actions]
+            stds = self.stds[runs, actions]
+            return (means + stds * self.rng.randn(self.num_runs)).astype(
+                config.floatX)
+
+        return rval
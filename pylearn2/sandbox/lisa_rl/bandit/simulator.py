@@ -36,3 +36,55 @@ class Simulator(object):
             if i % 1000 == 0:
                 serial.save(self.save_path, self.agent)
                 logger.info('saved!')
+
+
+class BatchSimulator(object):
+    """
+    Simulates many independent bandit problems in lockstep, for a fixed
+    number of steps.
+
+    The environment and the agent are batch versions, such as
+    `BatchGaussianBandit` and `BatchAverageAgent`, whose state is stored
+    in arrays with one row per run, so each step of all the runs is a
+    few vectorized operations. After `main_loop`, `agent.reward_record`
+    is a (num_steps, num_runs) array of rewards.
+
+    Parameters
+    ----------
+    agent : Agent
+        A batch agent, with a `get_param_values` method.
+    environment : Environment
+        A batch environment.
+    algorithm : Algorithm
+        `Algorithm` for bandit problems, or
+        `BatchContextualBanditAlgorithm` for contextual ones.
+    num_steps : int
+        The number of steps to simulate.
+    save_path : str, optional
+        If given, the agent is saved there at the end of the simulation.
+    """
+    def __init__(self, agent, environment, algorithm, num_steps,
+                 save_path=None):
+        self.__dict__.update(locals())
+        del self.self
+
+    def main_loop(self):
+        """
+        Runs the simulation.
+
+        Returns
+        -------
+        reward_record : ndarray
+            The (num_steps, num_runs) rewards.
+        """
+        self.algorithm.setup(agent=self.agent, environment=self.environment)
+        for i in range(self.num_steps):
+            self.algorithm.train()
+        for param in self.agent.get_param_values():
+            assert not contains_nan(param)
+            assert not contains_inf(param)
+        self.agent.reward_record = np.asarray(self.agent.reward_record)
+        if self.save_path is not None:
+            serial.save(self.save_path, self.agent)
+            logger.info('saved!')
+        return self.agent.reward_record
@@ -0,0 +1,139 @@
+"""
+Tests of the batch bandit environments, agents and simulator.
+"""
+import numpy as np
+
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.sandbox.lisa_rl.bandit.algorithm import (
+    Algorithm, BatchContextualBanditAlgorithm)
+from pylearn2.sandbox.lisa_rl.bandit.average_agent import BatchAverageAgent
+from pylearn2.sandbox.lisa_rl.bandit.classifier_agent import (
+    BatchLinearClassifierAgent)
+from pylearn2.sandbox.lisa_rl.bandit.classifier_bandit import (
+    BatchClassifierBandit)
+from pylearn2.sandbox.lisa_rl.bandit.gaussian_bandit import (
+    BatchGaussianBandit)
+from pylearn2.sandbox.lisa_rl.bandit.simulator import BatchSimulator
+
+
+def test_batch_average_agent():
+    """
+    Checks the running averages of BatchAverageAgent against a loop over
+    the runs.
+    """
+    rng = np.random.RandomState(0)
+    init = np.array([0., 5., 1.])
+    agent = BatchAverageAgent(init, num_arms=4, num_runs=3)
+    decide = agent.get_decide_func()
+    learn = agent.get_learn_func()
+
+    estimates = np.tile(init[:, None], (1, 4))
+    counts = np.zeros((3, 4))
+    for step in range(30):
+        a = rng.randint(4, size=3)
+        r = rng.randn(3)
+        learn(a, r)
+        for run in range(3):
+            counts[run, a[run]] += 1
+            estimates[run, a[run]] += ((r[run] - estimates[run, a[run]]) /
+                                       counts[run, a[run]])
+        np.testing.assert_allclose(agent.estimated_rewards, estimates)
+        np.testing.assert_array_equal(agent.observation_counts, counts)
+        # Without exploration, the agents play their best arms
+        np.testing.assert_array_equal(decide(), estimates.argmax(axis=1))
+
+
+def _fake_targets(actions, rewards, neg_target, ignore_wrong):
+    """
+    Computes the fake targets of ClassifierAgent for one run.
+    """
+    rewards = rewards[:, None]
+    if neg_target:
+        return actions * (2. * rewards - 1.)
+    elif ignore_wrong:
+        return actions * rewards
+    roads_not_taken = (1. - actions) / (actions.shape[1] - 1.)
+    return actions * rewards + roads_not_taken * (1. - rewards)
+
+
+def _nll(W, b, X, targets):
+    """
+    The negative log-likelihood of the targets under a softmax regression.
+    """
+    z = np.dot(X, W) + b
+    z -= z.max(axis=1)[:, None]
+    log_p = z - np.log(np.exp(z).sum(axis=1))[:, None]
+    return -(targets * log_p).sum(axis=1).mean()
+
+
+def test_batch_linear_classifier_agent_gradient():
+    """
+    Checks a learning step of BatchLinearClassifierAgent against a
+    finite-difference gradient, for each kind of fake targets.
+    """
+    rng = np.random.RandomState(1)
+    num_runs, batch_size, num_features, num_classes = 2, 5, 4, 3
+    learning_rate = np.array([.1, .2])
+    contexts = rng.randn(num_runs, batch_size, num_features)
+    actions = np.eye(num_classes)[rng.randint(num_classes,
+                                              size=(num_runs, batch_size))]
+    rewards = rng.randint(2, size=(num_runs, batch_size)).astype('float64')
+    eps = 1e-6
+
+    for neg_target, ignore_wrong in [(False, False), (True, False),
+                                     (False, True)]:
+        agent = BatchLinearClassifierAgent(
+            num_runs, num_features, num_classes, learning_rate,
+            neg_target=neg_target, ignore_wrong=ignore_wrong, irange=.5,
+            seed=2)
+        W, b = agent.W.copy(), agent.b.copy()
+        agent.get_learn_func()(contexts, actions, rewards)
+
+        for run in range(num_runs):
+            targets = _fake_targets(actions[run], rewards[run], neg_target,
+                                    ignore_wrong)
+            for param, new_param in [(W, agent.W), (b, agent.b)]:
+                grad = np.zeros_like(param[run])
+                for i in np.ndindex(*grad.shape):
+                    values = []
+                    for sign in [1, -1]:
+                        shifted = param[run].copy()
+                        shifted[i] += sign * eps
+                        if param is W:
+                            values.append(_nll(shifted, b[run],
+                                               contexts[run], targets))
+                        else:
+                            values.append(_nll(W[run], shifted,
+                                               contexts[run], targets))
+                    grad[i] = (values[0] - values[1]) / (2 * eps)
+                step = (param[run] - new_param[run]) / learning_rate[run]
+                np.testing.assert_allclose(step, grad, rtol=1e-4, atol=1e-7)
+
+
+def test_batch_simulator():
+    """
+    Checks that BatchSimulator records one reward per step and per run,
+    for bandit and contextual bandit problems.
+    """
+    simulator = BatchSimulator(
+        agent=BatchAverageAgent(5., num_arms=4, num_runs=6, epsilon=.1),
+        environment=BatchGaussianBandit(num_arms=4, num_runs=6),
+        algorithm=Algorithm(),
+        num_steps=20)
+    assert simulator.main_loop().shape == (20, 6)
+
+    rng = np.random.RandomState(3)
+    dataset = DenseDesignMatrix(X=rng.randn(30, 4),
+                                y=rng.randint(3, size=(30, 1)),
+                                y_labels=3)
+    simulator = BatchSimulator(
+        agent=BatchLinearClassifierAgent(5, 4, 3, .1, stochastic=True,
+                                         epsilon=.1,
+                                         epsilon_stochastic=.1),
+        environment=BatchClassifierBandit(dataset, batch_size=4,
+                                          num_runs=5),
+        algorithm=BatchContextualBanditAlgorithm(),
+        num_steps=10)
+    record = simulator.main_loop()
+    assert record.shape == (10, 5)
+    assert np.all((record >= 0) & (record <= 1))
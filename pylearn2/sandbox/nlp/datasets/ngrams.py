@@ -0,0 +1,150 @@
+"""
+An n-gram dataset which stores a stream of tokens only once and builds
+the context windows of each minibatch on demand.
+"""
+__copyright__ = "Copyright 2010-2015, Universite de Montreal"
+__license__ = "3-clause BSD"
+__maintainer__ = "LISA Lab"
+__email__ = "pylearn-dev@googlegroups"
+
+import functools
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from pylearn2.datasets.dataset import Dataset
+from pylearn2.space import CompositeSpace, IndexSpace
+from pylearn2.utils.iteration import (FiniteDatasetIterator,
+                                      resolve_iterator_class)
+from pylearn2.utils.rng import make_np_rng
+
+
+class NGrams(Dataset):
+    """
+    The n-grams of a stream of tokens: each example is a window of
+    `context_len` consecutive tokens, with the token that follows it as
+    target.
+
+    Unlike a `DenseDesignMatrix` of the windows, the tokens are stored
+    once and the windows of a minibatch are gathered when it is
+    requested, so the memory used does not grow with `context_len`.
+
+    Parameters
+    ----------
+    tokens : ndarray
+        A vector of token indices.
+    context_len : int
+        The number of tokens used to predict the next one.
+    max_labels : int
+        The number of distinct tokens.
+    shuffle : bool, optional
+        If `True`, iterate over the n-grams in a random order by
+        default, else sequentially.
+    rng : int or `numpy.random.RandomState`, optional
+        The random number generator used by the stochastic iteration
+        modes.
+    """
+    _default_seed = (17, 2, 946)
+
+    def __init__(self, tokens, context_len, max_labels, shuffle=True,
+                 rng=_default_seed):
+        self._tokens = np.asarray(tokens)
+        if self._tokens.ndim != 1:
+            raise ValueError("tokens must be a vector, not an array of "
+                             "shape %s" % (self._tokens.shape,))
+        if len(self._tokens) <= context_len:
+            raise ValueError("The stream of %d tokens is too short for a "
+                             "context of %d tokens" % (len(self._tokens),
+                                                       context_len))
+        self.context_len = context_len
+        self.max_labels = max_labels
+        self._offsets = np.arange(context_len + 1)
+
+        space = CompositeSpace([
+            IndexSpace(dim=context_len, max_labels=max_labels),
+            IndexSpace(dim=1, max_labels=max_labels)
+        ])
+        self.data_specs = (space, ('features', 'targets'))
+        self._iter_data_specs = self.data_specs
+        self.rng = make_np_rng(rng, which_method='random_integers')
+        self._iter_subset_class = resolve_iterator_class(
+            'shuffled_sequential' if shuffle else 'sequential'
+        )
+
+    @functools.wraps(Dataset.get_num_examples)
+    def get_num_examples(self):
+        return len(self._tokens) - self.context_len
+
+    @functools.wraps(Dataset.has_targets)
+    def has_targets(self):
+        return True
+
+    def get_data_specs(self):
+        """
+        Returns the data_specs specifying how the data is internally stored.
+
+        This is the format the data returned by `self.get_data()` will be.
+        """
+        return self.data_specs
+
+    def get_data(self):
+        """
+        Returns all the n-grams, as read-only strided views of the tokens.
+
+        Returns
+        -------
+        data : tuple
+            The (num_examples, context_len) contexts and the
+            (num_examples, 1) targets.
+        """
+        itemsize = self._tokens.strides[0]
+        windows = as_strided(self._tokens,
+                             shape=(self.get_num_examples(),
+                                    self.context_len + 1),
+                             strides=(itemsize, itemsize))
+        windows.flags.writeable = False
+        return windows[:, :-1], windows[:, -1:]
+
+    def get(self, sources, indexes):
+        """
+        Builds the n-grams of a minibatch.
+
+        Parameters
+        ----------
+        sources : tuple
+            A tuple of source identifiers, 'features' and/or 'targets'.
+        indexes : slice or list
+            A slice or a list of indexes of n-grams.
+
+        Returns
+        -------
+        rval : tuple
+            A tuple of batches, one for each source
+        """
+        if isinstance(indexes, slice):
+            indexes = np.arange(*indexes.indices(self.get_num_examples()))
+        else:
+            indexes = np.asarray(indexes)
+        windows = self._tokens[indexes[:, np.newaxis] + self._offsets]
+        rval = []
+        for source in sources:
+            if source == 'features':
+                rval.append(windows[:, :-1])
+            elif source == 'targets':
+                rval.append(windows[:, -1:])
+            else:
+                raise ValueError('The requested source %s is not part of '
+                                 'the dataset' % source)
+        return tuple(rval)
+
+    @functools.wraps(Dataset.iterator)
+    def iterator(self, mode=None, batch_size=None, num_batches=None,
+                 rng=None, data_specs=None, return_tuple=False):
+        [mode, batch_size, num_batches, rng, data_specs] = \
+            self._init_iterator(mode, batch_size, num_batches, rng,
+                                data_specs)
+        return FiniteDatasetIterator(self,
+                                     mode(self.get_num_examples(),
+                                          batch_size, num_batches, rng),
+                                     data_specs=data_specs,
+                                     return_tuple=return_tuple)
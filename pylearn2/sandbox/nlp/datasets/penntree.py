@@ -14,9 +14,12 @@ import numpy as np
 from numpy.lib.stride_tricks import as_strided
 
 from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.sandbox.nlp.datasets.ngrams import NGrams
 from pylearn2.sandbox.nlp.datasets.text import TextDatasetMixin
 from pylearn2.utils import serial
-from pylearn2.utils.iteration import resolve_iterator_class
+from pylearn2.utils.iteration import (BucketedSequencesSubsetIterator,
+                                      EvenSequencesSubsetIterator,
+                                      resolve_iterator_class)
 from pylearn2.utils.rng import make_np_rng
 from pylearn2.sandbox.rnn.space import SequenceDataSpace
 from pylearn2.space import IndexSpace, CompositeSpace
@@ -112,6 +115,40 @@ class PennTreebankNGrams(DenseDesignMatrix, PennTreebank):
             )
 
 
+class PennTreebankStridedNGrams(NGrams, PennTreebank):
+    """
+    Loads n-grams from the PennTreebank corpus, storing the corpus once
+    and building the context windows of each minibatch on demand.
+
+    Parameters
+    ----------
+    which_set : {'train', 'valid', 'test'}
+        Choose the set to use
+    context_len : int
+        The size of the context i.e. the number of words or chars used
+        to predict the subsequent word.
+    data_mode : {'words', 'chars'}
+        Specifies which PennTreebank corpus to load.
+    shuffle : bool
+        Whether to shuffle the samples or go through the dataset
+        linearly
+
+    Notes
+    -----
+    Gives the same examples as `PennTreebankNGrams`, but a batch is
+    only materialized when it is requested, so it scales to corpora
+    whose windows would not fit in memory.
+    """
+    def __init__(self, which_set, context_len, data_mode, shuffle=True):
+        self.which_set = which_set
+        self.data_mode = data_mode
+        self._load_data(which_set, context_len, data_mode)
+        super(PennTreebankStridedNGrams, self).__init__(
+            tokens=self._raw_data, context_len=context_len,
+            max_labels=self._max_labels, shuffle=shuffle
+        )
+
+
 class PennTreebankSequences(VectorSpacesDataset, PennTreebank):
     """
     Loads sequences from the PennTreebank corpus.
@@ -128,6 +165,17 @@ class PennTreebankSequences(VectorSpacesDataset, PennTreebank):
     shuffle : bool
         Whether to shuffle the samples or go through the dataset
         linearly
+
+    Notes
+    -----
+    The 'even_sequences' and 'bucketed_sequences' iteration modes group
+    the sequences by length, the latter batching sequences of similar
+    lengths together to minimize padding.
+
+    The 'truncated_bptt' iteration mode splits the corpus into
+    `batch_size` contiguous streams and returns their successive chunks
+    of `context_len` tokens, for stateful recurrent layers trained with
+    truncated backpropagation through time.
     """
     def __init__(self, which_set, data_mode, context_len=None, shuffle=True):
         self._load_data(which_set, context_len, data_mode)
@@ -161,6 +209,11 @@ class PennTreebankSequences(VectorSpacesDataset, PennTreebank):
         subset_iterator = resolve_iterator_class(mode)
         if rng is None and subset_iterator.stochastic:
             rng = make_np_rng()
+        if issubclass(subset_iterator, (EvenSequencesSubsetIterator,
+                                        BucketedSequencesSubsetIterator)):
+            # These group the sequences by length
+            return subset_iterator(self.data[0], batch_size, num_batches,
+                                   rng)
         return subset_iterator(self.get_num_examples(), batch_size,
                                num_batches, rng)
 
@@ -0,0 +1,39 @@
+"""
+Tests for pylearn2.sandbox.nlp.datasets.ngrams
+"""
+import numpy as np
+
+from pylearn2.sandbox.nlp.datasets.ngrams import NGrams
+
+
+def test_ngrams():
+    """
+    Checks the n-grams of a sequential and of a shuffled epoch against the
+    materialized context windows.
+    """
+    rng = np.random.RandomState(0)
+    tokens = rng.randint(100, size=1000)
+    context_len = 5
+    windows = np.array([tokens[i:i + context_len + 1]
+                        for i in range(len(tokens) - context_len)])
+
+    dataset = NGrams(tokens, context_len, max_labels=100)
+    assert dataset.get_num_examples() == len(windows)
+    X, y = dataset.get_data()
+    assert np.all(X == windows[:, :-1]) and np.all(y == windows[:, -1:])
+
+    for mode in ['sequential', 'shuffled_sequential']:
+        seen = []
+        for features, targets in dataset.iterator(
+                mode=mode, batch_size=64,
+                data_specs=dataset.get_data_specs()):
+            seen.append(np.hstack((features, targets)))
+        seen = np.vstack(seen)
+        assert seen.shape == windows.shape
+        if mode == 'sequential':
+            assert np.all(seen == windows)
+        else:
+            assert not np.all(seen == windows)
+            order = np.lexsort(seen.T[::-1])
+            assert np.all(seen[order] ==
+                          windows[np.lexsort(windows.T[::-1])])
@@ -1,12 +1,17 @@
 """
 Sandbox multilayer perceptron layers for natural language processing (NLP)
 """
+import numpy as np
 import theano.tensor as T
 from theano import config
+from theano.gof.graph import ancestors
+from theano.sandbox.rng_mrg import MRG_RandomStreams
 
+from pylearn2.model_extensions.norm_constraint import MaxL2FilterNorm
 from pylearn2.models import mlp
 from pylearn2.models.mlp import Layer
 from pylearn2.space import IndexSpace
+from pylearn2.space import Space
 from pylearn2.space import VectorSpace
 from pylearn2.space import CompositeSpace
 from pylearn2.utils import sharedX
@@ -75,12 +80,24 @@ class ProjectionLayer(Layer):
     istdev : numeric
         The standard deviation of the normal distribution used to
         initialize the embeddings. Can't be used with irange.
+    max_row_norm : float, optional
+        Maximum norm of an embedding. With the sparse updates of SGD,
+        only the embeddings of the minibatch are renormalized.
+
+    Notes
+    -----
+    The embeddings are only used through row lookups, so training with
+    `SGD(sparse_updates=True)` only updates the embeddings, and the
+    state of the learning rule, of the labels in the minibatch.
     """
-    def __init__(self, dim, layer_name, irange=None, istdev=None):
+    def __init__(self, dim, layer_name, irange=None, istdev=None,
+                 max_row_norm=None):
         """
         Initializes a projection layer.
         """
         super(ProjectionLayer, self).__init__()
+        if max_row_norm is not None:
+            self.extensions.append(MaxL2FilterNorm(max_row_norm, axis=1))
         self.dim = dim
         self.layer_name = layer_name
         if irange is None and istdev is None:
@@ -189,3 +206,349 @@ class ProjectionLayer(Layer):
         assert isinstance(coeff, float) or hasattr(coeff, 'dtype')
         W, = self.transformer.get_params()
         return coeff * abs(W).sum()
+
+
+def _find_state_below(Y_hat, W):
+    """
+    Finds the input of an output layer by tracing the Theano graph.
+
+    Parameters
+    ----------
+    Y_hat : Variable
+        The output of the `fprop` method of the layer.
+    W : Variable
+        A weight matrix of the layer, that `fprop` multiplies its input
+        by with `T.dot`.
+
+    Returns
+    -------
+    state_below : Variable
+        The left operand of `T.dot(state_below, W)` among the ancestors
+        of `Y_hat`.
+    """
+    candidates = set()
+    for var in ancestors([Y_hat]):
+        node = var.owner
+        if (node is not None and isinstance(node.op, T.basic.Dot) and
+                node.inputs[1] is W):
+            candidates.add(node.inputs[0])
+    if len(candidates) != 1:
+        raise ValueError("Expected Y_hat to be the output of the fprop of "
+                         "the layer owning %s, but found %d products by it "
+                         "among its ancestors" % (W, len(candidates)))
+    return candidates.pop()
+
+
+class SampledSoftmax(mlp.Softmax):
+    """
+    A softmax layer for large numbers of classes, trained with an
+    importance sampling estimate of its cost.
+
+    The partition function of the softmax is estimated from
+    `num_samples` classes drawn from a fixed proposal distribution
+    (shared by the examples of a minibatch), so the cost and its gradient
+    only involve the weights of the targets and of the sampled classes.
+    `fprop` still computes the exact softmax, and the `nll`, `ppl` and
+    `misclass` monitoring channels are exact.
+
+    Parameters
+    ----------
+    n_classes : int
+        Number of classes for softmax targets.
+    layer_name : string
+        Name of the layer.
+    num_samples : int
+        The number of classes sampled to estimate the partition
+        function.
+    proposal : {'log_uniform', 'uniform'}
+        The distribution the classes are sampled from. The log-uniform
+        (Zipfian) distribution, P(k) = log((k + 2) / (k + 1)) /
+        log(n_classes + 1), suits words indexed by decreasing frequency.
+    irange : float
+        If specified, initialized each weight randomly in
+        U(-irange, irange).
+    istdev : float
+        If specified, initialize each weight randomly from
+        N(0,istdev).
+    sparse_init : int
+        If specified, initial sparse_init number of weights
+        for each unit from N(0,1).
+    W_lr_scale : float
+        Scale for weight learning rate.
+    b_lr_scale : float
+        Scale for bias learning rate.
+    max_row_norm : float
+        Maximum norm for a row of the weight matrix.
+    max_col_norm : float
+        Maximum norm for a column of the weight matrix.
+    init_bias_target_marginals : dataset
+        Take the probability distribution of the targets into account to
+        intelligently initialize biases.
+
+    Notes
+    -----
+    The targets are class indices, in an `IndexSpace` of dimension 1.
+    """
+    def __init__(self, n_classes, layer_name, num_samples,
+                 proposal='log_uniform', irange=None, istdev=None,
+                 sparse_init=None, W_lr_scale=None, b_lr_scale=None,
+                 max_row_norm=None, max_col_norm=None,
+                 init_bias_target_marginals=None):
+        if proposal not in ['log_uniform', 'uniform']:
+            raise ValueError("proposal must be 'log_uniform' or 'uniform', "
+                             "not %s" % (proposal,))
+        super(SampledSoftmax, self).__init__(
+            n_classes, layer_name, irange=irange, istdev=istdev,
+            sparse_init=sparse_init, W_lr_scale=W_lr_scale,
+            b_lr_scale=b_lr_scale, max_row_norm=max_row_norm,
+            max_col_norm=max_col_norm,
+            init_bias_target_marginals=init_bias_target_marginals,
+            binary_target_dim=1
+        )
+        self.num_samples = num_samples
+        self.proposal = proposal
+
+    @wraps(Layer.set_input_space)
+    def set_input_space(self, space):
+        super(SampledSoftmax, self).set_input_space(space)
+        self.theano_rng = MRG_RandomStreams(max(self.mlp.rng.randint(2 ** 15),
+                                                1))
+
+    def _log_proposal(self, classes):
+        """
+        Returns the log-probabilities of classes under the proposal.
+
+        Parameters
+        ----------
+        classes : Variable
+            A vector of class indices.
+        """
+        if self.proposal == 'uniform':
+            return T.zeros_like(classes, dtype=config.floatX) - \
+                np.log(self.n_classes)
+        k = T.cast(classes, config.floatX)
+        return T.log(T.log((k + 2.) / (k + 1.)) / np.log(self.n_classes + 1.))
+
+    def _sample_classes(self):
+        """
+        Draws `num_samples` classes from the proposal.
+        """
+        u = self.theano_rng.uniform(size=(self.num_samples,),
+                                    dtype=config.floatX)
+        if self.proposal == 'uniform':
+            k = T.floor(u * self.n_classes)
+        else:
+            k = T.floor(T.exp(u * np.log(self.n_classes + 1.))) - 1.
+        return T.cast(T.clip(k, 0, self.n_classes - 1), 'int64')
+
+    @wraps(Layer.cost)
+    def cost(self, Y, Y_hat):
+        state_below = _find_state_below(Y_hat, self.W)
+        y = Y.flatten()
+        log_prob_of = ((state_below * self.W.T[y]).sum(axis=1) +
+                       self.b[y])
+
+        # log Z ~= log(mean(exp(z_k) / Q(k))) over the sampled classes k
+        classes = self._sample_classes()
+        z = (T.dot(state_below, self.W.T[classes].T) + self.b[classes] -
+             self._log_proposal(classes))
+        mx = z.max(axis=1)
+        log_z = (T.log(T.exp(z - mx.dimshuffle(0, 'x')).sum(axis=1)) + mx -
+                 np.log(self.num_samples))
+        return (log_z - log_prob_of).mean()
+
+    @wraps(Layer.get_layer_monitoring_channels)
+    def get_layer_monitoring_channels(self, state_below=None, state=None,
+                                      targets=None):
+        if state is None and state_below is not None:
+            state = self.fprop(state_below)
+        rval = super(SampledSoftmax, self).get_layer_monitoring_channels(
+            state_below=state_below, state=state)
+        if targets is not None:
+            y_hat = T.argmax(state, axis=1)
+            misclass = T.neq(targets.flatten(), y_hat).mean()
+            rval['misclass'] = T.cast(misclass, config.floatX)
+            rval['nll'] = mlp.Softmax.cost(self, Y=targets, Y_hat=state)
+            rval['ppl'] = T.exp(rval['nll'])
+        return rval
+
+
+class HierarchicalSoftmax(Layer):
+    """
+    A class-factored softmax output layer for large numbers of classes.
+
+    The classes are split into `n_clusters` clusters of consecutive
+    indices, and p(y | x) = p(c(y) | x) p(y | c(y), x) where both
+    factors are softmaxes. The cost only computes the softmax over the
+    clusters and the one over the cluster of each target, which costs
+    O(n_clusters + n_classes / n_clusters) instead of O(n_classes) per
+    example. `fprop` computes the exact distribution over all classes,
+    for evaluation.
+
+    Parameters
+    ----------
+    n_classes : int
+        Number of classes for the targets.
+    layer_name : string
+        Name of the layer.
+    n_clusters : int, optional
+        The number of clusters. Defaults to the square root of
+        `n_classes`, which minimizes the cost.
+    irange : float
+        If specified, initialize each weight randomly in
+        U(-irange, irange).
+    istdev : float
+        If specified, initialize each weight randomly from
+        N(0, istdev).
+
+    Notes
+    -----
+    The targets are class indices, in an `IndexSpace` of dimension 1.
+    Indexing the words of a vocabulary by decreasing frequency makes the
+    clusters frequency bins, which usually works well.
+    """
+    def __init__(self, n_classes, layer_name, n_clusters=None, irange=None,
+                 istdev=None):
+        super(HierarchicalSoftmax, self).__init__()
+        if (irange is None) == (istdev is None):
+            raise ValueError("HierarchicalSoftmax needs exactly one of "
+                             "irange and istdev to initialize its weights")
+        if n_clusters is None:
+            n_clusters = int(np.ceil(np.sqrt(n_classes)))
+        self.n_classes = n_classes
+        self.layer_name = layer_name
+        self.cluster_size = int(np.ceil(n_classes / float(n_clusters)))
+        self.n_clusters = int(np.ceil(n_classes / float(self.cluster_size)))
+        self.irange = irange
+        self.istdev = istdev
+
+        # The last cluster can have fewer classes than the others
+        mask = np.ones(self.n_clusters * self.cluster_size, dtype='int8')
+        mask[n_classes:] = 0
+        self._mask = mask.reshape(self.n_clusters, self.cluster_size)
+
+        self.output_space = VectorSpace(n_classes)
+        self._target_space = IndexSpace(dim=1, max_labels=n_classes)
+
+    @wraps(Layer.set_input_space)
+    def set_input_space(self, space):
+        if not isinstance(space, Space):
+            raise TypeError("Expected Space, got " +
+                            str(space) + " of type " + str(type(space)))
+        self.input_space = space
+        self.input_dim = space.get_total_dimension()
+        self.desired_space = VectorSpace(self.input_dim)
+
+        rng = self.mlp.rng
+        shapes = [(self.input_dim, self.n_clusters),
+                  (self.n_clusters, self.input_dim, self.cluster_size)]
+        if self.irange is not None:
+            W_c, W_w = [rng.uniform(-self.irange, self.irange, shape)
+                        for shape in shapes]
+        else:
+            W_c, W_w = [rng.randn(*shape) * self.istdev for shape in shapes]
+        self.W_c = sharedX(W_c, self.layer_name + '_W_c')
+        self.b_c = sharedX(np.zeros(self.n_clusters),
+                           self.layer_name + '_b_c')
+        self.W_w = sharedX(W_w, self.layer_name + '_W_w')
+        self.b_w = sharedX(np.zeros((self.n_clusters, self.cluster_size)),
+                           self.layer_name + '_b_w')
+        self._params = [self.W_c, self.b_c, self.W_w, self.b_w]
+
+    def _format_input(self, state_below):
+        """
+        Returns the input as a batch of vectors.
+        """
+        self.input_space.validate(state_below)
+        return self.input_space.format_as(state_below, self.desired_space)
+
+    @wraps(Layer.fprop)
+    def fprop(self, state_below):
+        state_below = self._format_input(state_below)
+        p_c = T.nnet.softmax(T.dot(state_below, self.W_c) + self.b_c)
+
+        # The scores of the classes of every cluster, (batch, cluster, k)
+        z = T.tensordot(state_below, self.W_w, axes=[[1], [1]]) + self.b_w
+        z = T.switch(self._mask, z, -np.inf)
+        z = z - z.max(axis=2, keepdims=True)
+        p_w = T.exp(z)
+        p_w = p_w / p_w.sum(axis=2, keepdims=True)
+
+        p = p_c.dimshuffle(0, 1, 'x') * p_w
+        p = p.reshape((state_below.shape[0],
+                       self.n_clusters * self.cluster_size))
+        return p[:, :self.n_classes]
+
+    def log_prob(self, state_below, y):
+        """
+        Computes the log-probabilities of the targets, only evaluating the
+        softmax over the clusters and the one over the cluster of each
+        target.
+
+        Parameters
+        ----------
+        state_below : Variable
+            A batch of inputs, in the desired (vector) space.
+        y : Variable
+            A vector of target class indices.
+
+        Returns
+        -------
+        log_prob : Variable
+            The log-probability of each target.
+        """
+        cluster = y // self.cluster_size
+        position = y % self.cluster_size
+        rows = T.arange(y.shape[0])
+
+        z_c = T.dot(state_below, self.W_c) + self.b_c
+        mx = z_c.max(axis=1)
+        log_p_c = (z_c[rows, cluster] - mx -
+                   T.log(T.exp(z_c - mx.dimshuffle(0, 'x')).sum(axis=1)))
+
+        # The scores of the classes of the cluster of each target
+        z = ((state_below.dimshuffle(0, 1, 'x') * self.W_w[cluster])
+             .sum(axis=1) + self.b_w[cluster])
+        z = T.switch(T.constant(self._mask)[cluster], z, -np.inf)
+        mx = z.max(axis=1)
+        log_p_w = (z[rows, position] - mx -
+                   T.log(T.exp(z - mx.dimshuffle(0, 'x')).sum(axis=1)))
+        return log_p_c + log_p_w
+
+    @wraps(Layer.cost)
+    def cost(self, Y, Y_hat):
+        state_below = _find_state_below(Y_hat, self.W_c)
+        return -self.log_prob(state_below, Y.flatten()).mean()
+
+    @wraps(Layer.get_layer_monitoring_channels)
+    def get_layer_monitoring_channels(self, state_below=None, state=None,
+                                      targets=None):
+        rval = OrderedDict()
+        if state is None and state_below is not None:
+            state = self.fprop(state_below)
+        if state is not None:
+            mx = state.max(axis=1)
+            rval.update(OrderedDict([('mean_max_class', mx.mean()),
+                                     ('max_max_class', mx.max()),
+                                     ('min_max_class', mx.min())]))
+            if targets is not None:
+                y_hat = T.argmax(state, axis=1)
+                misclass = T.neq(targets.flatten(), y_hat).mean()
+                rval['misclass'] = T.cast(misclass, config.floatX)
+                rval['nll'] = self.cost(Y=targets, Y_hat=state)
+                rval['ppl'] = T.exp(rval['nll'])
+        return rval
+
+    @wraps(Layer.get_weight_decay)
+    def get_weight_decay(self, coeff):
+        if isinstance(coeff, str):
+            coeff = float(coeff)
+        assert isinstance(coeff, float) or hasattr(coeff, 'dtype')
+        return coeff * (T.sqr(self.W_c).sum() + T.sqr(self.W_w).sum())
+
+    @wraps(Layer.get_l1_weight_decay)
+    def get_l1_weight_decay(self, coeff):
+        if isinstance(coeff, str):
+            coeff = float(coeff)
+        assert isinstance(coeff, float) or hasattr(coeff, 'dtype')
+        return coeff * (abs(self.W_c).sum() + abs(self.W_w).sum())
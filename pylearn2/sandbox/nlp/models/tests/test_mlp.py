@@ -9,7 +9,15 @@ __maintainer__ = "LISA Lab"
 __email__ = "pylearn-dev@googlegroups"
 
 import os
+
+import numpy as np
+import theano
+import theano.tensor as T
+
 from pylearn2.config import yaml_parse
+from pylearn2.models.mlp import MLP
+from pylearn2.sandbox.nlp.models.mlp import (HierarchicalSoftmax,
+                                             SampledSoftmax)
 
 
 def test_projection_layer_yaml():
@@ -18,3 +26,48 @@ def test_projection_layer_yaml():
     with open(os.path.join(test_dir, 'composite.yaml')) as f:
         train = yaml_parse.load(f.read())
         train.main_loop()
+
+
+def _exact_and_training_costs(layer, n_classes):
+    """
+    Returns the exact distributions, the exact costs and the training
+    costs of an MLP with the given output layer on random data.
+    """
+    model = MLP(nvis=6, layers=[layer], seed=0)
+    X = T.matrix()
+    Y = T.lmatrix()
+    Y_hat = model.fprop(X)
+    f = theano.function([X, Y], [Y_hat, model.cost(Y, Y_hat)])
+    rng = np.random.RandomState(0)
+    x = rng.randn(50, 6).astype(X.dtype)
+    y = rng.randint(n_classes, size=(50, 1))
+    p, cost = f(x, y)
+    exact = -np.log(p[np.arange(50), y[:, 0]]).mean()
+    return p, exact, cost
+
+
+def test_hierarchical_softmax():
+    """
+    Checks that HierarchicalSoftmax gives a normalized distribution and
+    that its cost is the exact negative log-likelihood.
+    """
+    for n_classes, n_clusters in [(20, None), (23, 5)]:
+        layer = HierarchicalSoftmax(n_classes, 'y', n_clusters=n_clusters,
+                                    irange=1.)
+        p, exact, cost = _exact_and_training_costs(layer, n_classes)
+        assert p.shape == (50, n_classes)
+        assert np.allclose(p.sum(axis=1), 1., atol=1e-5)
+        assert np.allclose(cost, exact, rtol=1e-4)
+
+
+def test_sampled_softmax():
+    """
+    Checks that the cost of SampledSoftmax approaches the exact negative
+    log-likelihood when many classes are sampled.
+    """
+    for proposal in ['uniform', 'log_uniform']:
+        layer = SampledSoftmax(20, 'y', num_samples=20000,
+                               proposal=proposal, irange=1.)
+        p, exact, cost = _exact_and_training_costs(layer, 20)
+        assert np.allclose(p.sum(axis=1), 1., atol=1e-5)
+        assert abs(cost - exact) < .05
@@ -14,6 +14,7 @@ import scipy.linalg
 from functools import wraps
 from theano import config, scan, tensor
 from theano.compat import six
+from theano.ifelse import ifelse
 from theano.compat.six.moves import xrange
 
 from pylearn2.compat import OrderedDict
@@ -21,6 +22,7 @@ from pylearn2.models.mlp import Layer, MLP
 from pylearn2.monitor import get_monitor_doc
 from pylearn2.sandbox.rnn.space import SequenceSpace, SequenceDataSpace
 from pylearn2.space import CompositeSpace, VectorSpace
+from pylearn2.train_extensions import TrainExtension
 from pylearn2.utils import sharedX
 from pylearn2.utils.rng import make_theano_rng
 
@@ -51,6 +53,15 @@ class RNN(MLP):
         self.theano_rng = make_theano_rng(int(self.rng.randint(2 ** 30)),
                                           which_method=["normal", "uniform"])
 
+    def reset_states(self):
+        """
+        Forgets the hidden states carried over by the stateful recurrent
+        layers of the model.
+        """
+        for layer in self.layers:
+            if isinstance(layer, Recurrent):
+                layer.reset_state()
+
     @wraps(MLP.get_target_source)
     def get_target_source(self):
         if isinstance(self.input_space, SequenceSpace):
@@ -147,7 +158,9 @@ class Recurrent(Layer):
     activation function, passing on all hidden states or a selection
     of them to the next layer.
 
-    The hidden state is initialized to zeros.
+    The hidden state is initialized to zeros, unless the layer is
+    stateful, in which case each minibatch starts from the last hidden
+    state of the previous one (see `stateful`).
 
     Parameters
     ----------
@@ -174,13 +187,26 @@ class Recurrent(Layer):
     nonlinearity : theano.function, optional
     weight_noise : bool, optional
         Additive Gaussian noise applied to parameters
+    stateful : bool, optional
+        If True, the last hidden state of each minibatch is kept in a
+        shared variable and used as the initial state of the next
+        minibatch of the same size, instead of zeros. Together with the
+        'truncated_bptt' iteration mode, which makes each row of a
+        minibatch continue the same row of the previous one, this trains
+        on arbitrarily long sequences with truncated backpropagation
+        through time: the gradients only flow through the current chunk
+        while the hidden state spans the whole sequence. The state is
+        only carried over by the training updates; use `reset_state`
+        (or the `ResetRecurrentStates` extension) between unrelated
+        sequences.
     """
     def __init__(self, dim, layer_name, irange, indices=None,
                  init_bias=0., nonlinearity=tensor.tanh,
-                 weight_noise=False, **kwargs):
+                 weight_noise=False, stateful=False, **kwargs):
         self._std_dev = kwargs.pop('noise_std_dev', .075)
         self.rnn_friendly = True
         self._scan_updates = OrderedDict()
+        self._state = None
         self.__dict__.update(locals())
         del self.self
         super(Recurrent, self).__init__()
@@ -307,6 +333,67 @@ class Recurrent(Layer):
                              "multiple scan functions")
         updates.update(self._scan_updates)
 
+    def reset_state(self):
+        """
+        Forgets the hidden state carried over by a stateful layer, so
+        that the next minibatch starts from zeros.
+        """
+        if self._state is not None:
+            self._state.set_value(
+                np.zeros((0, self._state.get_value().shape[1]),
+                         dtype=config.floatX)
+            )
+
+    def _initial_state(self, state_below, state_dim):
+        """
+        Builds the initial state of the scan over a minibatch.
+
+        Parameters
+        ----------
+        state_below : TheanoTensor
+            The (time, batch, dim) input of the layer.
+        state_dim : int
+            The size of the state carried through time, which is larger
+            than `dim` for gated layers.
+
+        Returns
+        -------
+        z0 : TheanoTensor
+            The (batch, state_dim) initial state: zeros, or the last
+            state of the previous minibatch if the layer is stateful and
+            both minibatches have the same size.
+        """
+        # z0 is the initial hidden state which is (batch size, output dim)
+        z0 = tensor.alloc(np.cast[config.floatX](0), state_below.shape[1],
+                          state_dim)
+        # This should fix the bug described in Theano issue #1772
+        z0 = tensor.unbroadcast(z0, 0, 1)
+        if not self.stateful:
+            return z0
+
+        if self._state is None:
+            self._state = sharedX(np.zeros((0, state_dim)),
+                                  name=(self.layer_name + '_state'))
+        # The state is a shared variable and not a function of the
+        # parameters, so the gradients stop at the start of the minibatch
+        return ifelse(tensor.eq(self._state.shape[0], state_below.shape[1]),
+                      self._state, z0)
+
+    def _carry_state(self, last_state):
+        """
+        Registers the update which stores the last hidden state of a
+        stateful layer for the next minibatch.
+
+        Parameters
+        ----------
+        last_state : TheanoTensor
+            The (batch, state_dim) state after the last step of scan.
+            Masked steps carry the previous state on, so this is the
+            last state of each sequence.
+        """
+        if self.stateful:
+            self._scan_updates[self._state] = last_state
+
     def add_noise(self, param):
         """
         A function that adds additive Gaussian
@@ -336,12 +423,7 @@ class Recurrent(Layer):
         else:
             mask = None
 
-        # z0 is the initial hidden state which is (batch size, output dim)
-        z0 = tensor.alloc(np.cast[config.floatX](0), state_below.shape[1],
-                          self.dim)
-        if self.dim == 1:
-            # This should fix the bug described in Theano issue #1772
-            z0 = tensor.unbroadcast(z0, 1)
+        z0 = self._initial_state(state_below, self.dim)
 
         # Later we will add a noise function
         W, U, b = self._params
@@ -365,6 +447,7 @@ class Recurrent(Layer):
                               non_sequences=[U])
 
         self._scan_updates.update(updates)
+        self._carry_state(z[-1])
 
         if self.indices is not None:
             if len(self.indices) > 1:
@@ -512,12 +595,7 @@ class LSTM(Recurrent):
         else:
             mask = None
 
-        z0 = tensor.alloc(np.cast[config.floatX](0), state_below.shape[1],
-                          self.dim * 2)
-
-        z0 = tensor.unbroadcast(z0, 0)
-        if self.dim == 1:
-            z0 = tensor.unbroadcast(z0, 1)
+        z0 = self._initial_state(state_below, self.dim * 2)
 
         W, U, b = self._params
         if self.weight_noise:
@@ -538,6 +616,7 @@ class LSTM(Recurrent):
                                 non_sequences=[U])
 
             self._scan_updates.update(updates)
+        self._carry_state(z[-1])
 
         if return_all:
             return z
@@ -604,6 +683,124 @@ class LSTM(Recurrent):
         return z
 
 
+class FusedLSTM(LSTM):
+    """
+    An LSTM layer with the same packed parameters and outputs as `LSTM`,
+    but a cheaper scan step.
+
+    The input projection of all four gates is computed for the whole
+    sequence by a single matrix product before the loop, and each step
+    does a single recurrent product with the packed (dim, 4 * dim)
+    matrix. The hidden and cell states are carried by scan as two
+    separate outputs instead of halves of one state, which avoids
+    writing into subtensors of the state at every step and in the
+    gradient, and the input, forget and output gates share a single
+    sigmoid.
+
+    Parameters
+    ----------
+    kwargs : dict
+        Passed on to `LSTM`.
+    """
+    @wraps(Layer.fprop)
+    def fprop(self, state_below, return_all=False):
+
+        if isinstance(state_below, tuple):
+            state_below, mask = state_below
+        else:
+            mask = None
+
+        z0 = self._initial_state(state_below, self.dim * 2)
+        h0 = z0[:, :self.dim]
+        c0 = z0[:, self.dim:]
+
+        W, U, b = self._params
+        if self.weight_noise:
+            W = self.add_noise(W)
+            U = self.add_noise(U)
+
+        state_below = tensor.dot(state_below, W) + b
+
+        if mask is not None:
+            ((h, c), updates) = scan(fn=self.fprop_step_mask,
+                                     sequences=[state_below, mask],
+                                     outputs_info=[h0, c0],
+                                     non_sequences=[U])
+        else:
+            ((h, c), updates) = scan(fn=self.fprop_step,
+                                     sequences=[state_below],
+                                     outputs_info=[h0, c0],
+                                     non_sequences=[U])
+
+        self._scan_updates.update(updates)
+        self._carry_state(tensor.concatenate([h[-1], c[-1]], axis=1))
+
+        if return_all:
+            return tensor.concatenate([h, c], axis=2)
+
+        if self.indices is not None:
+            if len(self.indices) > 1:
+                return [h[i] for i in self.indices]
+            else:
+                return h[self.indices[0]]
+        else:
+            if mask is not None:
+                return (h, mask)
+            else:
+                return h
+
+    def fprop_step_mask(self, state_below, mask, h_before, c_before, U):
+        """
+        Scan function for case using masks
+
+        Parameters
+        ----------
+        state_below : TheanoTensor
+            The input projection of the gates at this step
+        mask : TheanoTensor
+        h_before : TheanoTensor
+            The hidden state of the previous step
+        c_before : TheanoTensor
+            The cell state of the previous step
+        U : TheanoTensor
+            The packed recurrent weights
+        """
+        h, c = self.fprop_step(state_below, h_before, c_before, U)
+
+        # Only update the state for non-masked data, otherwise
+        # just carry on the previous state until the end
+        h = mask[:, None] * h + (1 - mask[:, None]) * h_before
+        c = mask[:, None] * c + (1 - mask[:, None]) * c_before
+
+        return h, c
+
+    def fprop_step(self, state_below, h_before, c_before, U):
+        """
+        Scan function for case without masks
+
+        Parameters
+        ----------
+        state_below : TheanoTensor
+            The input projection of the gates at this step
+        h_before : TheanoTensor
+            The hidden state of the previous step
+        c_before : TheanoTensor
+            The cell state of the previous step
+        U : TheanoTensor
+            The packed recurrent weights
+        """
+        g_on = state_below + tensor.dot(h_before, U)
+        gates = tensor.nnet.sigmoid(g_on[:, :3*self.dim])
+        i_on = gates[:, :self.dim]
+        f_on = gates[:, self.dim:2*self.dim]
+        o_on = gates[:, 2*self.dim:]
+
+        c = f_on * c_before + i_on * tensor.tanh(g_on[:, 3*self.dim:])
+        h = o_on * tensor.tanh(c)
+
+        return h, c
+
+
 class GRU(Recurrent):
     """
     Implementation of Gated Recurrent Unit proposed by
@@ -705,12 +902,7 @@ class GRU(Recurrent):
         else:
             mask = None
 
-        z0 = tensor.alloc(np.cast[config.floatX](0), state_below.shape[1],
-                          self.dim)
-
-        z0 = tensor.unbroadcast(z0, 0)
-        if self.dim == 1:
-            z0 = tensor.unbroadcast(z0, 1)
+        z0 = self._initial_state(state_below, self.dim)
 
         W, U, b = self._params
         if self.weight_noise:
@@ -731,6 +923,7 @@ class GRU(Recurrent):
                                 non_sequences=[U])
 
         self._scan_updates.update(updates)
+        self._carry_state(z[-1])
 
         if return_all:
             return z
@@ -796,3 +989,87 @@ class GRU(Recurrent):
         z_t = u_on * state_before + (1. - u_on) * z_t
 
         return z_t
+
+
+class FusedGRU(GRU):
+    """
+    A gated recurrent unit doing a single recurrent matrix product per
+    step.
+
+    `GRU` applies the reset gate to the previous state before its
+    product with the candidate weights, which needs a second recurrent
+    product at each step once the gates are known. This layer applies
+    the reset gate after that product instead, as done by cuDNN:
+
+    .. math::
+
+        \\tilde{h}_t = \\tanh(x_t W_h + b_h + r_t \\odot (h_{t-1} U_h))
+
+    so the products of the previous state with the candidate, reset and
+    update weights are computed together by one product with the packed
+    (dim, 3 * dim) matrix, and the input projection of the whole
+    sequence is computed by a single matrix product before the loop.
+
+    The parameters have the same shapes as those of `GRU`, but the two
+    layers are different models: their outputs only match when the reset
+    gate is fully open.
+
+    Parameters
+    ----------
+    kwargs : dict
+        Passed on to `GRU`.
+    """
+    def fprop_step_mask(self, state_below, mask, state_before, U):
+        """
+        Scan function for case using masks
+
+        Parameters
+        ----------
+        state_below : TheanoTensor
+            The input projection at this step
+        mask : TheanoTensor
+        state_before : TheanoTensor
+            The hidden state of the previous step
+        U : TheanoTensor
+            The packed recurrent weights
+        """
+        z_t = self.fprop_step(state_below, state_before, U)
+        z_t = mask[:, None] * z_t + (1 - mask[:, None]) * state_before
+
+        return z_t
+
+    def fprop_step(self, state_below, state_before, U):
+        """
+        Scan function for case without masks
+
+        Parameters
+        ----------
+        state_below : TheanoTensor
+            The input projection at this step
+        state_before : TheanoTensor
+            The hidden state of the previous step
+        U : TheanoTensor
+            The packed recurrent weights
+        """
+        g_rec = tensor.dot(state_before, U)
+        gates = tensor.nnet.sigmoid(state_below[:, self.dim:] +
+                                    g_rec[:, self.dim:])
+        r_on = gates[:, :self.dim]
+        u_on = gates[:, self.dim:]
+
+        z_t = tensor.tanh(state_below[:, :self.dim] +
+                          r_on * g_rec[:, :self.dim])
+        z_t = u_on * state_before + (1. - u_on) * z_t
+
+        return z_t
+
+
+class ResetRecurrentStates(TrainExtension):
+    """
+    Resets the hidden states of the stateful recurrent layers of an RNN
+    after each epoch, so that truncated backpropagation through time
+    does not carry the state of the end of the data over to its start.
+    """
+    @wraps(TrainExtension.on_monitor)
+    def on_monitor(self, model, dataset, algorithm):
+        model.reset_states()
@@ -7,9 +7,11 @@ import numpy as np
 from theano import function
 from theano import tensor
 
+from pylearn2.compat import OrderedDict
 from pylearn2.costs.mlp import Default
 from pylearn2.models.mlp import Linear
-from pylearn2.sandbox.rnn.models.rnn import Recurrent, RNN
+from pylearn2.sandbox.rnn.models.rnn import (FusedGRU, FusedLSTM, LSTM,
+                                             Recurrent, RNN)
 from pylearn2.sandbox.rnn.space import SequenceSpace
 from pylearn2.space import VectorSpace
 
@@ -121,6 +123,111 @@ class TestRNNs(unittest.TestCase):
         cost = default_cost.expr(rnn, ((X_data, X_mask), (y_data, y_mask)))
         tensor.grad(cost, rnn.get_params(), disconnected_inputs='ignore')
 
+    def test_stateful(self):
+        """
+        Check that a stateful layer run over consecutive chunks of
+        sequences gives the same states as over the whole sequences.
+        """
+        rnns = [RNN(input_space=SequenceSpace(VectorSpace(dim=2)),
+                    layers=[LSTM(dim=3, layer_name='lstm', irange=0.5,
+                                 stateful=stateful)])
+                for stateful in [False, True]]
+        for param, stateful_param in zip(*[rnn.get_params()
+                                           for rnn in rnns]):
+            stateful_param.set_value(param.get_value())
+
+        fs = []
+        for rnn in rnns:
+            X_data, X_mask = rnn.get_input_space().make_theano_batch()
+            y_data, y_mask = rnn.fprop((X_data, X_mask))
+            updates = OrderedDict()
+            rnn.modify_updates(updates)
+            fs.append(function([X_data, X_mask], y_data, updates=updates,
+                               allow_input_downcast=True))
+        full, chunk = fs
+
+        rng = np.random.RandomState(0)
+        X_data_vals = rng.randn(10, 4, 2)
+        X_mask_vals = np.ones((10, 4))
+        X_mask_vals[7:, 1] = 0
+        expected = full(X_data_vals, X_mask_vals)
+        np.testing.assert_allclose(
+            np.concatenate([chunk(X_data_vals[:6], X_mask_vals[:6]),
+                            chunk(X_data_vals[6:], X_mask_vals[6:])]),
+            expected, rtol=1e-5
+        )
+
+        # A minibatch of another size, or a reset, starts from zeros
+        np.testing.assert_allclose(chunk(X_data_vals[:, :3],
+                                         X_mask_vals[:, :3]),
+                                   expected[:, :3], rtol=1e-5)
+        chunk(X_data_vals, X_mask_vals)
+        rnns[1].reset_states()
+        np.testing.assert_allclose(chunk(X_data_vals, X_mask_vals),
+                                   expected, rtol=1e-5)
+
+    def test_fused_lstm(self):
+        """
+        Check that FusedLSTM gives the same states and gradients as LSTM
+        with the same parameters.
+        """
+        rnns = [RNN(input_space=SequenceSpace(VectorSpace(dim=2)),
+                    layers=[layer_class(dim=3, layer_name='lstm',
+                                        irange=0.5)])
+                for layer_class in [LSTM, FusedLSTM]]
+        for param, fused_param in zip(*[rnn.get_params() for rnn in rnns]):
+            fused_param.set_value(param.get_value())
+
+        rng = np.random.RandomState(0)
+        X_data_vals = rng.randn(6, 4, 2)
+        X_mask_vals = np.ones((6, 4))
+        X_mask_vals[3:, 1] = 0
+        outputs = []
+        for rnn in rnns:
+            X_data, X_mask = rnn.get_input_space().make_theano_batch()
+            y_data, y_mask = rnn.fprop((X_data, X_mask))
+            cost = tensor.sqr(y_data).sum()
+            f = function([X_data, X_mask],
+                         [y_data] + tensor.grad(cost, rnn.get_params()),
+                         allow_input_downcast=True)
+            outputs.append(f(X_data_vals, X_mask_vals))
+        for value, fused_value in zip(*outputs):
+            np.testing.assert_allclose(value, fused_value, rtol=1e-5,
+                                       atol=1e-6)
+
+    def test_fused_gru(self):
+        """
+        Check FusedGRU, which resets after the recurrent product, against
+        a NumPy implementation.
+        """
+        rnn = RNN(input_space=SequenceSpace(VectorSpace(dim=2)),
+                  layers=[FusedGRU(dim=3, layer_name='gru', irange=0.5)])
+        W, U, b = [param.get_value() for param in rnn.get_params()]
+
+        X_data, X_mask = rnn.get_input_space().make_theano_batch()
+        y_data, y_mask = rnn.fprop((X_data, X_mask))
+        f = function([X_data, X_mask], y_data, allow_input_downcast=True)
+
+        rng = np.random.RandomState(0)
+        X_data_vals = rng.randn(6, 4, 2)
+        X_mask_vals = np.ones((6, 4))
+        X_mask_vals[3:, 1] = 0
+
+        def sigmoid(x):
+            return 1. / (1. + np.exp(-x))
+
+        h = np.zeros((4, 3))
+        expected = []
+        for x, m in zip(np.dot(X_data_vals, W) + b, X_mask_vals):
+            g = np.dot(h, U)
+            r = sigmoid(x[:, 3:6] + g[:, 3:6])
+            u = sigmoid(x[:, 6:] + g[:, 6:])
+            h_t = u * h + (1 - u) * np.tanh(x[:, :3] + r * g[:, :3])
+            h = m[:, None] * h_t + (1 - m[:, None]) * h
+            expected.append(h)
+        np.testing.assert_allclose(f(X_data_vals, X_mask_vals), expected,
+                                   rtol=1e-5)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -35,14 +35,23 @@ class SequenceDatasetIterator(FiniteDatasetIterator):
         A list of callables, in the same order as the sources
         in `data_specs`, that will be called on the individual
         source batches prior to any further processing.
+    reuse_buffers : bool, optional
+        If `True`, the padded batches and masks are written into
+        buffers which are allocated once per batch shape and reused by
+        the following batches of the same shape, so a batch is only
+        valid until the next call to `next`. Defaults to `False`.
 
     Notes
     -----
     See the documentation for :py:class:`SubsetIterator` for
     attribute documentation.
+
+    The number of real and padded time steps of the sequence batches
+    returned so far are kept in `real_tokens` and `padded_tokens`, and
+    their ratio in `padding_efficiency`.
     """
     def __init__(self, dataset, data_specs, subset_iterator,
-                 return_tuple=False, convert=None):
+                 return_tuple=False, convert=None, reuse_buffers=False):
         # Unpack the data specs into two tuples
         space, source = data_specs
         if not isinstance(source, tuple):
@@ -86,11 +95,48 @@ class SequenceDatasetIterator(FiniteDatasetIterator):
             space = space.components
         assert len(space) == len(source)
         self._original_space = space
+        self._reuse_buffers = reuse_buffers
+        self._buffers = {}
+        self.real_tokens = 0
+        self.padded_tokens = 0
 
     def __iter__(self):
         return self
 
-    def _create_mask(self, data):
+    @property
+    def padding_efficiency(self):
+        """
+        The fraction of the time steps of the sequence batches returned
+        so far which are not padding.
+        """
+        return self.real_tokens / float(max(self.padded_tokens, 1))
+
+    def _get_buffer(self, key, shape, dtype):
+        """
+        Returns a zeroed array of the given shape and dtype, reusing the
+        buffer stored under `key` if `reuse_buffers` was set.
+
+        Parameters
+        ----------
+        key : hashable
+            Identifies the buffer, together with its shape.
+        shape : tuple
+            The shape of the array.
+        dtype : str or numpy.dtype
+            The dtype of the array.
+        """
+        if not self._reuse_buffers:
+            return np.zeros(shape, dtype=dtype)
+        key = (key, shape)
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = np.zeros(shape, dtype=dtype)
+            self._buffers[key] = buf
+        else:
+            buf[...] = 0
+        return buf
+
+    def _create_mask(self, data, key=None):
         """
         Creates the mask for a given set of data.
 
@@ -98,35 +144,97 @@ class SequenceDatasetIterator(FiniteDatasetIterator):
         ----------
         data : numpy sequence of ndarrays
             A sequence of ndarrays representing sequential data
+        key : hashable, optional
+            Identifies the buffer to write the mask into, if buffers are
+            reused.
+        """
+        lengths = np.fromiter((len(sample) for sample in data),
+                              dtype='int64', count=len(data))
+        return self._mask_from_lengths(lengths, key)
+
+    def _mask_from_lengths(self, lengths, key=None):
         """
-        sequence_lengths = [len(sample) for sample in data]
-        max_sequence_length = max(sequence_lengths)
-        mask = np.zeros((max_sequence_length, len(data)), dtype=config.floatX)
-        for i, sequence_length in enumerate(sequence_lengths):
-            mask[:sequence_length, i] = 1
+        Creates the (time, batch) mask of sequences of the given lengths.
+
+        Parameters
+        ----------
+        lengths : ndarray
+            The length of each sequence of the batch.
+        key : hashable, optional
+            Identifies the buffer to write the mask into, if buffers are
+            reused.
+        """
+        shape = (lengths.max(), len(lengths))
+        mask = self._get_buffer(key, shape, config.floatX)
+        np.less(np.arange(shape[0])[:, np.newaxis], lengths, out=mask,
+                casting='unsafe')
         return mask
 
+    def _pad(self, rval, dtype, key=None):
+        """
+        Pads a batch of sequences into a time-major array.
+
+        Parameters
+        ----------
+        rval : ndarray or sequence of ndarrays
+            The sequences of the batch.
+        dtype : str or numpy.dtype
+            The dtype of the padded batch.
+        key : hashable, optional
+            Identifies the buffer to write the batch into, if buffers are
+            reused.
+
+        Returns
+        -------
+        batch : ndarray
+            The padded batch, of shape (time, batch) + the shape of the
+            time steps.
+        lengths : ndarray
+            The length of each sequence.
+        """
+        if isinstance(rval, np.ndarray) and rval.dtype != object:
+            # All sequences have the same length already
+            lengths = np.empty(len(rval), dtype='int64')
+            lengths[:] = rval.shape[1]
+            batch = self._get_buffer(key, (rval.shape[1], rval.shape[0]) +
+                                     rval.shape[2:], dtype)
+            batch[...] = np.swapaxes(rval, 0, 1)
+            return batch, lengths
+
+        lengths = np.fromiter((len(sample) for sample in rval),
+                              dtype='int64', count=len(rval))
+        steps = np.concatenate([np.asarray(sample) for sample in rval])
+        batch = self._get_buffer(key, (lengths.max(), len(rval)) +
+                                 steps.shape[1:], dtype)
+        # Scatter all the time steps at once, at their (time, example)
+        # position
+        examples = np.repeat(np.arange(len(rval)), lengths)
+        starts = np.cumsum(lengths) - lengths
+        times = np.arange(len(steps)) - np.repeat(starts, lengths)
+        batch[times, examples] = steps
+        return batch, lengths
+
     @wraps(FiniteDatasetIterator.next)
     def next(self):
         next_index = self._subset_iterator.next()
         rvals = []
+        counted = False
         for space, source, data, fn in safe_izip(self._space, self._source,
                                                  self._raw_data,
                                                  self._convert):
             rval = data[next_index]
             if isinstance(space, SequenceDataSpace):
                 # Add padding
-                max_sequence_length = max(len(sample) for sample
-                                          in rval)
-                batch = np.zeros((len(rval), max_sequence_length) +
-                                 data[0].shape[1:], dtype=data[0].dtype)
-                for i, sample in enumerate(rval):
-                    batch[i, :len(sample)] = sample
+                rval, lengths = self._pad(rval, data[0].dtype, source)
+                if not counted:
+                    self.real_tokens += lengths.sum()
+                    self.padded_tokens += lengths.max() * len(lengths)
+                    counted = True
 
                 # Create mask
                 if source in self.mask_needed:
-                    mask = self._create_mask(rval)
-                rval = np.swapaxes(batch, 0, 1)
+                    mask = self._mask_from_lengths(lengths,
+                                                   source + '_mask')
                 if fn:
                     rval = fn(rval)
                 rvals.append(rval)
@@ -0,0 +1,79 @@
+'''
+This is the benchmark of the sequential and batched implementations of
+feature-sign search in pylearn2.optimization.feature_sign.
+
+Both implementations are run on the same random signals and are checked
+to give the same codes.
+
+Results: in seconds, float64, 64x128 dictionary, 500 signals
+
+Sparsity, feature_sign_search, batched_feature_sign_search
+0.5:      6.25                 1.85
+1.0:      3.90                 0.75
+5.0:      0.18                 0.01
+'''
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy
+
+from pylearn2.optimization.feature_sign import feature_sign_search
+from pylearn2.optimization.feature_sign import batched_feature_sign_search
+
+
+def benchmark_feature_sign(input_dim, num_features, num_signals, sparsities,
+                           chunk_size, n_jobs):
+    """
+    Times both implementations of feature-sign search and checks that
+    they agree.
+
+    Parameters
+    ----------
+    input_dim : int
+        Dimension of the signals.
+    num_features : int
+        Number of columns of the dictionary.
+    num_signals : int
+        Number of signals to encode.
+    sparsities : list
+        The L1 penalties to try.
+    chunk_size : int
+        Passed to `batched_feature_sign_search`.
+    n_jobs : int
+        Passed to `batched_feature_sign_search`.
+    """
+    rng = numpy.random.RandomState(0)
+    dictionary = rng.normal(size=(input_dim, num_features))
+    dictionary /= numpy.sqrt((dictionary ** 2).sum(axis=0))
+    signals = rng.normal(size=(num_signals, input_dim))
+
+    print('sparsity, sequential (s), batched (s), mean nonzeros')
+    for sparsity in sparsities:
+        t0 = time.time()
+        reference = feature_sign_search(dictionary, signals, sparsity)
+        t1 = time.time()
+        solution = batched_feature_sign_search(dictionary, signals, sparsity,
+                                               chunk_size=chunk_size,
+                                               n_jobs=n_jobs)
+        t2 = time.time()
+        numpy.testing.assert_allclose(solution, reference, atol=1e-10,
+                                      err_msg='codes not equal')
+        print(sparsity, t1 - t0, t2 - t1, (solution != 0).sum(axis=1).mean())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark batched feature-sign search.')
+    parser.add_argument('--input-dim', type=int, default=64)
+    parser.add_argument('--num-features', type=int, default=128)
+    parser.add_argument('--num-signals', type=int, default=500)
+    parser.add_argument('--sparsities', type=float, nargs='+',
+                        default=[0.5, 1.0, 5.0])
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    args = parser.parse_args()
+    benchmark_feature_sign(args.input_dim, args.num_features,
+                           args.num_signals, args.sparsities,
+                           args.chunk_size, args.n_jobs)
@@ -0,0 +1,100 @@
+'''
+This is the benchmark of the fused recurrent layers of the sandbox RNN.
+
+It compiles a training step (forward pass, backpropagation through time
+and an SGD update) of an RNN with a single LSTM, FusedLSTM, GRU or
+FusedGRU layer, by default of 256 units over 100 steps of minibatches of
+32 sequences, and reports the compile time and the time per training
+step of each layer. Run it with THEANO_FLAGS=device=cpu to time the CPU.
+'''
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+import theano
+from theano import config, tensor
+
+from pylearn2.compat import OrderedDict
+from pylearn2.sandbox.rnn.models.rnn import (FusedGRU, FusedLSTM, GRU, LSTM,
+                                             RNN)
+from pylearn2.sandbox.rnn.space import SequenceSpace
+from pylearn2.space import VectorSpace
+
+
+def make_step(layer_class, input_dim, dim, learning_rate=.01):
+    """
+    Compiles a training step of an RNN.
+
+    Parameters
+    ----------
+    layer_class : class
+        The recurrent layer to time.
+    input_dim : int
+        The dimension of the inputs.
+    dim : int
+        The number of hidden units.
+    learning_rate : float
+        The learning rate.
+    """
+    rnn = RNN(input_space=SequenceSpace(VectorSpace(dim=input_dim)),
+              layers=[layer_class(dim=dim, layer_name='recurrent',
+                                  irange=0.1)])
+    X_data, X_mask = rnn.get_input_space().make_theano_batch()
+    y_data, y_mask = rnn.fprop((X_data, X_mask))
+    cost = tensor.sqr(y_data).mean()
+    params = rnn.get_params()
+    grads = tensor.grad(cost, params)
+    updates = OrderedDict((param, param - learning_rate * grad)
+                          for param, grad in zip(params, grads))
+    return theano.function([X_data, X_mask], cost, updates=updates)
+
+
+def benchmark(input_dim, dim, seq_len, batch_size, num_batches):
+    """
+    Times the compilation and the training steps of each layer.
+
+    Parameters
+    ----------
+    input_dim : int
+        The dimension of the inputs.
+    dim : int
+        The number of hidden units.
+    seq_len : int
+        The number of time steps of the sequences.
+    batch_size : int
+        The number of sequences per minibatch.
+    num_batches : int
+        The number of steps to time.
+    """
+    rng = np.random.RandomState(0)
+    X_data = rng.randn(seq_len, batch_size, input_dim).astype(config.floatX)
+    X_mask = np.ones((seq_len, batch_size), dtype=config.floatX)
+    for layer_class in [LSTM, FusedLSTM, GRU, FusedGRU]:
+        t0 = time.time()
+        step = make_step(layer_class, input_dim, dim)
+        compile_time = time.time() - t0
+        step(X_data, X_mask)
+        t0 = time.time()
+        for i in range(num_batches):
+            step(X_data, X_mask)
+        step_time = (time.time() - t0) / num_batches
+        print("%s: compiled in %.1fs, %.1f ms per training step"
+              % (layer_class.__name__, compile_time, 1000 * step_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark the fused recurrent layers")
+    parser.add_argument('--input-dim', type=int, default=128,
+                        dest='input_dim')
+    parser.add_argument('--dim', type=int, default=256)
+    parser.add_argument('--seq-len', type=int, default=100, dest='seq_len')
+    parser.add_argument('--batch-size', type=int, default=32,
+                        dest='batch_size')
+    parser.add_argument('--num-batches', type=int, default=20,
+                        dest='num_batches')
+    args = parser.parse_args()
+    benchmark(args.input_dim, args.dim, args.seq_len, args.batch_size,
+              args.num_batches)
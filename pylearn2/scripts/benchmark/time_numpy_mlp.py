@@ -0,0 +1,113 @@
+'''
+This is the benchmark of the NumPy forward engine of
+pylearn2.deploy.numpy_mlp against the Theano fprop of the same MLP.
+
+For a pkl model, or by default a 784-1000-1000-10 rectifier network, it
+reports the time needed to start serving (loading the model and, for
+Theano, compiling fprop) and the mean latency of a batch for several
+batch sizes, and checks that both outputs agree.
+'''
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from theano import config, function
+
+from pylearn2.deploy.numpy_mlp import export_mlp, load_numpy_mlp
+from pylearn2.models.mlp import MLP, RectifiedLinear, Softmax
+from pylearn2.utils import serial
+
+
+def make_mlp():
+    """
+    Makes the default MLP used by the benchmark.
+    """
+    return MLP(nvis=784,
+               layers=[RectifiedLinear(dim=1000, layer_name='h0', irange=.05),
+                       RectifiedLinear(dim=1000, layer_name='h1', irange=.05),
+                       Softmax(10, 'y', irange=.05)])
+
+
+def time_batches(fprop, X, repeats):
+    """
+    Returns the mean time of `fprop(X)`, in seconds.
+
+    Parameters
+    ----------
+    fprop : callable
+        The function to time.
+    X : numpy.ndarray
+        Its input.
+    repeats : int
+        Number of calls to average over.
+    """
+    fprop(X)
+    t0 = time.time()
+    for i in range(repeats):
+        fprop(X)
+    return (time.time() - t0) / repeats
+
+
+def benchmark(model_path, batch_sizes, repeats):
+    """
+    Times the startup and the batches of both forward implementations.
+
+    Parameters
+    ----------
+    model_path : str or None
+        The path of a pkl MLP. If None, the default MLP is used.
+    batch_sizes : list
+        The batch sizes to time.
+    repeats : int
+        Number of batches to average over.
+    """
+    dirname = tempfile.mkdtemp()
+    try:
+        if model_path is None:
+            model_path = os.path.join(dirname, 'model.pkl')
+            serial.save(model_path, make_mlp())
+        npz_path = os.path.join(dirname, 'model.npz')
+        export_mlp(model_path, npz_path)
+
+        t0 = time.time()
+        model = serial.load(model_path)
+        X_sym = model.get_input_space().make_theano_batch()
+        theano_fprop = function([X_sym], model.fprop(X_sym))
+        theano_startup = time.time() - t0
+
+        t0 = time.time()
+        numpy_model = load_numpy_mlp(npz_path)
+        numpy_startup = time.time() - t0
+    finally:
+        shutil.rmtree(dirname)
+
+    print("Startup: theano %.3fs, numpy %.3fs" % (theano_startup,
+                                                  numpy_startup))
+    space = model.get_input_space()
+    rng = np.random.RandomState(0)
+    for batch_size in batch_sizes:
+        X = rng.uniform(size=space.get_origin_batch(batch_size).shape)
+        X = X.astype(config.floatX)
+        error = np.abs(theano_fprop(X) - numpy_model.fprop(X)).max()
+        theano_time = time_batches(theano_fprop, X, repeats)
+        numpy_time = time_batches(numpy_model.fprop, X, repeats)
+        print("Batch size %d: theano %.3fms, numpy %.3fms, max abs "
+              "difference %g" % (batch_size, 1000 * theano_time,
+                                 1000 * numpy_time, error))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark the NumPy forward engine against Theano")
+    parser.add_argument('--model', default=None,
+                        help='pkl MLP to benchmark')
+    parser.add_argument('--batch-sizes', type=int, nargs='+',
+                        default=[1, 32, 256], dest='batch_sizes')
+    parser.add_argument('--repeats', type=int, default=100)
+    args = parser.parse_args()
+    benchmark(args.model, args.batch_sizes, args.repeats)
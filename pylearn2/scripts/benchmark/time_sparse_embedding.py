@@ -0,0 +1,107 @@
+'''
+This is the benchmark of the row-sparse updates of an embedding matrix.
+
+It builds the cost of a minibatch of word lookups into a table of, by
+default, 1M words of dimension 100, and times the SGD, AdaGrad and
+RMSProp steps with dense updates, which touch every row of the table
+and of the state of the learning rule, and with the row-sparse updates
+of `SGD(sparse_updates=True)`, which only touch the rows of the
+minibatch.
+'''
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+import theano
+from theano import tensor as T
+
+from pylearn2.compat import OrderedDict
+from pylearn2.training_algorithms.learning_rule import AdaGrad, RMSProp
+from pylearn2.training_algorithms.sgd import get_row_gradients
+from pylearn2.utils import sharedX
+
+
+def make_step(W, rule, sparse, learning_rate=.01):
+    """
+    Compiles an update step of the embeddings `W`.
+
+    Parameters
+    ----------
+    W : shared variable
+        The embedding matrix.
+    rule : LearningRule or None
+        The learning rule, plain SGD if None.
+    sparse : bool
+        Whether to only update the rows of the minibatch.
+    learning_rate : float
+        The learning rate.
+    """
+    indices = T.lvector('indices')
+    targets = T.matrix('targets')
+    cost = T.sqr(W[indices] - targets).sum()
+    if sparse:
+        (rows, grad_rows), = get_row_gradients(cost, [W]).values()
+        if rule is None:
+            updates = OrderedDict([(W, T.inc_subtensor(
+                W[rows], -learning_rate * grad_rows))])
+        else:
+            updates = rule.get_row_updates(learning_rate,
+                                           {W: (rows, grad_rows)}, {})
+    else:
+        grad = T.grad(cost, W)
+        if rule is None:
+            updates = OrderedDict([(W, W - learning_rate * grad)])
+        else:
+            updates = rule.get_updates(learning_rate, {W: grad}, {})
+    return theano.function([indices, targets], cost, updates=updates)
+
+
+def benchmark(num_words, dim, batch_size, num_batches):
+    """
+    Times the update steps.
+
+    Parameters
+    ----------
+    num_words : int
+        The number of rows of the embedding matrix.
+    dim : int
+        The dimension of the embeddings.
+    batch_size : int
+        The number of words per minibatch.
+    num_batches : int
+        The number of steps to time.
+    """
+    rng = np.random.RandomState(0)
+    W = sharedX(rng.uniform(-.1, .1, (num_words, dim)), 'W')
+    batches = [(rng.randint(num_words, size=batch_size),
+                rng.randn(batch_size, dim).astype(W.dtype))
+               for i in range(num_batches)]
+    for name, make_rule in [('SGD', lambda: None), ('AdaGrad', AdaGrad),
+                            ('RMSProp', RMSProp)]:
+        times = []
+        for sparse in [False, True]:
+            step = make_step(W, make_rule(), sparse)
+            step(*batches[0])
+            t0 = time.time()
+            for batch in batches:
+                step(*batch)
+            times.append(time.time() - t0)
+        print("%s: dense %.1f, row-sparse %.1f batches/s (%.0fx)"
+              % (name, num_batches / times[0], num_batches / times[1],
+                 times[0] / times[1]))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark row-sparse embedding updates")
+    parser.add_argument('--num-words', type=int, default=1000000,
+                        dest='num_words')
+    parser.add_argument('--dim', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        dest='batch_size')
+    parser.add_argument('--num-batches', type=int, default=20,
+                        dest='num_batches')
+    args = parser.parse_args()
+    benchmark(args.num_words, args.dim, args.batch_size, args.num_batches)
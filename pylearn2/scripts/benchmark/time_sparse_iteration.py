@@ -0,0 +1,104 @@
+'''
+This is the benchmark of minibatch iteration over a SparseDataset.
+
+It builds a random bag-of-words CSR matrix, by default with 1M examples
+of 100k words and 30 words per example, the scale of the UTLC sparse
+sets of pylearn2.datasets.utlc, and times an epoch of sequential and of
+shuffled minibatches into a sparse VectorSpace, both through the
+iterator of SparseDataset and by fancy indexing the scipy matrix.
+'''
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse
+from theano import config
+
+from pylearn2.datasets.sparse_dataset import SparseDataset
+from pylearn2.space import VectorSpace
+
+
+def make_bag_of_words(num_examples, num_words, words_per_example, rng):
+    """
+    Makes a random binary bag-of-words CSR matrix.
+
+    Parameters
+    ----------
+    num_examples : int
+        The number of rows.
+    num_words : int
+        The number of columns.
+    words_per_example : int
+        The number of stored elements per row.
+    rng : numpy.random.RandomState
+        The random number generator.
+    """
+    nnz = num_examples * words_per_example
+    indptr = np.arange(0, nnz + 1, words_per_example, dtype='int32')
+    indices = rng.randint(num_words, size=nnz).astype('int32')
+    data = np.ones(nnz, dtype=config.floatX)
+    return scipy.sparse.csr_matrix((data, indices, indptr),
+                                   shape=(num_examples, num_words))
+
+
+def benchmark(num_examples, num_words, words_per_example, batch_size):
+    """
+    Times an epoch of each iteration mode.
+
+    Parameters
+    ----------
+    num_examples : int
+        The number of examples.
+    num_words : int
+        The size of the vocabulary.
+    words_per_example : int
+        The number of words per example.
+    batch_size : int
+        The number of examples per batch.
+    """
+    rng = np.random.RandomState(0)
+    t0 = time.time()
+    X = make_bag_of_words(num_examples, num_words, words_per_example, rng)
+    print("Built a %dx%d matrix with %d stored elements in %.1fs"
+          % (X.shape[0], X.shape[1], X.nnz, time.time() - t0))
+
+    dataset = SparseDataset(from_scipy_sparse_dataset=X)
+    space = VectorSpace(dim=num_words, sparse=True)
+    for mode in ['sequential', 'shuffled_sequential']:
+        iterator = dataset.iterator(mode=mode, batch_size=batch_size,
+                                    data_specs=(space, 'features'),
+                                    rng=np.random.RandomState(1))
+        t0 = time.time()
+        for batch in iterator:
+            pass
+        iterator_time = time.time() - t0
+
+        if mode == 'sequential':
+            indexes = np.arange(num_examples)
+        else:
+            indexes = np.random.RandomState(1).permutation(num_examples)
+        t0 = time.time()
+        for start in range(0, num_examples, batch_size):
+            batch = X[indexes[start:start + batch_size]].astype(X.dtype)
+        indexing_time = time.time() - t0
+
+        print("%s: SparseDataset iterator %.2fs, scipy fancy indexing "
+              "%.2fs per epoch" % (mode, iterator_time, indexing_time))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Benchmark minibatch iteration over a SparseDataset")
+    parser.add_argument('--num-examples', type=int, default=1000000,
+                        dest='num_examples')
+    parser.add_argument('--num-words', type=int, default=100000,
+                        dest='num_words')
+    parser.add_argument('--words-per-example', type=int, default=30,
+                        dest='words_per_example')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        dest='batch_size')
+    args = parser.parse_args()
+    benchmark(args.num_examples, args.num_words, args.words_per_example,
+              args.batch_size)
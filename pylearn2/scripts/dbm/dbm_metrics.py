@@ -43,6 +43,7 @@ from theano.sandbox.scan import scan
 import pylearn2
 from pylearn2.compat import OrderedDict
 from pylearn2.datasets.mnist import MNIST
+from pylearn2.parallel_ais import BinaryDBMAnnealing, ParallelAIS
 from pylearn2.utils import serial
 from pylearn2 import utils
 
@@ -511,7 +512,8 @@ def _e_step(psamples, W_list, b_list, n_steps=100, eps=1e-5):
 
 def estimate_likelihood(W_list, b_list, trainset, testset, free_energy_fn=None,
                         batch_size=100, large_ais=False, log_z=None,
-                        pos_mf_steps=50, pos_sample_steps=0):
+                        pos_mf_steps=50, pos_sample_steps=0, n_jobs=None,
+                        checkpoint=None):
     """
     Compute estimate of log-partition function and likelihood of trainset and
     testset
@@ -538,6 +540,13 @@ def estimate_likelihood(W_list, b_list, trainset, testset, free_energy_fn=None,
     pos_sample_steps: same thing as pos_mf_steps
         when both pos_mf_steps > 0 and pos_sample_steps > 0,
         pos_mf_steps has a priority
+    n_jobs : int, optional
+        If given, log Z is estimated with `pylearn2.parallel_ais` using
+        `batch_size` AIS runs spread over this many processes.
+    checkpoint : str, optional
+        If given, log Z is estimated with `pylearn2.parallel_ais`, and
+        the partial AIS weights are saved to this file. An interrupted
+        estimate is resumed from it.
 
     Returns
     -------
@@ -647,7 +656,15 @@ def estimate_likelihood(W_list, b_list, trainset, testset, free_energy_fn=None,
                          numpy.linspace(0.5, 0.9, 1e4+1)[:-1],
                          numpy.linspace(0.9, 1.0, 1e4))))
 
-    if log_z is None:
+    if log_z is None and (n_jobs is not None or checkpoint is not None):
+        annealing = BinaryDBMAnnealing(
+            [W.get_value() for W in W_list[1:]],
+            [b.get_value() for b in b_list], base_bias=pa_bias)
+        ais = ParallelAIS(annealing, batch_size, betas=betas, n_jobs=n_jobs,
+                          checkpoint=checkpoint, seed=rng.randint(2 ** 30))
+        log_z, std_err = ais.run()
+        logging.info('log_z = %f +/- %f' % (log_z, std_err))
+    elif log_z is None:
         log_ais_w = compute_log_ais_weights(batch_size, free_energy_fn,
                                             sample_fn, betas)
         dlogz, var_dlogz = estimate_from_weights(log_ais_w)
@@ -682,6 +699,11 @@ if __name__ == '__main__':
     parser.add_argument("dataset", help="the dataset used for computing the " +
                         "metric", choices=datasets.keys())
     parser.add_argument("model_path", help="path to the pickled DBM model")
+    parser.add_argument("--n-jobs", type=int, default=None, dest="n_jobs",
+                        help="number of processes running AIS in parallel")
+    parser.add_argument("--checkpoint", default=None,
+                        help="file where the partial AIS weights are saved, "
+                        "and resumed from")
     args = parser.parse_args()
 
     metric = metrics[args.metric]
@@ -696,4 +718,5 @@ if __name__ == '__main__':
     trainset = dataset(which_set='train')
     testset = dataset(which_set='test')
 
-    metric(W_list, b_list, trainset, testset, pos_mf_steps=5)
+    metric(W_list, b_list, trainset, testset, pos_mf_steps=5,
+           n_jobs=args.n_jobs, checkpoint=args.checkpoint)
@@ -19,8 +19,8 @@ from pylearn2.corruption import (BinomialSampler, GaussianCorruptor,
                                  MultinomialSampler, SaltPepperCorruptor,
                                  SmoothOneHotCorruptor)
 from pylearn2.datasets.mnist import MNIST
-from pylearn2.distributions.parzen import ParzenWindows
-from pylearn2.models.gsn import GSN, JointGSN
+from pylearn2.distributions.parzen import TiledParzenWindows
+from pylearn2.models.gsn import GSN, GSNSampler, JointGSN
 from pylearn2.termination_criteria import EpochCounter
 from pylearn2.train import Train
 from pylearn2.training_algorithms.sgd import SGD, MonitorBasedLRAdjuster
@@ -104,10 +104,29 @@ def test_sample_ae():
     image.save("gsn_ae_example.png", tiled)
 
     # code to get log likelihood from kernel density estimator
-    # this crashed on GPU (out of memory), but works on CPU
-    pw = ParzenWindows(MNIST(which_set='test').X, .20)
+    pw = TiledParzenWindows(MNIST(which_set='test').X, .20)
     print(pw.get_ll(history))
 
+def test_sample_chains(num_chains=1000, num_samples=100, thin=10):
+    """
+    Runs many chains of the trained unsupervised GSN in parallel,
+    streaming their samples to disk.
+    """
+    with open("gsn_ae_example.pkl") as f:
+        gsn = pickle.load(f)
+
+    sampler = GSNSampler(gsn, num_chains)
+    sampler.reset(MNIST(which_set='test').X[:num_chains])
+    samples = sampler.sample(num_samples, thin=thin,
+                             path="gsn_ae_chains.npy")
+    print("%.1f samples/s" % sampler.samples_per_second)
+
+    tiled = image.tile_raster_images(samples[-1, :2500],
+                                     img_shape=[28,28],
+                                     tile_shape=[50,50],
+                                     tile_spacing=(2,2))
+    image.save("gsn_ae_chains.png", tiled)
+
 def test_train_supervised():
     """
     Train a supervised GSN.
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""
+Script to export a pkl MLP to the NumPy forward engine.
+
+Basic usage:
+
+.. code-block:: none
+
+    export_numpy.py model.pkl model.npz --engine-dir deploy/
+
+The exported model is loaded with
+`pylearn2.deploy.numpy_mlp.load_numpy_mlp`, or with the `numpy_mlp.py`
+copied to the `--engine-dir` directory, which only needs NumPy.
+"""
+import argparse
+
+from pylearn2.deploy.numpy_mlp import copy_engine, export_mlp
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Export a pkl MLP to the NumPy forward engine")
+    parser.add_argument('model_filename',
+                        help='Specifies the pkl model file')
+    parser.add_argument('output_filename',
+                        help='Specifies the .npz file to write')
+    parser.add_argument('--engine-dir', '-e', default=None,
+                        dest='engine_dir',
+                        help='Directory to copy the engine module to')
+    return parser
+
+
+if __name__ == "__main__":
+    parser = make_argument_parser()
+    args = parser.parse_args()
+    export_mlp(args.model_filename, args.output_filename)
+    if args.engine_dir is not None:
+        copy_engine(args.engine_dir)
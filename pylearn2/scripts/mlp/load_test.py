@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""
+Script to measure the latency and throughput of a prediction server
+started with `serve.py`.
+
+Basic usage:
+
+.. code-block:: none
+
+    load_test.py 784 --port 8000 --clients 16 --requests 500
+
+Each client thread sends `requests` batches of `batch-size` random
+examples with `dim` features, one after the other, and the script reports
+the median and 99th percentile latency of the requests and the total
+number of examples predicted per second.
+"""
+from __future__ import print_function
+
+import argparse
+import threading
+import time
+
+import numpy as np
+from theano.compat.six.moves import xrange
+
+from pylearn2.deploy.server import PredictionClient
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Measure the latency and throughput of a prediction "
+                    "server")
+    parser.add_argument('dim', type=int,
+                        help='Number of features of each example')
+    parser.add_argument('--host', default='localhost',
+                        help='Host the server listens on')
+    parser.add_argument('--port', '-p', type=int, default=8000,
+                        help='Port the server listens on')
+    parser.add_argument('--clients', '-c', type=int, default=16,
+                        help='Number of concurrent clients')
+    parser.add_argument('--requests', '-n', type=int, default=200,
+                        help='Number of requests sent by each client')
+    parser.add_argument('--batch-size', type=int, default=1,
+                        dest='batch_size',
+                        help='Number of examples in each request')
+    return parser
+
+
+def load_test(dim, host='localhost', port=8000, clients=16, requests=200,
+              batch_size=1):
+    """
+    Sends requests to a prediction server from concurrent clients.
+
+    Parameters
+    ----------
+    dim : int
+        Number of features of each example.
+    host : str, optional
+        The host the server listens on.
+    port : int, optional
+        The port the server listens on.
+    clients : int, optional
+        Number of concurrent clients.
+    requests : int, optional
+        Number of requests sent by each client.
+    batch_size : int, optional
+        Number of examples in each request.
+
+    Returns
+    -------
+    latencies : numpy.ndarray
+        The latency of each request, in seconds.
+    throughput : float
+        The number of examples predicted per second.
+    """
+    X = np.random.RandomState(0).uniform(
+        size=(batch_size, dim)).astype('float32')
+    latencies = [[] for i in xrange(clients)]
+
+    def run(i):
+        client = PredictionClient(host, port)
+        try:
+            for j in xrange(requests):
+                t0 = time.time()
+                client.predict(X)
+                latencies[i].append(time.time() - t0)
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=run, args=(i,))
+               for i in xrange(clients)]
+    t0 = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - t0
+
+    latencies = np.concatenate([np.asarray(lat) for lat in latencies])
+    return latencies, latencies.size * batch_size / elapsed
+
+
+if __name__ == "__main__":
+    parser = make_argument_parser()
+    args = parser.parse_args()
+    latencies, throughput = load_test(args.dim, args.host, args.port,
+                                      args.clients, args.requests,
+                                      args.batch_size)
+    print("%d requests" % latencies.size)
+    print("p50 latency: %.2f ms" % (1000 * np.percentile(latencies, 50)))
+    print("p99 latency: %.2f ms" % (1000 * np.percentile(latencies, 99)))
+    print("throughput: %.1f examples/s" % throughput)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Script to compare the accuracy and throughput of a pkl MLP exported to
+the NumPy engine with float weights and with int8 weights.
+
+Basic usage:
+
+.. code-block:: none
+
+    quantization_report.py model.pkl mnist
+    quantization_report.py model.pkl cifar10 --output model_int8.npz
+
+The int8 scales are calibrated on examples held out from the end of the
+training set (the last 2000 by default), and the accuracy is measured
+on the test set. Models trained on preprocessed data need the same
+preprocessing: use --test-yaml and --calibration-yaml to give the
+datasets as YAML strings instead.
+"""
+from __future__ import print_function
+
+import argparse
+import logging
+import time
+
+import numpy as np
+
+from pylearn2.config import yaml_parse
+from pylearn2.deploy.numpy_mlp import mlp_to_numpy
+from pylearn2.deploy.quantize import quantize_numpy_mlp
+from pylearn2.utils import serial
+
+
+DATASETS = {
+    'mnist': ("!obj:pylearn2.datasets.mnist.MNIST {which_set: %s, "
+              "start: %d, stop: %d}", 60000),
+    'cifar10': ("!obj:pylearn2.datasets.cifar10.CIFAR10 {which_set: %s, "
+                "start: %d, stop: %d}", 50000)
+}
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Compare a float MLP to its int8 quantized version")
+    parser.add_argument('model_filename',
+                        help='Specifies the pkl model file')
+    parser.add_argument('dataset', choices=sorted(DATASETS),
+                        help='Dataset the model was trained on')
+    parser.add_argument('--test-yaml', default=None, dest='test_yaml',
+                        help='YAML string of the test dataset')
+    parser.add_argument('--calibration-yaml', default=None,
+                        dest='calibration_yaml',
+                        help='YAML string of the calibration dataset')
+    parser.add_argument('--calibration-size', type=int, default=2000,
+                        dest='calibration_size',
+                        help='Number of held-out training examples used '
+                             'for calibration')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        dest='batch_size',
+                        help='Batch size used to measure the throughput')
+    parser.add_argument('--output', '-o', default=None,
+                        help='Saves the quantized model to this .npz file')
+    return parser
+
+
+def evaluate(model, dataset, space, batch_size):
+    """
+    Measures the accuracy and throughput of a model on a dataset.
+
+    Parameters
+    ----------
+    model : NumpyMLP
+        The model.
+    dataset : DenseDesignMatrix
+        The test set.
+    space : Space
+        The input space of the model.
+    batch_size : int
+        The size of the batches.
+
+    Returns
+    -------
+    accuracy : float
+        The fraction of correctly classified examples.
+    throughput : float
+        The number of examples predicted per second.
+    """
+    y = dataset.get_targets()
+    if y.ndim > 1 and y.shape[1] > 1:
+        y = y.argmax(axis=1)
+    y = y.ravel()
+    predictions = []
+    elapsed = 0.
+    for X in dataset.iterator(mode='sequential', batch_size=batch_size,
+                              data_specs=(space, 'features')):
+        t0 = time.time()
+        Y = model.fprop(X, copy=False)
+        elapsed += time.time() - t0
+        predictions.append(Y.argmax(axis=1))
+    predictions = np.concatenate(predictions)
+    return (predictions == y).mean(), predictions.size / elapsed
+
+
+def main(args):
+    """
+    Runs the comparison.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The command line arguments.
+    """
+    template, num_train = DATASETS[args.dataset]
+    test_yaml = args.test_yaml
+    if test_yaml is None:
+        test_yaml = template % ('test', 0, 10000)
+    calibration_yaml = args.calibration_yaml
+    if calibration_yaml is None:
+        calibration_yaml = template % ('train',
+                                       num_train - args.calibration_size,
+                                       num_train)
+
+    mlp = serial.load(args.model_filename)
+    space = mlp.get_input_space()
+    model = mlp_to_numpy(mlp)
+    calibration = yaml_parse.load(calibration_yaml)
+    quantized = quantize_numpy_mlp(
+        model, calibration.iterator(mode='sequential', batch_size=100,
+                                    data_specs=(space, 'features')),
+        num_examples=args.calibration_size)
+    if args.output is not None:
+        quantized.save(args.output)
+
+    test = yaml_parse.load(test_yaml)
+    print("Model, accuracy, examples/s, weight bytes")
+    for name, numpy_model in [('float', model), ('int8', quantized)]:
+        accuracy, throughput = evaluate(numpy_model, test, space,
+                                        args.batch_size)
+        weight_bytes = sum(layer.params['W'].nbytes
+                           for layer in numpy_model.layers
+                           if 'W' in layer.params)
+        print("%s: %.4f %.1f %d" % (name, accuracy, throughput,
+                                    weight_bytes))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = make_argument_parser()
+    main(parser.parse_args())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Script to serve the predictions of a pkl model file over TCP.
+
+Basic usage:
+
+.. code-block:: none
+
+    serve.py model.pkl --port 8000 --batch-sizes 1 8 32 128
+
+The model is loaded and compiled once, and concurrent requests are run
+together in micro-batches. See `pylearn2.deploy.server` for the protocol
+and for `PredictionClient`, and `load_test.py` to measure the latency
+and throughput of a running server.
+"""
+import argparse
+import logging
+
+from pylearn2.deploy.server import serve
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Serve the predictions of a pkl model file")
+    parser.add_argument('model_filename',
+                        help='Specifies the pkl model file')
+    parser.add_argument('--host', default='localhost',
+                        help='Host to listen on')
+    parser.add_argument('--port', '-p', type=int, default=8000,
+                        help='Port to listen on')
+    parser.add_argument('--batch-sizes', '-b', type=int, nargs='+',
+                        default=[1, 8, 32, 128], dest='batch_sizes',
+                        help='Batch sizes the model is compiled for')
+    parser.add_argument('--max-batch-size', type=int, default=None,
+                        dest='max_batch_size',
+                        help='Maximum number of examples run together '
+                             '(default: the largest batch size)')
+    parser.add_argument('--max-latency', type=float, default=5.,
+                        dest='max_latency',
+                        help='Maximum time, in milliseconds, a request '
+                             'waits for others to join its batch')
+    return parser
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = make_argument_parser()
+    args = parser.parse_args()
+    serve(args.model_filename, host=args.host, port=args.port,
+          batch_sizes=args.batch_sizes,
+          max_batch_size=args.max_batch_size,
+          max_latency=args.max_latency / 1000.)
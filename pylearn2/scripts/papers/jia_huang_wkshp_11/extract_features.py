@@ -27,6 +27,7 @@ from pylearn2.datasets.preprocessing import ExtractPatches, ExtractGridPatches,
 from pylearn2.utils import serial
 from pylearn2.utils.rng import make_np_rng
 from pylearn2.utils import contains_nan
+from pylearn2.utils.datasets import minibatch_map
 from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix, DefaultViewConverter
 from pylearn2.datasets.cifar10 import CIFAR10
 from pylearn2.datasets.cifar100 import CIFAR100
@@ -276,7 +277,7 @@ class FeatureExtractor:
         model = self.model
         size = self.size
 
-        nan = 0
+        nan = [0]
 
 
         dataset_descriptor = dataset_family[which_set][size]
@@ -340,7 +341,7 @@ class FeatureExtractor:
         else:
             assert False
 
-        def average_pool( stride ):
+        def average_pool( stride, topo_feat ):
             def point( p ):
                 return p * ns / stride
 
@@ -352,9 +353,6 @@ class FeatureExtractor:
 
             return rval
 
-        output =  np.zeros((num_examples,num_output_features),dtype='float32')
-
-
         fd = DenseDesignMatrix(X = np.zeros((1,1),dtype='float32'), view_converter = DefaultViewConverter([1, 1, nhid] ) )
 
         ns = 32 - size + 1
@@ -364,12 +362,13 @@ class FeatureExtractor:
             print(num_examples)
             print(batch_size)
 
-        for i in xrange(0,num_examples-batch_size+1,batch_size):
-            print(i)
+        assert batch_size == 1
+
+        def extract(batch):
             t1 = time.time()
 
             d = copy.copy(dataset)
-            d.set_design_matrix(full_X[i:i+batch_size,:])
+            d.set_design_matrix(batch)
 
             t2 = time.time()
 
@@ -389,7 +388,7 @@ class FeatureExtractor:
             feat_dataset = copy.copy(fd)
 
             if contains_nan(feat):
-                nan += np.isnan(feat).sum()
+                nan[0] += np.isnan(feat).sum()
                 feat[np.isnan(feat)] = 0
 
             feat_dataset.set_design_matrix(feat)
@@ -404,38 +403,45 @@ class FeatureExtractor:
             t5 = time.time()
 
             #average pooling
-            superpixels = average_pool(num_superpixels)
+            superpixels = average_pool(num_superpixels, topo_feat)
 
-            assert batch_size == 1
+            output = np.zeros((batch_size, num_output_features), dtype='float32')
 
             if self.pool_mode == 'mean':
                 for j in xrange(num_output_features):
-                    output[i:i+batch_size, j] = superpixels[:,top[j]:bottom[j]+1,
+                    output[:, j] = superpixels[:,top[j]:bottom[j]+1,
                             left[j]:right[j]+1, idxs[j]].mean()
             elif self.pool_mode == 'max':
                 for j in xrange(num_output_features):
-                    output[i:i+batch_size, j] = superpixels[:,top[j]:bottom[j]+1,
+                    output[:, j] = superpixels[:,top[j]:bottom[j]+1,
                             left[j]:right[j]+1, idxs[j]].max()
             else:
                 assert False
 
-            assert output[i:i+batch_size,:].max() < 1e20
+            assert output.max() < 1e20
 
             t6 = time.time()
 
             print((t6-t1, t2-t1, t3-t2, t4-t3, t5-t4, t6-t5))
 
+            return output
+
         if self.chunk_size is not None:
             assert save_path.endswith('.npy')
             save_path_pieces = save_path.split('.npy')
             assert len(save_path_pieces) == 2
             assert save_path_pieces[1] == ''
             save_path = save_path_pieces[0] + '_' + chr(ord('A')+self.chunk_id)+'.npy'
-        np.save(save_path,output)
+
+        # Writes the features to save_path as they are computed, and picks
+        # up where an interrupted run stopped
+        minibatch_map(extract, batch_size, full_X, save_path,
+                      output_width=num_output_features, dtype='float32',
+                      resume=True)
 
 
-        if nan > 0:
-            warnings.warn(str(nan)+' features were nan')
+        if nan[0] > 0:
+            warnings.warn(str(nan[0])+' features were nan')
 
 if __name__ == '__main__':
     assert len(sys.argv) == 2
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""
+Script to run a pkl model over a whole dataset and write its outputs.
+
+Basic usage:
+
+.. code-block:: none
+
+    predict.py model.pkl dataset.yaml predictions.npy
+    predict.py model.pkl test_set.pkl features.h5 --layers h0 h1
+
+The dataset is a YAML file, a YAML string or a pkl file. The outputs are
+written batch by batch to .npy (through a memmap), HDF5 (.h5 or .hdf5) or
+CSV files, chosen from the extension of the output file. See
+`pylearn2.deploy.predict.predict`.
+"""
+import argparse
+import logging
+import os
+
+from pylearn2.config import yaml_parse
+from pylearn2.deploy.predict import predict
+from pylearn2.utils import serial
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(
+        description="Run a pkl model over a dataset and write its outputs")
+    parser.add_argument('model_filename',
+                        help='Specifies the pkl model file')
+    parser.add_argument('dataset',
+                        help='YAML file, YAML string or pkl file of the '
+                             'dataset')
+    parser.add_argument('output_filename',
+                        help='Specifies the .npy, .h5, .hdf5 or .csv output '
+                             'file')
+    parser.add_argument('--batch-size', '-b', type=int, default=100,
+                        dest='batch_size',
+                        help='Number of examples per batch')
+    parser.add_argument('--layers', '-l', nargs='+', default=None,
+                        help="Names of the layers whose outputs are written, "
+                             "or 'all'")
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='Number of batches read ahead')
+    return parser
+
+
+def load_dataset(dataset):
+    """
+    Loads a dataset from a YAML file, a YAML string or a pkl file.
+
+    Parameters
+    ----------
+    dataset : str
+        The dataset description.
+
+    Returns
+    -------
+    dataset : Dataset
+        The dataset.
+    """
+    if os.path.isfile(dataset):
+        if dataset.endswith('.pkl'):
+            return serial.load(dataset)
+        return yaml_parse.load_path(dataset)
+    return yaml_parse.load(dataset)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = make_argument_parser()
+    args = parser.parse_args()
+    layers = args.layers
+    if layers == ['all']:
+        layers = 'all'
+    predict(args.model_filename, load_dataset(args.dataset),
+            args.output_filename, batch_size=args.batch_size, layers=layers,
+            prefetch=args.prefetch)
@@ -213,6 +213,8 @@ def _cast(arg, dtype):
         else:
             return arg
     elif scipy.sparse.issparse(arg):
+        if arg.dtype == dtype:
+            return arg
         return arg.astype(dtype)
     elif isinstance(arg, theano.tensor.TensorVariable):
         return theano.tensor.cast(arg, dtype)
@@ -0,0 +1,53 @@
+"""
+Tests for the exact partition functions of pylearn2.rbm_tools
+"""
+import itertools
+
+import numpy as np
+
+from pylearn2 import rbm_tools
+
+
+class _Shape(object):
+    """
+    Stands for an RBM in `compute_log_z`, which only needs its shape.
+    """
+
+    def __init__(self, nvis, nhid):
+        self.nvis = nvis
+        self.nhid = nhid
+
+
+def test_rbm_log_z():
+    """
+    Compares `rbm_log_z` and `compute_log_z` to a sum over all the
+    joint states.
+    """
+    rng = np.random.RandomState(0)
+    for nvis, nhid in [(7, 5), (4, 9)]:
+        W = rng.normal(size=(nvis, nhid))
+        b = rng.normal(size=nvis)
+        c = rng.normal(size=nhid)
+
+        v = np.array(list(itertools.product([0, 1], repeat=nvis)))
+        h = np.array(list(itertools.product([0, 1], repeat=nhid)))
+        minus_energy = (np.dot(np.dot(v, W), h.T) + np.dot(v, b)[:, None] +
+                        np.dot(h, c)[None, :])
+        m = minus_energy.max()
+        expected = np.log(np.exp(minus_energy - m).sum()) + m
+
+        for max_bits, n_jobs in [(15, 1), (2, 1), (2, 3)]:
+            log_z = rbm_tools.rbm_log_z([W, b, c], max_bits=max_bits,
+                                        n_jobs=n_jobs)
+            np.testing.assert_allclose(log_z, expected)
+
+        def free_energy_fn(states):
+            if nvis < nhid:
+                return -(np.dot(states, b) +
+                         np.logaddexp(0, np.dot(states, W) + c).sum(axis=1))
+            return -(np.dot(states, c) +
+                     np.logaddexp(0, np.dot(states, W.T) + b).sum(axis=1))
+
+        log_z = rbm_tools.compute_log_z(_Shape(nvis, nhid), free_energy_fn,
+                                        max_bits=3)
+        np.testing.assert_allclose(log_z, expected, rtol=1e-5)
@@ -0,0 +1,80 @@
+"""
+Tests for pylearn2.parallel_ais
+"""
+import itertools
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from pylearn2.parallel_ais import BinaryDBMAnnealing, ParallelAIS
+
+
+def _make_dbm(sizes, rng):
+    """
+    Returns random weights and biases of a binary DBM.
+    """
+    weights = [rng.normal(scale=.5, size=(n_in, n_out))
+               for n_in, n_out in zip(sizes[:-1], sizes[1:])]
+    biases = [rng.normal(scale=.5, size=n) for n in sizes]
+    return weights, biases
+
+
+def _exact_log_z(weights, biases):
+    """
+    Computes the log-partition function of a small binary DBM by
+    enumerating all of its states.
+    """
+    sizes = [b.shape[0] for b in biases]
+    states = np.array(list(itertools.product([0., 1.], repeat=sum(sizes))))
+    layers = np.split(states, np.cumsum(sizes)[:-1], axis=1)
+    minus_energy = sum(np.dot(layer, b) for layer, b in zip(layers, biases))
+    for W, below, above in zip(weights, layers[:-1], layers[1:]):
+        minus_energy += (np.dot(below, W) * above).sum(axis=1)
+    m = minus_energy.max()
+    return np.log(np.exp(minus_energy - m).sum()) + m
+
+
+def test_parallel_ais():
+    """
+    Compares the AIS estimates to the exact log-partition functions of a
+    small RBM and a small DBM, in parallel.
+    """
+    rng = np.random.RandomState(0)
+    betas = np.linspace(0, 1, 500)
+    for sizes in [(6, 4), (4, 3, 3)]:
+        weights, biases = _make_dbm(sizes, rng)
+        ais = ParallelAIS(BinaryDBMAnnealing(weights, biases), n_runs=200,
+                          betas=betas, n_jobs=2, checkpoint_period=200,
+                          seed=0)
+        log_z, std_err = ais.run()
+        assert len(ais.history) == 3
+        assert std_err < .05
+        assert abs(log_z - _exact_log_z(weights, biases)) < .1
+
+
+def test_parallel_ais_checkpoint():
+    """
+    Checks that an interrupted estimate resumes from its checkpoint and
+    gives the same log-weights as an uninterrupted one.
+    """
+    rng = np.random.RandomState(1)
+    weights, biases = _make_dbm((5, 3), rng)
+    annealing = BinaryDBMAnnealing(weights, biases)
+    betas = np.linspace(0, 1, 100)
+    kwargs = dict(n_runs=30, betas=betas, n_jobs=1, n_chunks=3,
+                  checkpoint_period=20, seed=0)
+    expected = ParallelAIS(annealing, **kwargs).run()
+
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, 'ais.pkl')
+        ais = ParallelAIS(annealing, checkpoint=path, **kwargs)
+        ais.run(n_steps=50)
+        assert ais.step == 50
+        ais = ParallelAIS(annealing, checkpoint=path, **kwargs)
+        assert ais.step == 50
+        np.testing.assert_allclose(ais.run(), expected)
+    finally:
+        shutil.rmtree(dirname)
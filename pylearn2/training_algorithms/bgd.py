@@ -80,7 +80,18 @@ class BGD(TrainingAlgorithm):
     reset_conjugate : bool, optional
         Passed through to the optimization.BatchGradientDescent's
         `reset_conjugate` parameter
-    line_search_mode : WRITEME
+    lbfgs_memory : int, optional
+        Passed through to the optimization.BatchGradientDescent's
+        `lbfgs_memory` parameter. If not None, the search direction is
+        picked with limited-memory BFGS instead of steepest descent.
+    reset_lbfgs : bool, optional
+        Passed through to the optimization.BatchGradientDescent's
+        `reset_lbfgs` parameter. Leave it False for full-batch training
+        so the curvature information is kept across epochs.
+    line_search_mode : str, optional
+        Passed through to the optimization.BatchGradientDescent's
+        `line_search_mode` parameter. Use 'vectorized' to evaluate all of
+        the candidate step sizes with a single pass over each batch.
     verbose_optimization : bool, optional
         WRITEME
     scale_step : float, optional
@@ -97,7 +108,8 @@ class BGD(TrainingAlgorithm):
                  reset_alpha=True, conjugate=False, min_init_alpha=.001,
                  reset_conjugate=True, line_search_mode=None,
                  verbose_optimization=False, scale_step=1.,
-                 theano_function_mode=None, init_alpha=None, seed=None):
+                 theano_function_mode=None, init_alpha=None, seed=None,
+                 lbfgs_memory=None, reset_lbfgs=False):
 
         self.__dict__.update(locals())
         del self.self
@@ -230,6 +242,8 @@ class BGD(TrainingAlgorithm):
             reset_alpha=self.reset_alpha,
             conjugate=self.conjugate,
             reset_conjugate=self.reset_conjugate,
+            lbfgs_memory=self.lbfgs_memory,
+            reset_lbfgs=self.reset_lbfgs,
             min_init_alpha=self.min_init_alpha,
             line_search_mode=self.line_search_mode,
             theano_function_mode=self.theano_function_mode,
@@ -256,6 +270,12 @@ class BGD(TrainingAlgorithm):
                 val=self.optimizer.ave_grad_mult,
                 data_specs=(NullSpace(), ''),
                 dataset=first_value(self.monitoring_dataset))
+            self.monitor.add_channel(
+                name='ave_line_search_evals',
+                ipt=None,
+                val=self.optimizer.ave_line_search_evals,
+                data_specs=(NullSpace(), ''),
+                dataset=first_value(self.monitoring_dataset))
 
         self.first = True
         self.bSetup = True
@@ -520,6 +540,9 @@ class BacktrackingStepShrinker(TrainExtension, TerminationCriterion):
             logger.info("Reloading saved params from last call")
             for p, v in safe_zip(model.get_params(), self.stored_values):
                 p.set_value(v)
+            # The L-BFGS history describes the region we just backed out
+            # of, so start over from steepest descent
+            algorithm.optimizer.clear_lbfgs_history()
             latest = self.prev
         elif latest <= self.prev and self.scale_up != 1.:
             logger.info("Looks like we're making progress "
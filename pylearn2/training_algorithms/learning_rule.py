@@ -78,6 +78,43 @@ class LearningRule():
         raise NotImplementedError(str(type(self)) + " does not implement "
                                   "get_updates.")
 
+    def get_row_updates(self, learning_rate, row_grads, lr_scalers=None):
+        """
+        Provides the updates of parameters whose gradients are nonzero on
+        a few rows only, such as embedding matrices.
+
+        Parameters
+        ----------
+        learning_rate : float
+            Learning rate coefficient.
+        row_grads : dict
+            A dictionary mapping from parameters to `(indices, grad_rows)`
+            pairs, `indices` being a vector of distinct row indices and
+            `grad_rows` the gradient on these rows. The gradient is zero
+            on all the other rows.
+        lr_scalers : dict
+            A dictionary mapping from the model's parameters to a learning
+            rate multiplier.
+
+        Returns
+        -------
+        updates : OrderdDict
+            A dictionary mapping from the old model parameters, to their new
+            values after a single iteration of the learning rule.
+
+        Notes
+        -----
+        This implementation builds the dense gradients and calls
+        `get_updates`, so it touches every row. Learning rules which can
+        only update the given rows (and the rows of their state) should
+        override it.
+        """
+        grads = OrderedDict()
+        for param, (indices, grad_rows) in six.iteritems(row_grads):
+            grads[param] = T.inc_subtensor(T.zeros_like(param)[indices],
+                                           grad_rows)
+        return self.get_updates(learning_rate, grads, lr_scalers)
+
 
 class Momentum(LearningRule):
     """
@@ -382,6 +419,38 @@ class AdaGrad(LearningRule):
 
         return updates
 
+    @wraps(LearningRule.get_row_updates)
+    def get_row_updates(self, learning_rate, row_grads, lr_scalers=None):
+        """
+        Only the given rows of the parameters and of their sums of
+        squared gradients are updated, which gives the same result as
+        `get_updates` since the other rows have a zero gradient.
+        """
+        updates = OrderedDict()
+        for param, (indices, grad_rows) in six.iteritems(row_grads):
+
+            sum_square_grad = sharedX(param.get_value() * 0.)
+
+            if param.name is not None:
+                sum_square_grad.name = 'sum_square_grad_' + param.name
+
+            # Accumulate gradient
+            new_sum_squared_grad = (
+                sum_square_grad[indices] + T.sqr(grad_rows)
+            )
+
+            # Compute update
+            epsilon = lr_scalers.get(param, 1.) * learning_rate
+            scale = T.maximum(self.eps, T.sqrt(new_sum_squared_grad))
+            delta_x_t = (-epsilon / scale * grad_rows)
+
+            # Apply update
+            updates[sum_square_grad] = T.set_subtensor(
+                sum_square_grad[indices], new_sum_squared_grad)
+            updates[param] = T.inc_subtensor(param[indices], delta_x_t)
+
+        return updates
+
 
 class RMSProp(LearningRule):
     """
@@ -508,3 +577,44 @@ class RMSProp(LearningRule):
             updates[param] = param + delta_x_t
 
         return updates
+
+    @wraps(LearningRule.get_row_updates, append=True)
+    def get_row_updates(self, learning_rate, row_grads, lr_scalers=None):
+        """
+        RMSProp updates only the given rows of the parameters and of their
+        moving averages of squared gradients. The parameter updates of the
+        other rows are zero anyway, but their moving averages are only
+        decayed the next time they get a gradient ("lazy" RMSProp), so the
+        result differs from `get_updates`.
+        """
+        updates = OrderedDict()
+        for param, (indices, grad_rows) in six.iteritems(row_grads):
+
+            mean_square_grad = sharedX(param.get_value() * 0.)
+
+            if param.name is None:
+                raise ValueError("Model parameters must be named.")
+            mean_square_grad.name = 'mean_square_grad_' + param.name
+
+            if param.name in self.mean_square_grads:
+                warnings.warn("Calling get_updates more than once on the "
+                              "gradients of `%s` may make monitored values "
+                              "incorrect." % param.name)
+            self.mean_square_grads[param.name] = mean_square_grad
+
+            # Accumulate gradient
+            new_mean_squared_grad = (self.decay * mean_square_grad[indices] +
+                                     (1 - self.decay) * T.sqr(grad_rows))
+
+            # Compute update
+            scaled_lr = lr_scalers.get(param, 1.) * learning_rate
+            rms_grad_t = T.sqrt(new_mean_squared_grad)
+            rms_grad_t = T.maximum(rms_grad_t, self.epsilon)
+            delta_x_t = - scaled_lr * grad_rows / rms_grad_t
+
+            # Apply update
+            updates[mean_square_grad] = T.set_subtensor(
+                mean_square_grad[indices], new_mean_squared_grad)
+            updates[param] = T.inc_subtensor(param[indices], delta_x_t)
+
+        return updates
@@ -18,7 +18,9 @@ import numpy as np
 from theano.compat import six
 from theano import config
 from theano import function
+from theano.gof.graph import inputs, io_toposort
 from theano.gof.op import get_debug_values
+import theano.tensor as T
 
 from pylearn2.compat import OrderedDict, first_key
 from pylearn2.monitor import Monitor
@@ -149,6 +151,15 @@ class SGD(TrainingAlgorithm):
     seed : valid argument to np.random.RandomState, optional
         The seed used for the random number generate to be passed to the
         training dataset iterator (if any)
+    sparse_updates : bool, optional
+        If True, the parameters which the cost only uses through row
+        lookups, like the embeddings of
+        `pylearn2.sandbox.nlp.models.mlp.ProjectionLayer`, only get the
+        rows indexed by the minibatch updated, with the
+        `get_row_updates` method of the learning rule. Their gradients
+        are taken from the expression of the cost, so this should not
+        be used with costs that override `get_gradients`. Defaults to
+        False.
     """
     def __init__(self, learning_rate, cost=None, batch_size=None,
                  monitoring_batch_size=None, monitoring_batches=None,
@@ -158,7 +169,7 @@ class SGD(TrainingAlgorithm):
                  learning_rule=None, set_batch_size=False,
                  train_iteration_mode=None, batches_per_iter=None,
                  theano_function_mode=None, monitoring_costs=None,
-                 seed=[2012, 10, 5]):
+                 seed=[2012, 10, 5], sparse_updates=False):
 
         if isinstance(cost, (list, tuple, set)):
             raise TypeError("SGD no longer supports using collections of " +
@@ -192,6 +203,7 @@ class SGD(TrainingAlgorithm):
         self.rng = make_np_rng(seed, which_method=["randn", "randint"])
         self.theano_function_mode = theano_function_mode
         self.monitoring_costs = monitoring_costs
+        self.sparse_updates = sparse_updates
 
     def _setup_monitor(self):
         """
@@ -361,14 +373,30 @@ class SGD(TrainingAlgorithm):
             lr = learning_rate.get_value() * lr_scalers.get(param, 1.)
             log.info('\t' + param_name + ': ' + str(lr))
 
+        row_grads = OrderedDict()
+        if getattr(self, 'sparse_updates', False):
+            row_grads = get_row_gradients(cost_value, params)
+            for param in row_grads:
+                log.info('\t' + param.name + ' is updated row by row')
+        dense_params = [param for param in params if param not in row_grads]
+        dense_grads = OrderedDict((param, grads[param])
+                                  for param in dense_params)
+
         if self.learning_rule:
             updates.update(self.learning_rule.get_updates(
-                learning_rate, grads, lr_scalers))
+                learning_rate, dense_grads, lr_scalers))
+            if row_grads:
+                updates.update(self.learning_rule.get_row_updates(
+                    learning_rate, row_grads, lr_scalers))
         else:
             # Use standard SGD updates with fixed learning rate.
-            updates.update(dict(safe_zip(params, [param - learning_rate *
-                           lr_scalers.get(param, 1.) * grads[param]
-                           for param in params])))
+            updates.update(dict(safe_zip(dense_params, [
+                param - learning_rate * lr_scalers.get(param, 1.) *
+                grads[param] for param in dense_params])))
+            for param, (indices, grad_rows) in six.iteritems(row_grads):
+                updates[param] = T.inc_subtensor(
+                    param[indices],
+                    -learning_rate * lr_scalers.get(param, 1.) * grad_rows)
 
         for param in params:
             if updates[param].name is None:
@@ -485,6 +513,51 @@ class SGD(TrainingAlgorithm):
             return self.termination_criterion.continue_learning(self.model)
 
 
+def get_row_gradients(cost, params):
+    """
+    Finds the parameters which a cost only uses through row lookups
+    (`param[indices]`), and returns their gradients on these rows.
+
+    Parameters
+    ----------
+    cost : theano scalar
+        The cost.
+    params : list
+        The shared variables to consider.
+
+    Returns
+    -------
+    row_grads : OrderedDict
+        A dictionary mapping from each parameter only used through row
+        lookups to an `(indices, grad_rows)` pair. `indices` are the
+        distinct looked-up rows and `grad_rows` the gradient of the cost
+        on these rows, those of the rows looked up more than once being
+        summed. The gradient on the other rows is zero.
+    """
+    nodes = io_toposort(inputs([cost]), [cost])
+    row_grads = OrderedDict()
+    for param in params:
+        clients = [node for node in nodes if param in node.inputs]
+        if not clients or not all(
+                isinstance(node.op, T.subtensor.AdvancedSubtensor1) and
+                node.inputs[0] is param for node in clients):
+            continue
+        rows = [node.outputs[0] for node in clients]
+        grad_rows = T.grad(cost, rows, disconnected_inputs='ignore')
+        indices = T.concatenate([T.cast(node.inputs[1], 'int64')
+                                 for node in clients])
+        grad_rows = T.concatenate(grad_rows)
+
+        # Sum the gradients of the rows looked up more than once
+        indices, position = T.extra_ops.Unique(return_inverse=True)(indices)
+        zeros = T.zeros([indices.shape[0]] +
+                        [param.shape[i] for i in range(1, param.ndim)],
+                        dtype=param.dtype)
+        row_grads[param] = (indices,
+                            T.inc_subtensor(zeros[position], grad_rows))
+    return row_grads
+
+
 class MonitorBasedLRAdjuster(TrainExtension):
     """
     A TrainExtension that uses the on_monitor callback to adjust
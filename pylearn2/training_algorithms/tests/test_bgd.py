@@ -111,6 +111,50 @@ def test_bgd_unsup():
 
     train.main_loop()
 
+def test_bgd_lbfgs():
+
+    # tests that we can run the bgd algorithm with L-BFGS
+    # search directions on a full-batch objective, keeping
+    # the L-BFGS history across epochs
+
+    dim = 3
+    m = 10
+
+    rng = np.random.RandomState([25, 9, 2012])
+
+    X = rng.randn(m, dim)
+
+    dataset = DenseDesignMatrix(X=X)
+
+    model = SoftmaxModel(dim)
+
+    class DummyCost(Cost):
+
+        def expr(self, model, data):
+            self.get_data_specs(model)[0].validate(data)
+            X = data
+            return T.square(model(X) - X).mean()
+
+        def get_data_specs(self, model):
+            return (model.get_input_space(), model.get_input_source())
+
+    cost = DummyCost()
+
+    termination_criterion = EpochCounter(5)
+
+    algorithm = BGD(cost, batch_size=m, updates_per_batch=3,
+                    lbfgs_memory=4, reset_lbfgs=False,
+                    monitoring_dataset=dataset,
+                    termination_criterion=termination_criterion)
+
+    train = Train(dataset, model, algorithm, save_path=None,
+                  save_freq=0, extensions=None)
+
+    train.main_loop()
+
+    assert algorithm.optimizer._lbfgs.count > 0
+
+
 def test_determinism():
 
     """
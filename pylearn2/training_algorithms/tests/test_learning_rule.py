@@ -1,17 +1,21 @@
 import numpy as np
 
+import theano
+from theano import tensor as T
 from theano.compat.six.moves import zip as izip
 
+from pylearn2.compat import OrderedDict
 from pylearn2.costs.cost import SumOfCosts
 from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
 from pylearn2.testing.cost import SumOfOneHalfParamsSquared
 from pylearn2.testing.cost import SumOfParams
 from pylearn2.testing.datasets import ArangeDataset
-from pylearn2.training_algorithms.sgd import SGD
+from pylearn2.training_algorithms.sgd import SGD, get_row_gradients
 from pylearn2.training_algorithms.learning_rule import Momentum
 from pylearn2.training_algorithms.learning_rule import AdaDelta
 from pylearn2.training_algorithms.learning_rule import AdaGrad
 from pylearn2.training_algorithms.learning_rule import RMSProp
+from pylearn2.utils import sharedX
 
 from test_sgd import DummyCost, DummyModel
 
@@ -334,3 +338,37 @@ def test_rmsprop():
     assert all(np.allclose(manual_param, sgd_param.get_value())
                for manual_param, sgd_param
                in izip(manual, model.get_params()))
+
+
+def test_row_updates():
+    """
+    Make sure that the row-sparse updates of an embedding matrix give the
+    same parameter values as the dense updates, for learning rules which
+    implement them and for the dense fallback.
+    """
+    rng = np.random.RandomState(0)
+    indices = T.lvector()
+    batch = np.array([3, 1, 3, 7])
+
+    for rule in [Momentum(.5), AdaGrad(), RMSProp()]:
+        value = rng.randn(10, 3)
+        W_dense = sharedX(value, name='W_dense')
+        W_rows = sharedX(value, name='W_rows')
+        costs = [T.sqr(W[indices]).sum() + W[indices[:2]].sum()
+                 for W in [W_dense, W_rows]]
+
+        row_grads = get_row_gradients(costs[1], [W_rows])
+        assert list(row_grads) == [W_rows]
+        updates = rule.get_updates(
+            learning_rate, OrderedDict([(W_dense, T.grad(costs[0], W_dense))]),
+            {})
+        updates.update(rule.get_row_updates(learning_rate, row_grads, {}))
+        f = theano.function([indices], updates=updates)
+        for i in range(3):
+            f(batch)
+        assert np.allclose(W_dense.get_value(), W_rows.get_value())
+        assert not np.allclose(W_rows.get_value(), value)
+
+    # A parameter used as a whole doesn't get row-sparse updates
+    assert not get_row_gradients(T.sqr(W_rows).sum() +
+                                 W_rows[indices].sum(), [W_rows])
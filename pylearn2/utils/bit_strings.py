@@ -7,7 +7,6 @@ __email__ = "wardefar@iro"
 __maintainer__ = "David Warde-Farley"
 
 import numpy as np
-from theano.compat.six.moves import xrange
 
 
 def all_bit_strings(bits, dtype='uint8'):
@@ -33,5 +32,33 @@ def all_bit_strings(bits, dtype='uint8'):
     Obviously the memory requirements of this are exponential in the first
     argument, so use with caution.
     """
-    return np.array([[int(x) for x in np.binary_repr(i, width=bits)]
-                     for i in xrange(0, 2 ** bits)], dtype=dtype)
+    return bit_strings_range(bits, 0, 2 ** bits, dtype=dtype)
+
+
+def bit_strings_range(bits, start, stop, dtype='uint8'):
+    """
+    Create a matrix of the binary strings of the numbers in a range.
+
+    Parameters
+    ----------
+    bits : int
+        The width of the binary strings.
+
+    start : int
+        The first number.
+
+    stop : int
+        The number after the last one.
+
+    dtype : str or dtype object
+        The dtype of the returned array.
+
+    Returns
+    -------
+    bit_strings : ndarray, shape (stop - start, bits)
+        The numbers from `start` to `stop - 1` as binary numbers, most
+        significant bit first.
+    """
+    numbers = np.arange(start, stop, dtype='int64')
+    shifts = np.arange(bits - 1, -1, -1, dtype='int64')
+    return ((numbers[:, np.newaxis] >> shifts) & 1).astype(dtype)
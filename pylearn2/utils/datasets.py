@@ -3,16 +3,20 @@ Several utilities to evaluate an ALC on the dataset, to iterate over
 minibatches from a dataset, or to merge three data with given proportions
 """
 # Standard library imports
+import collections
 import logging
+import multiprocessing
 import os
 import functools
 from itertools import repeat
+import time
 import warnings
 
 # Third-party imports
 import numpy
 import scipy
-from theano.compat.six.moves import reduce, xrange
+from theano.compat.six import string_types
+from theano.compat.six.moves import reduce, xrange, zip as izip
 import theano
 try:
     from matplotlib import pyplot
@@ -21,6 +25,7 @@ except ImportError:
     warnings.warn("Could not import some dependencies.")
 
 # Local imports
+from pylearn2.utils.iteration import Prefetcher
 from pylearn2.utils.rng import make_np_rng
 
 
@@ -259,44 +264,235 @@ class BatchIterator(object):
 ##################################################
 
 
+# The function mapped by the worker processes of minibatch_map, set once
+# by _init_map_worker so that it isn't pickled with every batch.
+_worker_fn = None
+
+
+def _init_map_worker(fn):
+    """
+    Stores the function mapped by minibatch_map in a worker process.
+    """
+    global _worker_fn
+    _worker_fn = fn
+
+
+def _map_in_worker(batch):
+    """
+    Applies the function of the worker process to a batch.
+    """
+    return _worker_fn(batch)
+
+
+def _pool_imap(pool, batches, max_pending):
+    """
+    Maps the function of the worker processes over batches, in order,
+    without reading more than `max_pending` batches ahead.
+    """
+    pending = collections.deque()
+    for batch in batches:
+        pending.append(pool.apply_async(_map_in_worker, (batch,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _open_output_file(path, shape, dtype, resume):
+    """
+    Opens the .npy or HDF5 file minibatch_map writes to.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    shape : tuple
+        The shape of the output.
+    dtype : str
+        The dtype of the output.
+    resume : bool
+        Whether to continue the output recorded in the progress file.
+
+    Returns
+    -------
+    output_data : numpy.memmap or h5py.Dataset
+        The output.
+    h5file : h5py.File or None
+        The HDF5 file, if the format is HDF5.
+    start : int
+        The number of examples already computed.
+    """
+    start = 0
+    progress_path = path + '.progress'
+    if resume and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            start = int(f.read())
+
+    h5file = None
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.h5', '.hdf5'):
+        import h5py
+        if start > 0:
+            h5file = h5py.File(path, 'r+')
+            output_data = h5file['output']
+        else:
+            h5file = h5py.File(path, 'w')
+            output_data = h5file.create_dataset('output', shape=shape,
+                                                dtype=dtype)
+    elif ext == '.npy':
+        if start > 0:
+            output_data = numpy.load(path, mmap_mode='r+')
+        else:
+            output_data = numpy.lib.format.open_memmap(
+                path, mode='w+', dtype=dtype, shape=shape)
+    else:
+        raise ValueError("Unknown output format %s, expected .npy, .h5 or "
+                         ".hdf5." % ext)
+
+    if tuple(output_data.shape) != shape or output_data.dtype != dtype:
+        if h5file is not None:
+            h5file.close()
+        raise ValueError("Cannot resume %s: it holds an output of shape %s "
+                         "and dtype %s, but the output has shape %s and "
+                         "dtype %s." % (path, output_data.shape,
+                                        output_data.dtype, shape, dtype))
+    if start > 0:
+        logger.info("Resuming %s from example %d", path, start)
+    return output_data, h5file, start
+
+
+def _save_progress(path, output_data, h5file, done):
+    """
+    Flushes the output file, then records how many examples it holds.
+    """
+    if h5file is not None:
+        h5file.flush()
+    else:
+        output_data.flush()
+    progress_path = path + '.progress'
+    with open(progress_path + '.tmp', 'w') as f:
+        f.write(str(done))
+    os.rename(progress_path + '.tmp', progress_path)
+
+
 def minibatch_map(fn, batch_size, input_data, output_data=None,
-                  output_width=None):
+                  output_width=None, dtype=None, prefetch=0, n_jobs=1,
+                  resume=False, flush_period=60.):
     """
     Apply a function on input_data, one minibatch at a time.
 
     Storage for the output can be provided. If it is the case,
-    it should have appropriate size.
+    it should have appropriate size. It can also be the path of a .npy
+    or HDF5 file, which is then written through a memmap (or in the
+    'output' dataset of the HDF5 file) as the minibatches are computed.
+    When writing to a file, the number of examples written is recorded
+    in a `.progress` file next to it, which lets an interrupted run
+    resume where it stopped.
 
-    If output_data is not provided, then output_width should be specified.
+    If output_data is not provided, or is a path, then output_width
+    should be specified.
 
     Parameters
     ----------
-    fn : WRITEME
-    batch_size : WRITEME
-    input_data : WRITEME
-    output_data : WRITEME
-    output_width : WRITEME
+    fn : callable
+        The function, which maps a minibatch of input_data to a minibatch
+        of outputs.
+    batch_size : int
+        The number of examples per minibatch.
+    input_data : array_like
+        The inputs, with the examples on the first axis. It can be any
+        object that supports slicing, such as a memmap or an HDF5
+        dataset.
+    output_data : array_like or str, optional
+        The storage for the output, or the path of the .npy, .h5 or .hdf5
+        file to write it to.
+    output_width : int, optional
+        The number of outputs per example, if output_data is not given as
+        an array.
+    dtype : str, optional
+        The dtype of the output, if output_data is not given as an array.
+        Defaults to float64.
+    prefetch : int, optional
+        The number of input minibatches read ahead in a background
+        thread, which is useful when input_data is read from disk. 0
+        disables prefetching.
+    n_jobs : int, optional
+        The number of processes fn is applied in. fn must then be
+        picklable, and should only use NumPy: compiled Theano functions
+        should be run with n_jobs=1.
+    resume : bool, optional
+        If output_data is a path, continue the output recorded in its
+        progress file instead of starting over. fn must be deterministic
+        for the output to be consistent.
+    flush_period : float, optional
+        If output_data is a path, the time in seconds between two
+        flushes of the file to disk, which also record the progress.
 
     Returns
     -------
-    WRITEME
+    output_data : array_like or str
+        The output, or its path if output_data is a path.
     """
 
-    if output_width is None:
-        if output_data is None:
-            raise ValueError('output_data or output_width should be provided')
-
-        output_width = output_data.shape[1]
-
     output_length = input_data.shape[0]
-    if output_data is None:
-        output_data = numpy.empty((output_length, output_width))
+    path = None
+    h5file = None
+    start = 0
+    if isinstance(output_data, string_types):
+        if output_width is None:
+            raise ValueError('output_width should be provided when writing '
+                             'to a file')
+        path = output_data
+        output_data, h5file, start = _open_output_file(
+            path, (output_length, output_width),
+            numpy.dtype(dtype or 'float64'), resume)
     else:
-        assert output_data.shape[0] == input_data.shape[0], ('output_data '
-                'should have the same length as input_data',
-                output_data.shape[0], input_data.shape[0])
+        if output_width is None:
+            if output_data is None:
+                raise ValueError('output_data or output_width should be '
+                                 'provided')
 
-    for i in xrange(0, output_length, batch_size):
-        output_data[i:i+batch_size] = fn(input_data[i:i+batch_size])
+            output_width = output_data.shape[1]
 
+        if output_data is None:
+            output_data = numpy.empty((output_length, output_width),
+                                      dtype=dtype or 'float64')
+        else:
+            assert output_data.shape[0] == input_data.shape[0], (
+                'output_data should have the same length as input_data',
+                output_data.shape[0], input_data.shape[0])
+
+    starts = xrange(start, output_length, batch_size)
+    batches = (input_data[i:i + batch_size] for i in starts)
+    if prefetch > 0:
+        batches = Prefetcher(batches, prefetch)
+    pool = None
+    if n_jobs > 1:
+        pool = multiprocessing.Pool(n_jobs, _init_map_worker, (fn,))
+        results = _pool_imap(pool, batches, 2 * n_jobs)
+    else:
+        results = (fn(batch) for batch in batches)
+
+    done = start
+    last_flush = time.time()
+    try:
+        for i, result in izip(starts, results):
+            output_data[i:i + batch_size] = result
+            done = min(i + batch_size, output_length)
+            if path is not None and time.time() - last_flush >= flush_period:
+                _save_progress(path, output_data, h5file, done)
+                last_flush = time.time()
+                logger.info("minibatch_map: %d/%d examples written to %s",
+                            done, output_length, path)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if path is not None:
+            _save_progress(path, output_data, h5file, done)
+            if h5file is not None:
+                h5file.close()
+
+    if path is not None:
+        return path
     return output_data
@@ -14,9 +14,18 @@ Presets:
 - random_uniform: on each call to next, returns a random subset of the
   dataset. Samples with replacement, but still reports that
   container is empty after num_examples / batch_size calls
+- even_sequences: on each call to next, returns a random subset of
+  sequences which all have the same length
+- bucketed_sequences: on each call to next, returns a random subset of
+  sequences of similar lengths, drawn from buckets of sorted lengths
+- truncated_bptt: splits the dataset into batch_size contiguous streams
+  and returns their successive examples, for truncated backpropagation
+  through time
 """
 from __future__ import division
 
+import sys
+import threading
 import warnings
 import numpy as np
 from theano.compat import six
@@ -764,6 +773,215 @@ class EvenSequencesSubsetIterator(SubsetIterator):
     uniform_batch_size = False
 
 
+class BucketedSequencesSubsetIterator(SubsetIterator):
+    """
+    An iterator for datasets with sequential data which returns lists of
+    indices of sequences of similar lengths, so that little computation
+    is spent on padding.
+
+    The lengths are sorted once. The sorted examples are then grouped
+    into buckets of consecutive lengths holding at least
+    `batch_size * batches_per_bucket` examples each, sequences of the
+    same length always falling in the same bucket. Every epoch the
+    examples are shuffled within their bucket, each bucket is cut into
+    minibatches (the last one of a bucket may be smaller) and the order
+    of all the minibatches is shuffled.
+
+    Notes
+    -----
+    Returns arrays of indices (`fancy = True`).
+
+    Parameters
+    ----------
+    sequence_data : list of lists or ndarray of objects (ndarrays)
+        The sequential data whose lengths determine the buckets.
+    batch_size : int
+        The maximum number of sequences in a minibatch.
+    num_batches : None
+        Not supported, the number of batches is determined by the
+        buckets.
+    rng : int or `numpy.random.RandomState`, optional
+        The random number generator, or its seed.
+    batches_per_bucket : int, optional
+        The minimum size of a bucket, in minibatches. Larger buckets mix
+        the examples more between epochs but pad more.
+
+    See :py:class:`SubsetIterator` for detailed constructor parameter
+    and attribute documentation.
+    """
+
+    def __init__(self, sequence_data, batch_size, num_batches=None, rng=None,
+                 batches_per_bucket=1):
+        self._rng = make_np_rng(rng, which_method=["uniform",
+                                                   "permutation"])
+
+        if batch_size is None:
+            raise ValueError("batch_size cannot be None for bucketed "
+                             "iteration")
+        if num_batches is not None:
+            raise ValueError("BucketedSequencesSubsetIterator doesn't "
+                             "support a fixed number of batches")
+        if not isinstance(sequence_data, (list, np.ndarray)):
+            raise ValueError("sequence_data must be of type list or"
+                             " ndarray")
+        self._sequence_data = sequence_data
+        self._batch_size = batch_size
+        self._bucket_size = batch_size * batches_per_bucket
+        self.prepare()
+        self.reset()
+
+    def prepare(self):
+        """
+        Sorts the sequences by length and forms the buckets and the
+        minibatch boundaries, which are the same for every epoch.
+        """
+        data = self._sequence_data
+        if isinstance(data, np.ndarray) and data.dtype != object:
+            self.lengths = np.empty(data.shape[0], dtype='int64')
+            self.lengths[:] = data.shape[1] if data.ndim > 1 else 1
+        else:
+            self.lengths = np.fromiter((len(s) for s in data),
+                                       dtype='int64', count=len(data))
+        self._dataset_size = len(self.lengths)
+        self._sorted = np.argsort(self.lengths, kind='mergesort')
+
+        # Greedily merge runs of equal lengths into buckets
+        _, inverse = np.unique(self.lengths, return_inverse=True)
+        counts = np.bincount(inverse)
+        bucket_ids = np.empty(len(counts), dtype='int64')
+        bucket, size = 0, 0
+        for i, count in enumerate(counts):
+            if size >= self._bucket_size:
+                bucket, size = bucket + 1, 0
+            bucket_ids[i] = bucket
+            size += count
+        self._bucket_ids = np.repeat(bucket_ids, counts)
+        bucket_ends = np.cumsum(np.bincount(self._bucket_ids))
+        bucket_starts = bucket_ends - np.bincount(self._bucket_ids)
+
+        # The minibatches are slices of the epoch order
+        starts = [np.arange(start, end, self._batch_size)
+                  for start, end in zip(bucket_starts, bucket_ends)]
+        self._batch_starts = np.concatenate(starts)
+        self._batch_stops = np.minimum(self._batch_starts + self._batch_size,
+                                       np.repeat(bucket_ends,
+                                                 [len(s) for s in starts]))
+        self._num_batches = len(self._batch_starts)
+        self.num_buckets = len(bucket_ends)
+
+    def reset(self):
+        """
+        Shuffles the examples within their buckets and the order of the
+        minibatches, and computes the padding efficiency of the epoch.
+        """
+        noise = self._rng.uniform(size=self._dataset_size)
+        self._order = self._sorted[np.lexsort((noise, self._bucket_ids))]
+        self._batch_order = self._rng.permutation(self._num_batches)
+        self._next_batch_no = 0
+
+        lengths = self.lengths[self._order]
+        max_lengths = np.maximum.reduceat(lengths, self._batch_starts)
+        padded = (max_lengths * (self._batch_stops -
+                                 self._batch_starts)).sum()
+        self.padding_efficiency = lengths.sum() / float(max(padded, 1))
+
+    @wraps(SubsetIterator.next)
+    def next(self):
+        if self._next_batch_no >= self._num_batches:
+            self.reset()
+            raise StopIteration()
+        batch = self._batch_order[self._next_batch_no]
+        self._next_batch_no += 1
+        return self._order[self._batch_starts[batch]:
+                           self._batch_stops[batch]]
+
+    def __next__(self):
+        return self.next()
+
+    @property
+    @wraps(SubsetIterator.num_examples, assigned=(), updated=())
+    def num_examples(self):
+        return self._dataset_size
+
+    fancy = True
+    stochastic = True
+    uniform_batch_size = False
+
+
+class TruncatedBPTTSubsetIterator(SubsetIterator):
+    """
+    Splits a dataset of consecutive chunks of a long sequence into
+    `batch_size` contiguous streams, and returns minibatches in which
+    each example is the chunk that follows the same example of the
+    previous minibatch.
+
+    The i-th example of the k-th minibatch is chunk
+    `i * num_chunks + k`, where `num_chunks = dataset_size // batch_size`
+    is the length of each stream, so a stateful recurrent layer can
+    carry its hidden state from one minibatch to the next and be trained
+    with truncated backpropagation through time, the chunk length
+    bounding the memory used.
+
+    Parameters
+    ----------
+    dataset_size : int
+        The number of chunks in the dataset, in the order of the
+        sequence.
+    batch_size : int
+        The number of parallel streams.
+    num_batches : int, optional
+        The number of minibatches to return, at most (and by default)
+        the number of chunks per stream.
+    rng : `np.random.RandomState` or seed, optional
+        Ignored, the iteration is deterministic.
+
+    Notes
+    -----
+    The last `dataset_size % batch_size` chunks are not used.
+    """
+    def __init__(self, dataset_size, batch_size, num_batches=None,
+                 rng=None):
+        if batch_size is None:
+            raise ValueError("batch_size (the number of streams) is "
+                             "required for truncated BPTT iteration")
+        num_chunks = dataset_size // batch_size
+        if num_chunks == 0:
+            raise ValueError("dataset of %d chunks cannot be split into %d "
+                             "streams" % (dataset_size, batch_size))
+        if num_batches is None:
+            num_batches = num_chunks
+        elif num_batches > num_chunks:
+            raise ValueError("dataset of %d chunks can only provide %d "
+                             "batches with batch_size %d, but %d batches "
+                             "were requested" % (dataset_size, num_chunks,
+                                                 batch_size, num_batches))
+        self._dataset_size = dataset_size
+        self._batch_size = batch_size
+        self._num_batches = num_batches
+        self._stream_starts = np.arange(batch_size) * num_chunks
+        self._next_batch_no = 0
+
+    @wraps(SubsetIterator.next)
+    def next(self):
+        if self._next_batch_no >= self._num_batches:
+            raise StopIteration()
+        rval = self._stream_starts + self._next_batch_no
+        self._next_batch_no += 1
+        return rval
+
+    def __next__(self):
+        return self.next()
+
+    @property
+    @wraps(SubsetIterator.uneven, assigned=(), updated=())
+    def uneven(self):
+        return False
+
+    fancy = True
+    stochastic = False
+    uniform_batch_size = True
+
+
 _iteration_schemes = {
     'sequential': SequentialSubsetIterator,
     'shuffled_sequential': ShuffledSequentialSubsetIterator,
@@ -775,6 +993,8 @@ _iteration_schemes = {
     'even_batchwise_shuffled_sequential':
     as_even(BatchwiseShuffledSequentialIterator),
     'even_sequences': EvenSequencesSubsetIterator,
+    'bucketed_sequences': BucketedSequencesSubsetIterator,
+    'truncated_bptt': TruncatedBPTTSubsetIterator,
 }
 
 
@@ -1029,3 +1249,48 @@ class FiniteDatasetIterator(object):
     @wraps(SubsetIterator.stochastic, assigned=(), updated=())
     def stochastic(self):
         return self._subset_iterator.stochastic
+
+
+class Prefetcher(object):
+    """
+    Reads the batches of an iterator in a background thread, so that
+    reading the next batches overlaps with processing the current one.
+
+    Exceptions raised by the iterator are re-raised when the batch they
+    replace is reached.
+
+    Parameters
+    ----------
+    iterator : iterable
+        The batches.
+    size : int
+        The maximum number of batches read ahead.
+    """
+
+    def __init__(self, iterator, size):
+        self._queue = six.moves.queue.Queue(maxsize=size)
+        self._thread = threading.Thread(target=self._run, args=(iterator,),
+                                        name='prefetcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, iterator):
+        """
+        Puts the batches in the queue, followed by None.
+        """
+        try:
+            for batch in iterator:
+                self._queue.put((batch, None))
+        except Exception:
+            self._queue.put((None, sys.exc_info()))
+            return
+        self._queue.put((None, None))
+
+    def __iter__(self):
+        while True:
+            batch, exc_info = self._queue.get()
+            if exc_info is not None:
+                six.reraise(*exc_info)
+            if batch is None:
+                return
+            yield batch
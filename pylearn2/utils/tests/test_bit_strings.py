@@ -1,7 +1,12 @@
-from pylearn2.utils.bit_strings import all_bit_strings
+from pylearn2.utils.bit_strings import all_bit_strings, bit_strings_range
 import numpy as np
 
 def test_bit_strings():
     np.testing.assert_equal((all_bit_strings(3) *
                              (2 ** np.arange(2, -1, -1))).sum(axis=1),
                             np.arange(2 ** 3))
+
+
+def test_bit_strings_range():
+    np.testing.assert_equal(bit_strings_range(5, 7, 19),
+                            all_bit_strings(5)[7:19])
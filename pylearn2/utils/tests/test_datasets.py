@@ -0,0 +1,88 @@
+"""
+Tests for pylearn2.utils.datasets
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from pylearn2.utils.datasets import minibatch_map
+
+
+def _features(X):
+    """
+    A picklable feature extractor.
+    """
+    return np.tanh(X[:, :3] * 2.)
+
+
+class _Interrupted(Exception):
+    """
+    Raised to interrupt minibatch_map.
+    """
+
+
+def _interrupted_features(X):
+    """
+    A feature extractor that fails on the examples whose first input is
+    large.
+    """
+    if (X[:, 0] > 1.5).any():
+        raise _Interrupted()
+    return _features(X)
+
+
+def test_minibatch_map():
+    """
+    Checks minibatch_map in memory, with prefetching, and writing to a
+    file from several processes.
+    """
+    X = np.random.RandomState(0).normal(size=(53, 5))
+    expected = _features(X)
+
+    output = minibatch_map(_features, 10, X, output_width=3)
+    assert output.dtype == 'float64'
+    np.testing.assert_allclose(output, expected)
+
+    output = minibatch_map(_features, 7, X, output_width=3,
+                           dtype='float32', prefetch=2)
+    assert output.dtype == 'float32'
+    np.testing.assert_allclose(output, expected, rtol=1e-6)
+
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, 'features.npy')
+        assert minibatch_map(_features, 4, X, path, output_width=3,
+                             dtype='float32', prefetch=1, n_jobs=2) == path
+        np.testing.assert_allclose(np.load(path), expected, rtol=1e-6)
+    finally:
+        shutil.rmtree(dirname)
+
+
+def test_minibatch_map_resume():
+    """
+    Checks that an interrupted minibatch_map resumes where it stopped.
+    """
+    X = np.random.RandomState(1).normal(size=(40, 5))
+    X[:, 0] = np.clip(X[:, 0], -1., 1.)
+    X[25, 0] = 2.
+    dirname = tempfile.mkdtemp()
+    try:
+        path = os.path.join(dirname, 'features.npy')
+        try:
+            minibatch_map(_interrupted_features, 4, X, path, output_width=3)
+        except _Interrupted:
+            pass
+        else:
+            assert False
+        with open(path + '.progress') as f:
+            assert int(f.read()) == 24
+
+        X[25, 0] = 0.
+        expected = _features(X)
+        X[:24] = np.nan
+        minibatch_map(_features, 4, X, path, output_width=3, resume=True)
+        np.testing.assert_allclose(np.load(path), expected)
+    finally:
+        shutil.rmtree(dirname)
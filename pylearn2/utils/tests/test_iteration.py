@@ -15,6 +15,8 @@ from pylearn2.utils.iteration import (
     BatchwiseShuffledSequentialIterator,
     as_even,
     EvenSequencesSubsetIterator,
+    BucketedSequencesSubsetIterator,
+    TruncatedBPTTSubsetIterator,
 )
 
 
@@ -252,3 +254,50 @@ def test_determinism_even_sequences():
         for i in ind_list:
             visited2[i] = b_ind
     assert np.all(np.asarray(visited1) == np.asarray(visited2))
+
+
+def test_bucketed_sequences():
+    """
+    Check that BucketedSequencesSubsetIterator visits every entry once per
+    epoch, in batches of similar lengths that pad less than shuffled
+    batches.
+    """
+    rng = np.random.RandomState(123)
+    lengths = rng.randint(1, 50, 1000)
+    data = [['w'] * l for l in lengths]
+    batch_size = 10
+    my_iter = BucketedSequencesSubsetIterator(data, batch_size, rng=0,
+                                              batches_per_bucket=2)
+    efficiency = my_iter.padding_efficiency
+    for epoch in range(2):
+        visited = np.zeros(len(data), dtype='int64')
+        padded = 0
+        for b_ind, ind_list in enumerate(my_iter):
+            assert 0 < len(ind_list) <= batch_size
+            padded += lengths[ind_list].max() * len(ind_list)
+            visited[ind_list] += 1
+        assert b_ind + 1 == my_iter.num_batches
+        assert np.all(visited == 1)
+        assert np.allclose(efficiency, lengths.sum() / float(padded))
+        efficiency = my_iter.padding_efficiency
+
+    shuffled = lengths[rng.permutation(len(lengths))].reshape(-1,
+                                                              batch_size)
+    assert efficiency > 0.9
+    assert efficiency > 1.5 * shuffled.sum() / float(
+        shuffled.max(axis=1).sum() * batch_size)
+
+
+def test_truncated_bptt():
+    """
+    Check that TruncatedBPTTSubsetIterator returns contiguous streams,
+    each example following the same example of the previous batch.
+    """
+    my_iter = TruncatedBPTTSubsetIterator(23, 4, rng=0)
+    batches = np.array(list(my_iter))
+    assert batches.shape == (5, 4)
+    assert my_iter.num_batches == 5
+    assert np.all(batches.T.ravel() == np.arange(20))
+    assert len(list(TruncatedBPTTSubsetIterator(23, 4, 2))) == 2
+    assert_raises(ValueError, TruncatedBPTTSubsetIterator, 23, 4, 6)
+    assert_raises(ValueError, TruncatedBPTTSubsetIterator, 3, 4)